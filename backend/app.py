@@ -2,13 +2,16 @@
 RAG Service - Main Application
 FastAPI service for ticket resolution suggestions using Retrieval-Augmented Generation.
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 import os
+import json
+import time
+import asyncio
 from dotenv import load_dotenv
 import logging
 # Load environment variables
@@ -16,6 +19,9 @@ load_dotenv()
 # Import RAG engine and metrics
 from rag_engine_tfidf import RAGEngine
 from metrics import metrics_tracker
+from openmetrics import CONTENT_TYPE as OPENMETRICS_CONTENT_TYPE
+from openmetrics import MetricSet, create_registry_from_env
+from metrics_history import create_metrics_history_from_env
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -33,13 +39,64 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
-# Initialize RAG engine
+# Initialize RAG engine. The knowledge base loads in the background after
+# startup, so the server binds its port at once and answers 503 until ready
 try:
-    rag_engine = RAGEngine()
-    logger.info("RAG Engine initialized successfully")
+    rag_engine = RAGEngine(lazy=True)
+    logger.info("RAG Engine initialized, knowledge base warming")
 except Exception as e:
     logger.error(f"Failed to initialize RAG engine: {e}")
     rag_engine = None
+# Seconds clients are told to wait (Retry-After) while the knowledge base loads
+WARMING_RETRY_AFTER = int(os.getenv("WARMING_RETRY_AFTER_SECONDS", "5"))
+# With several workers, each publishes its metrics to METRICS_MULTIPROC_DIR
+# every METRICS_PUBLISH_SECONDS and /metrics serves the merged view
+metrics_registry = create_registry_from_env()
+METRICS_PUBLISH_SECONDS = float(os.getenv("METRICS_PUBLISH_SECONDS", "5"))
+# Persistent metrics history shared by all workers (None unless METRICS_HISTORY_PATH is set)
+metrics_history = create_metrics_history_from_env()
+def _worker_metrics() -> MetricSet:
+    """This worker's counters, histograms and gauges."""
+    metric_set = metrics_tracker.to_metric_set()
+    if rag_engine:
+        rag_engine.add_metric_gauges(metric_set)
+    return metric_set
+@app.on_event("startup")
+async def load_knowledge_base():
+    """Start loading the knowledge base once the server is accepting connections."""
+    if rag_engine:
+        rag_engine.start_loading()
+    if metrics_registry:
+        metrics_registry.start(_worker_metrics, METRICS_PUBLISH_SECONDS)
+    if metrics_history:
+        metrics_tracker.history = metrics_history
+        metrics_history.start()
+def _require_ready():
+    """
+    Raise 503 unless the engine can serve queries. While the knowledge base is
+    still warming the response carries Retry-After.
+    """
+    if rag_engine and rag_engine.is_ready():
+        return
+    if rag_engine and rag_engine.load_status["state"] == "warming":
+        raise HTTPException(
+            status_code=503,
+            detail="Knowledge base is loading. Retry shortly.",
+            headers={"Retry-After": str(WARMING_RETRY_AFTER)},
+        )
+    raise HTTPException(
+        status_code=503,
+        detail="RAG engine not initialized. Please run scripts/build_knowledge_base_tfidf.py first.",
+    )
+@app.on_event("shutdown")
+async def shutdown_rag_engine():
+    """Drain the RAG engine worker pool on shutdown."""
+    if rag_engine:
+        rag_engine.shutdown()
+    if metrics_registry:
+        metrics_registry.stop()
+    if metrics_history:
+        metrics_history.close()
 # Request/Response Models
 class TicketRequest(BaseModel):
     category: str
@@ -57,7 +114,34 @@ class ResolutionResponse(BaseModel):
     confidence: float
     similar_tickets: List[SimilarTicket]
     method: str = "rag"
+    timing: Optional[dict] = None
     metadata: Optional[dict] = None
+class BatchTicketRequest(BaseModel):
+    tickets: List[TicketRequest]
+class BatchError(BaseModel):
+    index: int
+    detail: str
+class BatchResolutionResponse(BaseModel):
+    results: List[Optional[ResolutionResponse]]
+    errors: List[BatchError] = []
+    timing: Optional[dict] = None
+class KnowledgeBaseTicket(BaseModel):
+    ticket_id: Optional[str] = None
+    category: str
+    description: str
+    resolution: str
+    priority: str = "Medium"
+    status: str = "Resolved"
+class IngestTicketsRequest(BaseModel):
+    tickets: List[KnowledgeBaseTicket]
+class IngestTicketsResponse(BaseModel):
+    added: int
+    ticket_ids: List[str]
+    total_tickets: int
+    delta_tickets: int
+    merge_scheduled: bool
+    refit_scheduled: bool
+    drift: float
 # API Endpoints
 @app.get("/api")
 async def api_info():
@@ -68,19 +152,48 @@ async def api_info():
         "status": "running" if rag_engine and rag_engine.is_ready() else "initializing",
         "endpoints": {
             "suggest_resolution": "/api/suggest-resolution",
+            "suggest_resolution_stream": "/api/suggest-resolution/stream",
+            "suggest_resolution_batch": "/api/suggest-resolution/batch",
+            "knowledge_base_tickets": "/api/knowledge-base/tickets",
             "health": "/health",
+            "liveness": "/health/live",
+            "readiness": "/health/ready",
             "stats": "/api/stats",
+            "metrics": "/api/metrics",
+            "openmetrics": "/metrics",
+            "metrics_history": "/api/metrics/history",
         },
     }
+def _readiness() -> JSONResponse:
+    """200 with knowledge base stats when ready, else 503 with the load status."""
+    if rag_engine and rag_engine.is_ready():
+        return JSONResponse(
+            {
+                "status": "healthy",
+                "knowledge_base_size": rag_engine.get_knowledge_base_size(),
+                "ai_available": rag_engine.has_ai_client(),
+                "load": rag_engine.get_load_status(),
+            }
+        )
+    load = rag_engine.get_load_status() if rag_engine else {"state": "failed"}
+    headers = {"Retry-After": str(WARMING_RETRY_AFTER)} if load["state"] == "warming" else None
+    return JSONResponse(
+        {"status": load["state"], "load": load}, status_code=503, headers=headers
+    )
 @app.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    if not rag_engine or not rag_engine.is_ready():
-        raise HTTPException(status_code=503, detail="RAG engine not ready")
+    """Readiness check (alias of /health/ready)."""
+    return _readiness()
+@app.get("/health/ready")
+async def readiness_check():
+    """Readiness: 200 once the knowledge base serves queries, 503 while warming or failed."""
+    return _readiness()
+@app.get("/health/live")
+async def liveness_check():
+    """Liveness: 200 whenever the process is serving requests, loaded or not."""
     return {
-        "status": "healthy",
-        "knowledge_base_size": rag_engine.get_knowledge_base_size(),
-        "ai_available": rag_engine.has_ai_client(),
+        "status": "alive",
+        "state": rag_engine.load_status["state"] if rag_engine else "failed",
     }
 @app.post("/api/suggest-resolution", response_model=ResolutionResponse)
 async def suggest_resolution(request: TicketRequest):
@@ -91,15 +204,11 @@ async def suggest_resolution(request: TicketRequest):
     Returns:
         ResolutionResponse with suggested resolution and similar tickets
     """
-    if not rag_engine or not rag_engine.is_ready():
-        raise HTTPException(
-            status_code=503,
-            detail="RAG engine not initialized. Please run scripts/build_knowledge_base_tfidf.py first.",
-        )
+    _require_ready()
     try:
         logger.info(f"Processing resolution request for category: {request.category}")
-        # Use RAG engine to generate resolution
-        result = rag_engine.suggest_resolution(
+        # Use RAG engine to generate resolution (off the event loop)
+        result = await rag_engine.asuggest_resolution(
             category=request.category,
             priority=request.priority,
             description=request.description,
@@ -108,28 +217,125 @@ async def suggest_resolution(request: TicketRequest):
     except Exception as e:
         logger.error(f"Error suggesting resolution: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+def _format_sse(event: str, data: dict) -> str:
+    """Encode one Server-Sent Event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+@app.post("/api/suggest-resolution/stream")
+async def suggest_resolution_stream(request: TicketRequest):
+    """
+    Streaming variant of /api/suggest-resolution using Server-Sent Events.
+    Events, in order:
+        similar_tickets: sent as soon as retrieval finishes
+        token: resolution text chunks as the model generates them
+        done: confidence, method, timing and metadata
+    If generation fails part-way, an error event ends the stream instead
+    of done.
+    """
+    _require_ready()
+    logger.info(f"Streaming resolution request for category: {request.category}")
+    def event_stream():
+        # Sync generator: Starlette iterates it in a worker thread, so the
+        # blocking model stream never runs on the event loop
+        try:
+            for event, data in rag_engine.stream_resolution(
+                category=request.category,
+                priority=request.priority,
+                description=request.description,
+            ):
+                yield _format_sse(event, data)
+        except Exception as e:
+            logger.error(f"Error streaming resolution: {e}")
+            yield _format_sse("error", {"detail": str(e)})
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+@app.post("/api/suggest-resolution/batch", response_model=BatchResolutionResponse)
+async def suggest_resolution_batch(request: BatchTicketRequest):
+    """
+    Suggest resolutions for many tickets in one call.
+    Retrieval is vectorised across the batch; LLM calls run with bounded
+    concurrency. Each result keeps its own timing block, and tickets that fail
+    are reported in errors (their result is null) without failing the batch.
+    """
+    _require_ready()
+    max_tickets = int(os.getenv("BATCH_MAX_TICKETS", "500"))
+    if len(request.tickets) > max_tickets:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch too large: {len(request.tickets)} tickets (max {max_tickets})",
+        )
+    try:
+        logger.info(f"Processing batch resolution request for {len(request.tickets)} tickets")
+        result = await rag_engine.asuggest_resolutions(
+            [ticket.model_dump() for ticket in request.tickets]
+        )
+        return BatchResolutionResponse(**result)
+    except Exception as e:
+        logger.error(f"Error suggesting batch resolutions: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 @app.get("/api/stats")
 async def get_stats():
     """Get statistics about the RAG service."""
-    if not rag_engine or not rag_engine.is_ready():
-        raise HTTPException(status_code=503, detail="RAG engine not ready")
+    _require_ready()
     return {
         "total_tickets": rag_engine.get_knowledge_base_size(),
         "top_categories": rag_engine.get_top_categories(),
         "service_status": "operational",
     }
-@app.post("/api/reload-knowledge-base")
+@app.post("/api/knowledge-base/tickets", response_model=IngestTicketsResponse)
+async def add_knowledge_base_tickets(request: IngestTicketsRequest):
+    """
+    Add resolved tickets to the knowledge base without a rebuild.
+    Tickets are searchable as soon as this returns; merging them into the
+    stored knowledge base (and refitting the vocabulary when it has drifted)
+    happens in the background.
+    """
+    _require_ready()
+    max_tickets = int(os.getenv("KB_INGEST_MAX_TICKETS", "1000"))
+    if len(request.tickets) > max_tickets:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many tickets: {len(request.tickets)} (max {max_tickets})",
+        )
+    try:
+        logger.info(f"Ingesting {len(request.tickets)} tickets into the knowledge base")
+        result = await asyncio.to_thread(
+            rag_engine.add_tickets, [ticket.model_dump() for ticket in request.tickets]
+        )
+        return IngestTicketsResponse(**result)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error ingesting tickets: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+@app.post("/api/reload-knowledge-base", status_code=202)
 async def reload_knowledge_base():
-    """Reload the knowledge base (admin endpoint)."""
+    """
+    Reload the knowledge base (admin endpoint).
+    Returns immediately with a job ID; the new knowledge base is built and
+    validated in the background and swapped in atomically, so requests keep
+    being served from the current one meanwhile (and if the reload fails).
+    """
+    if not rag_engine:
+        raise HTTPException(status_code=503, detail="RAG engine not initialized")
     try:
-        rag_engine.reload_knowledge_base()
+        job = rag_engine.reload_knowledge_base()
         return {
-            "status": "success",
-            "message": "Knowledge base reloaded successfully",
-            "total_tickets": rag_engine.get_knowledge_base_size(),
+            **job,
+            "message": "Knowledge base reload queued",
+            "status_url": f"/api/reload-knowledge-base/{job['job_id']}",
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+@app.get("/api/reload-knowledge-base/{job_id}")
+async def get_reload_job(job_id: str):
+    """Status of a knowledge base reload job: queued, running, succeeded or failed."""
+    job = rag_engine.get_reload_job(job_id) if rag_engine else None
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown reload job: {job_id}")
+    return job
 @app.get("/api/metrics")
 async def get_metrics():
     """
@@ -139,18 +345,65 @@ async def get_metrics():
         - Quality metrics (confidence scores)
         - Success rates
         - Category-wise statistics
+        - Per-stage latency (encoding, scoring, rerank, prompt build, LLM queue
+          and generation) by category and resolution method
+        - LLM response cache hit rate
     """
     try:
-        return metrics_tracker.get_summary()
+        summary = metrics_tracker.get_summary()
+        if rag_engine:
+            summary.update(rag_engine.get_cache_stats())
+        return summary
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+@app.get("/metrics")
+async def openmetrics():
+    """
+    Metrics in the OpenMetrics text format for Prometheus-compatible scrapers:
+    query counters, latency, confidence and per-stage histograms, and knowledge
+    base, cache and in-flight LLM gauges. Rendered from pre-aggregated state;
+    with METRICS_MULTIPROC_DIR set, merged across all workers.
+    """
+    metric_set = _worker_metrics()
+    if metrics_registry:
+        # Every worker's file is read per scrape; keep that off the event loop
+        await asyncio.to_thread(metrics_registry.publish, metric_set)
+        metric_set = await asyncio.to_thread(metrics_registry.collect)
+    return Response(metric_set.render(), media_type=OPENMETRICS_CONTENT_TYPE)
 @app.get("/api/metrics/realtime")
-async def get_realtime_metrics():
-    """Get real-time metrics for the last 100 queries."""
+async def get_realtime_metrics(
+    window: int = Query(100, ge=1, description="Number of most recent queries to aggregate"),
+):
+    """
+    Get real-time metrics over a sliding window of the most recent queries:
+    averages, latency and confidence percentiles, and per-category counts and
+    averages. Windows larger than METRICS_RECENT_QUERIES are capped to it.
+    """
     try:
-        return metrics_tracker.get_realtime_stats()
+        return metrics_tracker.get_realtime_stats(window)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+@app.get("/api/metrics/history")
+async def get_metrics_history(
+    from_: Optional[float] = Query(None, alias="from", description="Start, Unix seconds (default: 24 h before to)"),
+    to: Optional[float] = Query(None, description="End, Unix seconds (default: now)"),
+    step: int = Query(3600, description="Seconds per point, a multiple of 60"),
+):
+    """
+    Get metrics trends from the persistent history: one point per step with
+    query and error counts, latency average and percentiles, confidence and
+    per-category counts. Read from the 1-hour rollups when step is a whole
+    number of hours, else from the 1-minute rollups (kept for 14 days; a
+    sub-hour step over an older range is a 400 rather than an empty series).
+    """
+    if not metrics_history:
+        raise HTTPException(status_code=503, detail="Metrics history is disabled; set METRICS_HISTORY_PATH to enable it")
+    end = to if to is not None else time.time()
+    start = from_ if from_ is not None else end - 86400
+    try:
+        return await asyncio.to_thread(metrics_history.history, start, end, step)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 # Mount static files for frontend
 frontend_dist = os.path.join(os.path.dirname(__file__), "..", "frontend", "dist")
 if os.path.exists(frontend_dist):
@@ -0,0 +1,31 @@
+"""
+Shared test fixtures (run the suite with: python -m pytest, from backend/ or the repository root)
+Paths are resolved from this file, so no test reads or builds a knowledge base
+relative to the working directory.
+"""
+import os
+import pickle
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from kb_ingest import document_text
+from kb_store import save_kb_dir
+from rag_engine_tfidf import RAGEngine
+BUNDLED_KB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "knowledge_base.pkl")
+@pytest.fixture(scope="session")
+def bundled_kb():
+    """Path of the bundled knowledge base, whatever the working directory."""
+    return BUNDLED_KB
+@pytest.fixture
+def engine(tmp_path):
+    """Engine on its own knowledge base directory built from the first bundled tickets."""
+    if not os.path.exists(BUNDLED_KB):
+        pytest.skip("Knowledge base not available")
+    with open(BUNDLED_KB, "rb") as f:
+        tickets = pickle.load(f)["tickets"][:500]
+    vectorizer = TfidfVectorizer(max_features=5000, ngram_range=(1, 2), stop_words="english")
+    matrix = vectorizer.fit_transform(document_text(t) for t in tickets)
+    kb_dir = str(tmp_path / "knowledge_base")
+    save_kb_dir(kb_dir, tickets, vectorizer, matrix)
+    rag_engine = RAGEngine(kb_dir)
+    yield rag_engine
+    rag_engine.shutdown()
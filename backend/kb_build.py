@@ -0,0 +1,146 @@
+"""
+Knowledge Base Build Pipeline
+The single definition of how tickets become a TF-IDF knowledge base, shared by
+scripts/build_knowledge_base_tfidf.py and the engine's startup build. A build
+config is a dict with a name, the TfidfVectorizer parameters and the category
+weight (how many times the category precedes the description in the indexed
+text). save_kb_dir records it in the manifest, and the engine reads it back
+with the knowledge base, so query text, ingested tickets and refits are always
+weighted the way the documents were. scikit-learn is imported only when a
+build actually fits.
+"""
+import os
+import json
+import time
+from typing import Callable, Dict, Iterable, Tuple, Union
+import numpy as np
+from kb_ingest import weighted_text
+from kb_store import VECTORIZER_PARAMS
+from ticket_store import TicketStore
+DEFAULT_BUILD_CONFIG = "standard"
+BUILD_CONFIGS = {
+    # Broad unigram/bigram vocabulary; what the build script has always produced
+    "standard": {
+        "category_weight": 1,
+        "vectorizer": {
+            "max_features": 5000,
+            "ngram_range": [1, 2],
+            "stop_words": "english",
+        },
+    },
+    # Phrase matching: trigrams, log-scaled TF, common terms dropped and the
+    # category repeated three times (the engine's former startup build)
+    "phrase": {
+        "category_weight": 3,
+        "vectorizer": {
+            "max_features": 3000,
+            "ngram_range": [1, 3],
+            "stop_words": "english",
+            "min_df": 1,
+            "max_df": 0.7,
+            "sublinear_tf": True,
+            "token_pattern": r"(?u)\b[a-zA-Z][a-zA-Z]+\b",
+        },
+    },
+}
+def resolve_build_config(config: Union[str, Dict] = None) -> Dict:
+    """
+    Normalised build config from a preset name, a JSON file path or a dict.
+    None selects KB_BUILD_CONFIG, or the default preset. Raises ValueError for
+    unknown presets, unknown vectorizer parameters or a category weight below 1.
+    """
+    if config is None:
+        config = os.getenv("KB_BUILD_CONFIG", DEFAULT_BUILD_CONFIG)
+    if isinstance(config, str):
+        if config in BUILD_CONFIGS:
+            config = {"name": config, **BUILD_CONFIGS[config]}
+        elif config.endswith(".json") and os.path.isfile(config):
+            with open(config, encoding="utf-8") as f:
+                config = {"name": os.path.splitext(os.path.basename(config))[0], **json.load(f)}
+        else:
+            raise ValueError(
+                f"Unknown build config '{config}' (expected one of "
+                f"{', '.join(BUILD_CONFIGS)} or a .json file)"
+            )
+    unknown = set(config.get("vectorizer", {})) - set(VECTORIZER_PARAMS)
+    if unknown:
+        raise ValueError(f"Unsupported vectorizer parameters: {', '.join(sorted(unknown))}")
+    category_weight = config.get("category_weight", 1)
+    if not isinstance(category_weight, int) or category_weight < 1:
+        raise ValueError(f"category_weight must be a positive integer, got {category_weight!r}")
+    return {
+        "name": config.get("name", "custom"),
+        "category_weight": category_weight,
+        "vectorizer": dict(config.get("vectorizer", {})),
+    }
+def build_config_from_manifest(manifest: Dict) -> Dict:
+    """
+    Build config of a knowledge base directory. Manifests written before the
+    config was recorded get the preset whose vectorizer parameters they
+    match, or a category weight of 1.
+    """
+    params = manifest["vectorizer"]
+    recorded = manifest.get("build")
+    if recorded is not None:
+        return {
+            "name": recorded.get("name", "custom"),
+            "category_weight": recorded["category_weight"],
+            "vectorizer": params,
+        }
+    for name, preset in BUILD_CONFIGS.items():
+        if all(params.get(key) == value for key, value in preset["vectorizer"].items()):
+            return {"name": name, "category_weight": preset["category_weight"], "vectorizer": params}
+    return {"name": "legacy", "category_weight": 1, "vectorizer": params}
+def make_vectorizer(config: Dict):
+    """Unfitted TfidfVectorizer for a build config."""
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    params = dict(config["vectorizer"])
+    if "ngram_range" in params:
+        params["ngram_range"] = tuple(params["ngram_range"])
+    if "dtype" in params:
+        params["dtype"] = np.dtype(params["dtype"]).type
+    return TfidfVectorizer(**params)
+def build_knowledge_base(
+    chunks: Iterable[Dict],
+    config: Dict,
+    workers: int = 1,
+    shard_rows: int = None,
+    on_chunk: Callable[[int], None] = None,
+) -> Tuple[TicketStore, object, object, Dict]:
+    """
+    Fit a knowledge base on ticket column chunks (see ticket_source.py).
+    Chunks are read once: each is encoded into a TicketStore while its texts
+    stream into the vectorizer, so one chunk of raw values is held at a time.
+    workers=1 fits in this process; any other value uses ParallelTfidf on that
+    many processes (0 = one per core) and shard_rows texts per shard (default
+    parallel_tfidf.SHARD_ROWS), which gives an identical result.
+    on_chunk is called with each chunk's row count.
+    Returns (tickets, vectorizer, tfidf_matrix, stats).
+    """
+    category_weight = config["category_weight"]
+    stores = []
+    def texts():
+        for chunk in chunks:
+            stores.append(TicketStore.from_columns(chunk))
+            if on_chunk is not None:
+                on_chunk(len(chunk["category"]))
+            for category, description in zip(chunk["category"], chunk["description"]):
+                yield weighted_text(category, description, category_weight)
+    vectorizer = make_vectorizer(config)
+    start_time = time.perf_counter()
+    stats = {}
+    if workers == 1:
+        tfidf_matrix = vectorizer.fit_transform(texts())
+    else:
+        from parallel_tfidf import SHARD_ROWS, ParallelTfidf
+        fitter = ParallelTfidf(
+            vectorizer, workers=workers or None, shard_rows=shard_rows or SHARD_ROWS
+        )
+        vectorizer, tfidf_matrix = fitter.fit_transform(texts())
+        stats = dict(fitter.stats)
+    if not stores:
+        raise ValueError("No tickets found")
+    tickets = TicketStore.concat(stores)
+    stats["rows"] = len(tickets)
+    stats["seconds"] = time.perf_counter() - start_time
+    return tickets, vectorizer, tfidf_matrix, stats
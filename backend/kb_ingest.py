@@ -0,0 +1,89 @@
+"""
+Knowledge Base Ingestion
+Resolved tickets added at runtime go into a delta segment: rows transformed
+with the current vocabulary and IDF, searched alongside the base segment
+until a background merge folds them into a new knowledge base directory.
+Ingested tickets are also appended to a JSON-lines log in the live knowledge
+base version's directory so they survive a restart before the merge. Every
+worker appends to that log, so it, not a worker's delta segment, is what a
+merge folds in.
+"""
+import os
+import json
+import uuid
+from typing import Dict, Iterable, List, Tuple
+import scipy.sparse as sp
+from ticket_store import TicketStore
+DELTA_LOG_NAME = "delta_tickets.jsonl"
+TICKET_DEFAULTS = {"priority": "Medium", "status": "Resolved"}
+def weighted_text(category: str, description: str, category_weight: int = 1) -> str:
+    """Category repeated category_weight times, then the description (see kb_build.py)."""
+    return " ".join([category] * category_weight + [description])
+def document_text(ticket: Dict, category_weight: int = 1) -> str:
+    """Text indexed for a ticket by a build config with this category weight."""
+    return weighted_text(ticket["category"], ticket["description"], category_weight)
+def normalize_ticket(ticket: Dict, fields: List[str]) -> Dict:
+    """Ticket dict with the knowledge base's fields, defaults and a generated ID if missing."""
+    for required in ("category", "description", "resolution"):
+        if not str(ticket.get(required) or "").strip():
+            raise ValueError(f"Ticket is missing required field '{required}'")
+    ticket = dict(ticket)
+    if not ticket.get("ticket_id"):
+        ticket["ticket_id"] = f"TKT-{uuid.uuid4().hex[:10].upper()}"
+    return {field: str(ticket.get(field) or TICKET_DEFAULTS.get(field, "")) for field in fields}
+def count_oov(vectorizer, texts: Iterable[str]) -> Tuple[int, int]:
+    """(terms missing from the vocabulary, total terms) over texts, as the vectorizer analyses them."""
+    analyze = vectorizer.build_analyzer()
+    vocabulary = vectorizer.vocabulary_
+    oov = total = 0
+    for text in texts:
+        terms = analyze(text)
+        total += len(terms)
+        oov += sum(1 for term in terms if term not in vocabulary)
+    return oov, total
+class DeltaSegment:
+    """
+    Tickets ingested since the base segment was written, with their TF-IDF rows.
+    Immutable: append() and drop_first() return new segments, so a reader
+    holding a segment never sees it change.
+    """
+    def __init__(self, tickets: List[Dict], matrix: sp.csr_matrix):
+        self.tickets = tickets
+        self.matrix = matrix
+        self.store = TicketStore.from_dicts(tickets)
+        if tickets:
+            self.store.keyword_index()
+    @classmethod
+    def empty(cls, n_features: int) -> "DeltaSegment":
+        return cls([], sp.csr_matrix((0, n_features)))
+    def __len__(self) -> int:
+        return len(self.tickets)
+    def append(self, tickets: List[Dict], rows: sp.csr_matrix) -> "DeltaSegment":
+        return DeltaSegment(self.tickets + tickets, sp.vstack([self.matrix, rows], format="csr"))
+    def drop_first(self, n: int) -> "DeltaSegment":
+        return DeltaSegment(self.tickets[n:], self.matrix[n:])
+def delta_log_path(kb_dir: str) -> str:
+    return os.path.join(kb_dir, DELTA_LOG_NAME)
+def read_delta_log(kb_dir: str) -> List[Dict]:
+    path = delta_log_path(kb_dir)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+def append_delta_log(kb_dir: str, tickets: List[Dict]):
+    with open(delta_log_path(kb_dir), "a", encoding="utf-8") as f:
+        for ticket in tickets:
+            f.write(json.dumps(ticket, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+def write_delta_log(kb_dir: str, tickets: List[Dict]):
+    """
+    Replace the log with exactly these tickets (after a merge). The file is
+    written even when empty: it marks a version that carried its delta over.
+    """
+    path = delta_log_path(kb_dir)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for ticket in tickets:
+            f.write(json.dumps(ticket, ensure_ascii=False) + "\n")
+    os.replace(tmp_path, path)
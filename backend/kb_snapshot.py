@@ -0,0 +1,165 @@
+"""
+Knowledge Base Snapshot
+Everything a query reads from the knowledge base - tickets, vectorizer, TF-IDF
+matrix, the retrieval indexes derived from them and the delta segment - in one
+object that is never modified after it is built. The engine publishes a new
+snapshot by swapping a single reference, so a query that captured the previous
+one finishes on a consistent view while reloads, merges and ingestion prepare
+the next one off to the side.
+"""
+import time
+import itertools
+import logging
+from typing import Dict, List, Tuple
+from kb_ingest import DeltaSegment, count_oov, document_text, normalize_ticket
+from retrieval import CategoryPartitions, InvertedIndex
+logger = logging.getLogger(__name__)
+_versions = itertools.count(1)
+class KnowledgeBaseSnapshot:
+    """
+    One consistent, read-only view of the knowledge base.
+    The base segment (tickets, vectorizer, tfidf_matrix and its indexes) comes
+    from a knowledge base directory; delta holds tickets ingested since. drift
+    counts out-of-vocabulary terms in those ingested tickets, and fitted_at is
+    when the vocabulary was fitted (or loaded). build_config is the config the
+    base segment was built with (see kb_build.py); its category weight applies
+    to ingested tickets and queries. Derived snapshots (ingest, with_delta)
+    share the base segment and get a new version.
+    """
+    def __init__(
+        self,
+        tickets,
+        vectorizer,
+        tfidf_matrix,
+        category_partitions: CategoryPartitions,
+        inverted_index: InvertedIndex = None,
+        kb_dir: str = None,
+        delta: DeltaSegment = None,
+        drift: Dict = None,
+        fitted_at: float = None,
+        build_config: Dict = None,
+    ):
+        self.version = next(_versions)
+        self.tickets = tickets
+        self.vectorizer = vectorizer
+        self.tfidf_matrix = tfidf_matrix
+        self.category_partitions = category_partitions
+        self.inverted_index = inverted_index
+        self.kb_dir = kb_dir
+        self.delta = delta if delta is not None else DeltaSegment.empty(tfidf_matrix.shape[1])
+        self.drift = drift or {"tickets": 0, "oov_terms": 0, "terms": 0}
+        self.fitted_at = fitted_at or time.time()
+        self.build_config = build_config or {"name": "legacy", "category_weight": 1}
+        self._baseline_oov = None  # Lazily sampled, see vocabulary_drift()
+    @classmethod
+    def build(
+        cls,
+        tickets,
+        vectorizer,
+        tfidf_matrix,
+        kb_dir: str = None,
+        inverted: bool = False,
+        category_matrix=None,
+        **kwargs,
+    ) -> "KnowledgeBaseSnapshot":
+        """
+        Derive the retrieval indexes for a base segment and validate the
+        result. category_matrix is the matrix in category partition order,
+        if stored (see kb_store.load_category_matrix).
+        """
+        # Keyword sets and category partitions are stored with the knowledge
+        # base; older directories build them here
+        tickets.keyword_index()
+        category_partitions = CategoryPartitions(
+            tfidf_matrix, *tickets.partition("category"), category_matrix
+        )
+        inverted_index = None
+        if inverted:
+            start_time = time.time()
+            inverted_index = InvertedIndex(tfidf_matrix)
+            logger.info(
+                f"Built inverted index over {inverted_index.n_terms} terms "
+                f"in {(time.time() - start_time) * 1000:.2f} ms"
+            )
+        snapshot = cls(
+            tickets,
+            vectorizer,
+            tfidf_matrix,
+            category_partitions,
+            inverted_index,
+            kb_dir,
+            **kwargs,
+        )
+        snapshot.validate()
+        return snapshot
+    def validate(self):
+        """Raise ValueError unless the parts fit together and the vectorizer works."""
+        n_rows, n_features = self.tfidf_matrix.shape
+        if n_rows != len(self.tickets):
+            raise ValueError(
+                f"TF-IDF matrix has {n_rows} rows for {len(self.tickets)} tickets"
+            )
+        if n_features != len(self.vectorizer.vocabulary_):
+            raise ValueError(
+                f"TF-IDF matrix has {n_features} columns for a vocabulary of "
+                f"{len(self.vectorizer.vocabulary_)} terms"
+            )
+        if self.delta.matrix.shape[1] != n_features:
+            raise ValueError("Delta segment was transformed with a different vocabulary")
+        if self.vectorizer.transform(["test"]).shape[1] != n_features:
+            raise ValueError("Vectorizer output does not match the TF-IDF matrix")
+    def with_delta(self, delta: DeltaSegment, drift: Dict) -> "KnowledgeBaseSnapshot":
+        """Snapshot sharing this base segment with another delta segment."""
+        snapshot = KnowledgeBaseSnapshot(
+            self.tickets,
+            self.vectorizer,
+            self.tfidf_matrix,
+            self.category_partitions,
+            self.inverted_index,
+            self.kb_dir,
+            delta,
+            drift,
+            self.fitted_at,
+            self.build_config,
+        )
+        snapshot._baseline_oov = self._baseline_oov
+        return snapshot
+    def ingest(self, tickets: List[Dict]) -> Tuple["KnowledgeBaseSnapshot", List[Dict]]:
+        """
+        Snapshot with tickets appended to the delta segment, transformed with
+        this snapshot's vocabulary, and the normalised tickets.
+        Raises ValueError, before building anything, if a ticket is invalid.
+        """
+        added = [normalize_ticket(t, self.tickets.fields) for t in tickets]
+        if not added:
+            return self, added
+        texts = [document_text(t, self.category_weight) for t in added]
+        rows = self.vectorizer.transform(texts)
+        oov_terms, terms = count_oov(self.vectorizer, texts)
+        drift = {
+            "tickets": self.drift["tickets"] + len(added),
+            "oov_terms": self.drift["oov_terms"] + oov_terms,
+            "terms": self.drift["terms"] + terms,
+        }
+        return self.with_delta(self.delta.append(added, rows), drift), added
+    def vocabulary_drift(self) -> float:
+        """
+        Out-of-vocabulary term rate of tickets ingested since the last fit,
+        minus the rate of the knowledge base's own text (sampled).
+        """
+        if not self.drift["terms"]:
+            return 0.0
+        if self._baseline_oov is None:
+            step = max(1, len(self.tickets) // 1000)
+            sample = (
+                document_text(self.tickets[i], self.category_weight)
+                for i in range(0, len(self.tickets), step)
+            )
+            oov_terms, terms = count_oov(self.vectorizer, sample)
+            self._baseline_oov = oov_terms / terms if terms else 0.0
+        return self.drift["oov_terms"] / self.drift["terms"] - self._baseline_oov
+    @property
+    def category_weight(self) -> int:
+        return self.build_config["category_weight"]
+    def __len__(self) -> int:
+        return len(self.tickets) + len(self.delta)
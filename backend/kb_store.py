@@ -0,0 +1,378 @@
+"""
+Knowledge Base Store
+Versioned on-disk layout for the TF-IDF knowledge base, replacing the single
+pickle. The CSR arrays are plain .npy files opened with mmap_mode="r", so
+uvicorn workers share their pages through the OS page cache and loading does
+not deserialise the matrix. A knowledge base directory holds versions in
+subdirectories and a CURRENT file naming the live one; publishing a new
+version is a single atomic rename of CURRENT, so the directory is never
+missing or half-written for a reader. Workers sharing the directory take
+kb_write_lock() (a LOCK file) to publish a version or append to the live
+version's delta log (see kb_ingest.py). Layout of a version:
+    manifest.json                   format version, shapes, vectorizer params,
+                                    build config (see kb_build.py)
+    matrix_{data,indices,indptr}.npy
+    vocab.bin + vocab_offsets.npy   UTF-8 terms in column order
+    idf.npy
+    stop_words.txt                  resolved stop word list, one per line
+    tickets_<field>.bin + tickets_<field>_offsets.npy   text fields
+    tickets_<field>_codes.npy       categorical fields (labels in the manifest)
+    keyword_ids.npy + keyword_offsets.npy   per-ticket keyword sets (keyword boost)
+    category_rows.npy + category_offsets.npy   row partitions by category code
+    category_matrix_{data,indices,indptr}.npy   matrix rows in partition order
+Ticket buffers are memory-mapped too and served through a TicketStore.
+Loading returns a TfidfModel, so scikit-learn is only imported to save a
+fitted TfidfVectorizer or migrate a pickle. FORMAT_VERSION is bumped with
+every layout change; load_kb_dir reads each older version explicitly and
+rejects unknown ones.
+"""
+import os
+import json
+import time
+import shutil
+import pickle
+import logging
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import scipy.sparse as sp
+from kb_ingest import DELTA_LOG_NAME
+from tfidf_model import TfidfModel
+from ticket_store import KeywordIndex, TicketStore, encode_text
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, run a single worker there
+    fcntl = None
+logger = logging.getLogger(__name__)
+# Layout versions, each adding to the one before:
+#   1  matrix, vocabulary, IDF, stop words and text ticket columns
+#   2  categorical ticket columns (codes, with labels in the manifest)
+#   3  per-ticket keyword sets
+#   4  category row partitions
+#   5  build config (name, category weight) in the manifest
+#   6  versions in subdirectories, the live one named by CURRENT
+#   7  matrix rows in category partition order
+# Versions 1-5 sit directly in the knowledge base directory
+FORMAT_VERSION = 7
+MANIFEST_NAME = "manifest.json"
+CURRENT_NAME = "CURRENT"
+LOCK_NAME = "LOCK"
+VERSION_PREFIX = "v-"
+# TfidfVectorizer parameters persisted in the manifest; callables such as a
+# custom tokenizer cannot be stored and are rejected on save
+VECTORIZER_PARAMS = (
+    "lowercase",
+    "strip_accents",
+    "token_pattern",
+    "stop_words",
+    "ngram_range",
+    "max_df",
+    "min_df",
+    "max_features",
+    "binary",
+    "dtype",
+    "norm",
+    "use_idf",
+    "smooth_idf",
+    "sublinear_tf",
+)
+def kb_dir_for(knowledge_base_path: str) -> str:
+    """Directory-format path for a (legacy) pickle path: data/knowledge_base.pkl -> data/knowledge_base."""
+    root, ext = os.path.splitext(knowledge_base_path)
+    return root if ext == ".pkl" else knowledge_base_path
+def live_kb_dir(path: str) -> str:
+    """Directory of the live version: the one CURRENT names, or path itself for an unversioned layout."""
+    try:
+        with open(os.path.join(path, CURRENT_NAME), encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return path
+    return os.path.join(path, name)
+def is_kb_dir(path: str) -> bool:
+    return os.path.isfile(os.path.join(live_kb_dir(path), MANIFEST_NAME))
+@contextmanager
+def kb_write_lock(path: str):
+    """
+    Exclusive lock on the knowledge base directory path, across processes as
+    well as threads. Held to publish a version and to append to the live
+    version's delta log, so no ticket is appended to a version being replaced.
+    """
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, LOCK_NAME), "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        # Closing the file releases the lock
+        yield
+def _decode_strings(blob: bytes, offsets: np.ndarray) -> List[str]:
+    bounds = offsets.tolist()
+    return [blob[bounds[i] : bounds[i + 1]].decode("utf-8") for i in range(len(bounds) - 1)]
+def _vectorizer_params(vectorizer) -> Dict:
+    if vectorizer.analyzer != "word" or vectorizer.tokenizer or vectorizer.preprocessor:
+        raise ValueError("Only word analyzers without custom callables can be stored")
+    params = {name: getattr(vectorizer, name) for name in VECTORIZER_PARAMS}
+    params["ngram_range"] = list(params["ngram_range"])
+    params["dtype"] = np.dtype(params["dtype"]).name
+    if params["stop_words"] is not None and not isinstance(params["stop_words"], str):
+        params["stop_words"] = sorted(params["stop_words"])
+    return params
+def fitted_vectorizer(vectorizer, terms: List[str], idf: np.ndarray):
+    """Give an unfitted TfidfVectorizer the fitted state for terms (in column order) and idf."""
+    from sklearn.feature_extraction.text import TfidfTransformer
+    vectorizer.vocabulary_ = {term: i for i, term in enumerate(terms)}
+    vectorizer.fixed_vocabulary_ = False
+    transformer = TfidfTransformer(
+        norm=vectorizer.norm,
+        use_idf=vectorizer.use_idf,
+        smooth_idf=vectorizer.smooth_idf,
+        sublinear_tf=vectorizer.sublinear_tf,
+    )
+    if vectorizer.use_idf:
+        transformer.idf_ = np.asarray(idf, dtype=np.float64)
+    transformer.n_features_in_ = len(terms)
+    vectorizer._tfidf = transformer
+    return vectorizer
+def _load_buffer(path: str, mmap: bool) -> np.ndarray:
+    if not mmap:
+        return np.fromfile(path, dtype=np.uint8)
+    if os.path.getsize(path) == 0:
+        # np.memmap cannot map an empty file
+        return np.empty(0, dtype=np.uint8)
+    return np.memmap(path, dtype=np.uint8, mode="r")
+def save_kb_dir(path: str, tickets, vectorizer, tfidf_matrix, build_config: Dict = None) -> str:
+    """
+    Write a new version of the knowledge base at path and make it live.
+    Returns the version's directory (see write_kb_version).
+    """
+    version_dir = write_kb_version(path, tickets, vectorizer, tfidf_matrix, build_config)
+    with kb_write_lock(path):
+        publish_kb_version(path, version_dir)
+    return version_dir
+def write_kb_version(path: str, tickets, vectorizer, tfidf_matrix, build_config: Dict = None) -> str:
+    """
+    Write a complete new version under the knowledge base directory path
+    without making it live, and return its directory. Callers can add files
+    to it (e.g. the delta log) before publish_kb_version().
+    tickets may be a TicketStore or a list of ticket dicts, and vectorizer a
+    fitted TfidfVectorizer or TfidfModel. build_config's name
+    and category weight are recorded in the manifest next to the vectorizer
+    parameters.
+    """
+    store = TicketStore.from_dicts(tickets)
+    matrix = sp.csr_matrix(tfidf_matrix)
+    params = _vectorizer_params(vectorizer)
+    terms = [None] * len(vectorizer.vocabulary_)
+    for term, column in vectorizer.vocabulary_.items():
+        terms[column] = term
+    os.makedirs(path, exist_ok=True)
+    # Names sort by creation time (see _prune_versions)
+    version_dir = os.path.join(path, f"{VERSION_PREFIX}{time.time_ns()}-{os.getpid()}")
+    tmp_path = f"{version_dir}.tmp"
+    os.makedirs(tmp_path)
+    try:
+        np.save(os.path.join(tmp_path, "matrix_data.npy"), matrix.data)
+        np.save(os.path.join(tmp_path, "matrix_indices.npy"), matrix.indices)
+        np.save(os.path.join(tmp_path, "matrix_indptr.npy"), matrix.indptr)
+        buffer, offsets = encode_text(terms)
+        with open(os.path.join(tmp_path, "vocab.bin"), "wb") as f:
+            f.write(buffer.tobytes())
+        np.save(os.path.join(tmp_path, "vocab_offsets.npy"), offsets)
+        if params["use_idf"]:
+            np.save(os.path.join(tmp_path, "idf.npy"), np.asarray(vectorizer.idf_))
+        stop_words = vectorizer.get_stop_words()
+        if stop_words is not None:
+            with open(os.path.join(tmp_path, "stop_words.txt"), "w", encoding="utf-8") as f:
+                f.write("\n".join(sorted(stop_words)))
+        for field, (buffer, offsets) in store.text_columns.items():
+            with open(os.path.join(tmp_path, f"tickets_{field}.bin"), "wb") as f:
+                f.write(buffer.tobytes())
+            np.save(os.path.join(tmp_path, f"tickets_{field}_offsets.npy"), offsets)
+        for field, (codes, _) in store.categorical_columns.items():
+            np.save(os.path.join(tmp_path, f"tickets_{field}_codes.npy"), codes)
+        keywords = store.keyword_index()
+        np.save(os.path.join(tmp_path, "keyword_ids.npy"), keywords.token_ids)
+        np.save(os.path.join(tmp_path, "keyword_offsets.npy"), keywords.offsets)
+        if "category" in store.fields:
+            rows, offsets = store.partition("category")
+            np.save(os.path.join(tmp_path, "category_rows.npy"), rows)
+            np.save(os.path.join(tmp_path, "category_offsets.npy"), offsets)
+            # Each category's rows are then one contiguous, memory-mapped slice
+            category_matrix = matrix[rows]
+            np.save(os.path.join(tmp_path, "category_matrix_data.npy"), category_matrix.data)
+            np.save(os.path.join(tmp_path, "category_matrix_indices.npy"), category_matrix.indices)
+            np.save(os.path.join(tmp_path, "category_matrix_indptr.npy"), category_matrix.indptr)
+        manifest = {
+            "format_version": FORMAT_VERSION,
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "num_tickets": len(store),
+            "ticket_fields": store.fields,
+            "categorical_fields": {
+                field: labels for field, (_, labels) in store.categorical_columns.items()
+            },
+            "matrix_shape": list(matrix.shape),
+            "matrix_nnz": int(matrix.nnz),
+            "vectorizer": params,
+        }
+        if build_config is not None:
+            manifest["build"] = {
+                "name": build_config["name"],
+                "category_weight": build_config["category_weight"],
+            }
+        with open(os.path.join(tmp_path, MANIFEST_NAME), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        os.rename(tmp_path, version_dir)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
+    return version_dir
+def publish_kb_version(path: str, version_dir: str):
+    """
+    Make version_dir (from write_kb_version) the live version with one atomic
+    rename of CURRENT, then delete versions older than the one it replaces.
+    That one is kept for readers that resolved CURRENT just before the swap;
+    workers still serving an older version keep its memory-mapped files until
+    they reload. The caller holds kb_write_lock(path).
+    A version written without a delta log (a rebuild rather than a merge)
+    takes over the replaced version's log, so tickets ingested but not yet
+    merged are not lost.
+    """
+    previous = live_kb_dir(path)
+    previous_log = os.path.join(previous, DELTA_LOG_NAME)
+    if os.path.exists(previous_log) and not os.path.exists(os.path.join(version_dir, DELTA_LOG_NAME)):
+        shutil.copyfile(previous_log, os.path.join(version_dir, DELTA_LOG_NAME))
+    tmp_path = os.path.join(path, f"{CURRENT_NAME}.tmp-{os.getpid()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(version_dir))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(path, CURRENT_NAME))
+    _prune_versions(path, previous)
+def _is_layout_file(name: str) -> bool:
+    """Whether name is one of the files a version's layout consists of (not its delta log)."""
+    return (
+        name in (MANIFEST_NAME, "vocab.bin", "stop_words.txt")
+        or name.endswith(".npy")
+        or (name.startswith("tickets_") and name.endswith(".bin"))
+    )
+def _prune_versions(path: str, previous: str):
+    if previous == path:
+        if not os.path.isfile(os.path.join(path, MANIFEST_NAME)):
+            return
+        # Replacing an unversioned layout: its files are no longer read.
+        # Open memory maps keep them alive until they are released. Anything
+        # else, such as its delta log, is left in place
+        for name in os.listdir(path):
+            file_path = os.path.join(path, name)
+            if _is_layout_file(name) and os.path.isfile(file_path):
+                os.remove(file_path)
+        return
+    oldest_kept = os.path.basename(previous)
+    for name in os.listdir(path):
+        # Newer names may be versions another writer has yet to publish
+        if name.startswith(VERSION_PREFIX) and not name.endswith(".tmp") and name < oldest_kept:
+            shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+def read_manifest(path: str) -> Dict:
+    """Manifest of a knowledge base (or version) directory; ValueError for an unsupported format."""
+    path = live_kb_dir(path)
+    with open(os.path.join(path, MANIFEST_NAME), encoding="utf-8") as f:
+        manifest = json.load(f)
+    version = manifest.get("format_version")
+    if not isinstance(version, int) or not 1 <= version <= FORMAT_VERSION:
+        raise ValueError(f"Unsupported knowledge base format version {version} in {path}")
+    return manifest
+def load_kb_dir(path: str, mmap: bool = True) -> Tuple[TicketStore, TfidfModel, sp.csr_matrix]:
+    """
+    Load (tickets, vectorizer, tfidf_matrix) from the live version of a
+    knowledge base directory, or from a version directory.
+    With mmap=True the matrix and ticket arrays stay memory-mapped read-only.
+    Directories of an older format version are migrated in memory: indexes
+    they predate are built on first use, so rebuild them to skip that work.
+    """
+    path = live_kb_dir(path)
+    manifest = read_manifest(path)
+    version = manifest["format_version"]
+    if version < FORMAT_VERSION:
+        logger.info(
+            f"Knowledge base {path} has format version {version} (current {FORMAT_VERSION}); "
+            "indexes it lacks are built in memory until it is saved again"
+        )
+    mmap_mode = "r" if mmap else None
+    def load_array(name):
+        return np.load(os.path.join(path, name), mmap_mode=mmap_mode)
+    tfidf_matrix = sp.csr_matrix(
+        (
+            load_array("matrix_data.npy"),
+            load_array("matrix_indices.npy"),
+            load_array("matrix_indptr.npy"),
+        ),
+        shape=tuple(manifest["matrix_shape"]),
+        copy=False,
+    )
+    with open(os.path.join(path, "vocab.bin"), "rb") as f:
+        terms = _decode_strings(f.read(), load_array("vocab_offsets.npy"))
+    params = manifest["vectorizer"]
+    idf = np.load(os.path.join(path, "idf.npy")) if params["use_idf"] else None
+    stop_words = None
+    if os.path.exists(os.path.join(path, "stop_words.txt")):
+        with open(os.path.join(path, "stop_words.txt"), encoding="utf-8") as f:
+            stop_words = f.read().split("\n")
+    vectorizer = TfidfModel(params, terms, idf, stop_words)
+    # Before version 2 every field was stored as text
+    categorical = manifest["categorical_fields"] if version >= 2 else {}
+    text_columns = {}
+    categorical_columns = {}
+    for field in manifest["ticket_fields"]:
+        if field in categorical:
+            categorical_columns[field] = (
+                load_array(f"tickets_{field}_codes.npy"),
+                categorical[field],
+            )
+        else:
+            text_columns[field] = (
+                _load_buffer(os.path.join(path, f"tickets_{field}.bin"), mmap),
+                load_array(f"tickets_{field}_offsets.npy"),
+            )
+    tickets = TicketStore(
+        manifest["ticket_fields"], manifest["num_tickets"], text_columns, categorical_columns
+    )
+    if version >= 3:
+        tickets.keywords = KeywordIndex(
+            load_array("keyword_ids.npy"), load_array("keyword_offsets.npy")
+        )
+    if version >= 4 and "category" in manifest["ticket_fields"]:
+        tickets.partitions["category"] = (
+            load_array("category_rows.npy"),
+            load_array("category_offsets.npy"),
+        )
+    return tickets, vectorizer, tfidf_matrix
+def load_category_matrix(path: str, mmap: bool = True) -> Optional[sp.csr_matrix]:
+    """
+    The TF-IDF matrix's rows in category partition order (see
+    retrieval.CategoryPartitions), memory-mapped like the matrix; None for
+    a knowledge base without a category field or written before version 7.
+    """
+    path = live_kb_dir(path)
+    manifest = read_manifest(path)
+    if manifest["format_version"] < 7 or "category" not in manifest["ticket_fields"]:
+        return None
+    mmap_mode = "r" if mmap else None
+    return sp.csr_matrix(
+        tuple(
+            np.load(os.path.join(path, f"category_matrix_{name}.npy"), mmap_mode=mmap_mode)
+            for name in ("data", "indices", "indptr")
+        ),
+        shape=tuple(manifest["matrix_shape"]),
+        copy=False,
+    )
+def migrate_pickle(pickle_path: str, path: str = None) -> str:
+    """Convert a legacy pickle knowledge base to the directory format; returns the directory."""
+    path = path or kb_dir_for(pickle_path)
+    with open(pickle_path, "rb") as f:
+        data = pickle.load(f)
+    save_kb_dir(path, data["tickets"], data["vectorizer"], data["tfidf_matrix"])
+    logger.info(f"Migrated knowledge base {pickle_path} -> {path}")
+    return path
+def pickle_is_newer(pickle_path: str, path: str) -> bool:
+    """True if a legacy pickle was written after the live version of path was, so that version does not reflect it."""
+    if pickle_path == path or not os.path.isfile(pickle_path) or not is_kb_dir(path):
+        return False
+    return os.path.getmtime(pickle_path) > os.path.getmtime(os.path.join(live_kb_dir(path), MANIFEST_NAME))
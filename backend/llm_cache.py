@@ -0,0 +1,202 @@
+"""
+LLM Response Cache
+Caches chat completion text keyed on the normalised prompt, so repeat
+incidents that produce byte-identical prompts skip the model call.
+"""
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+logger = logging.getLogger(__name__)
+def normalize_prompt(text: str) -> str:
+    """Collapse whitespace so formatting-only differences share a cache entry."""
+    return " ".join(text.split())
+def make_cache_key(model: str, messages: List[Dict], **params) -> str:
+    """Stable key for a chat completion request."""
+    payload = {
+        "model": model,
+        "messages": [
+            {"role": m["role"], "content": normalize_prompt(m["content"])}
+            for m in messages
+        ],
+        "params": params,
+    }
+    encoded = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(encoded).hexdigest()
+class MemoryCacheBackend:
+    """In-process LRU cache with TTL expiry."""
+    name = "memory"
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._entries[key] = (value, self._clock() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    def __len__(self) -> int:
+        return len(self._entries)
+class SQLiteCacheBackend:
+    """On-disk LRU cache with TTL expiry; survives restarts and is shared by workers."""
+    name = "sqlite"
+    def __init__(
+        self,
+        path: str,
+        max_entries: int = 10000,
+        ttl_seconds: float = 86400,
+        clock=time.time,
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " last_access REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS llm_cache_last_access ON llm_cache (last_access)"
+        )
+        self._conn.commit()
+    def get(self, key: str) -> Optional[str]:
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] <= now:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                return None
+            self._conn.execute(
+                "UPDATE llm_cache SET last_access = ? WHERE key = ?", (now, key)
+            )
+            self._conn.commit()
+            return row[0]
+    def set(self, key: str, value: str):
+        now = self._clock()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at, last_access)"
+                " VALUES (?, ?, ?, ?)",
+                (key, value, now + self.ttl_seconds, now),
+            )
+            self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (now,))
+            # Evict least recently used entries beyond the size bound
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN ("
+                " SELECT key FROM llm_cache ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM llm_cache")
+            self._conn.commit()
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+class LLMResponseCache:
+    """Read-through cache in front of the chat model with hit/miss accounting."""
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+    def get_or_generate(self, key: str, generate: Callable[[], str]) -> str:
+        """Return the cached reply for key, calling generate() on a miss."""
+        cached = self.lookup(key)
+        if cached is not None:
+            return cached
+        value = generate()
+        self.store(key, value)
+        return value
+    def lookup(self, key: str) -> Optional[str]:
+        """Cached reply for key (counted as a hit or miss), or None."""
+        try:
+            cached = self.backend.get(key)
+        except Exception as e:
+            logger.warning(f"LLM cache read failed: {e}")
+            cached = None
+        with self._lock:
+            if cached is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return cached
+    def store(self, key: str, value: str):
+        """Cache a reply produced after a lookup miss."""
+        try:
+            self.backend.set(key, value)
+        except Exception as e:
+            logger.warning(f"LLM cache write failed: {e}")
+    def clear(self):
+        self.backend.clear()
+    def stats(self) -> Dict:
+        """Cache size and hit rate for /api/metrics."""
+        lookups = self.hits + self.misses
+        return {
+            "backend": self.backend.name,
+            "size": len(self.backend),
+            "max_entries": self.backend.max_entries,
+            "ttl_seconds": self.backend.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+        }
+def create_llm_cache_from_env() -> Optional[LLMResponseCache]:
+    """Build the cache configured by LLM_CACHE_* environment variables."""
+    backend_name = os.getenv("LLM_CACHE_BACKEND", "memory").lower()
+    if backend_name in ("", "none", "off", "disabled"):
+        return None
+    max_entries = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+    ttl_seconds = float(os.getenv("LLM_CACHE_TTL_SECONDS", "3600"))
+    if backend_name == "sqlite":
+        path = os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite3")
+        try:
+            backend = SQLiteCacheBackend(path, max_entries, ttl_seconds)
+        except Exception as e:
+            logger.error(f"Failed to open SQLite LLM cache at {path}: {e}")
+            logger.info("Falling back to in-memory LLM cache")
+            backend = MemoryCacheBackend(max_entries, ttl_seconds)
+    else:
+        backend = MemoryCacheBackend(max_entries, ttl_seconds)
+    logger.info(
+        f"LLM response cache enabled ({backend.name}, max {max_entries} entries, "
+        f"TTL {ttl_seconds:.0f}s)"
+    )
+    return LLMResponseCache(backend)
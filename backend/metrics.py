@@ -1,19 +1,163 @@
 """
 Metrics tracking for RAG service
+Memory is fixed however long the service runs: totals and per-category
+counts are running aggregates, latency and confidence distributions live in
+quantile sketches (see quantile_sketch.py), and only the most recent queries
+are kept, in a ring buffer. The realtime view reads a SlidingWindow over the
+last N queries, updated on every record. Per-stage latencies of the
+resolution pipeline are collected with StageTrace and kept as one sketch per
+(stage, category, method). to_metric_set() exports the same state, plus
+fixed-bucket histograms, for the OpenMetrics endpoint (see openmetrics.py).
+With a MetricsHistory attached, every query is also logged to it for the
+persistent minute and hour trends (see metrics_history.py).
 """
+import os
 import time
-from collections import defaultdict
-from typing import Dict, List, Any
-import statistics
-class MetricsTracker:
-    """Track performance and quality metrics for the RAG service"""
+import threading
+from collections import OrderedDict, defaultdict, deque
+from contextlib import contextmanager
+from typing import Dict, Any, Tuple
+from openmetrics import CONFIDENCE_BUCKETS, LATENCY_BUCKETS, Histogram, MetricSet
+from quantile_sketch import QuantileSketch
+# Queries kept in memory; the largest realtime window
+RECENT_QUERIES = int(os.getenv("METRICS_RECENT_QUERIES", "1000"))
+# Realtime window sizes kept up to date at once (least recently read dropped)
+MAX_REALTIME_WINDOWS = 8
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99)
+# Pipeline stages timed by StageTrace, in pipeline order
+STAGES = (
+    "encoding",
+    "cache_lookup",
+    "scoring",
+    "rerank",
+    "prompt_build",
+    "template",
+    "llm_queue",
+    "llm_generation",
+    "total",
+)
+# Categories come from requests; past this many, stage latencies and exported
+# query counts of new ones are kept under "other" so the number of series
+# stays bounded
+MAX_STAGE_CATEGORIES = 100
+class StageTrace:
+    """
+    Wall time of each pipeline stage of one request, in nanoseconds from
+    time.perf_counter_ns. A stage entered more than once accumulates.
+    """
     def __init__(self):
-        self.queries = []
-        self.response_times = []
-        self.confidence_scores = []
+        self.started_ns = time.perf_counter_ns()
+        self.stages: Dict[str, int] = {}
+    def add(self, stage: str, elapsed_ns: int):
+        self.stages[stage] = self.stages.get(stage, 0) + elapsed_ns
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter_ns() - start)
+    def elapsed_ns(self) -> int:
+        return time.perf_counter_ns() - self.started_ns
+class _NullTrace(StageTrace):
+    """Trace that discards its spans, for callers that pass no trace."""
+    def add(self, stage: str, elapsed_ns: int):
+        pass
+NO_TRACE = _NullTrace()
+class SlidingWindow:
+    """
+    Aggregates over the last `size` queries, kept current as queries arrive:
+    per-category counts and sums, and response time and confidence sketches.
+    Adding a query evicts the oldest, so reads cost O(categories + buckets).
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.entries = deque()
+        self.response_time_sum = 0.0
+        self.confidence_sum = 0.0
+        self.response_times = QuantileSketch()
+        self.confidence_scores = QuantileSketch()
+        # category -> [count, response time sum, confidence sum]
+        self.categories: Dict[str, list] = {}
+    def add(self, category: str, response_time: float, confidence: float):
+        if len(self.entries) == self.size:
+            self._evict()
+        self.entries.append((category, response_time, confidence))
+        self.response_time_sum += response_time
+        self.confidence_sum += confidence
+        self.response_times.add(response_time)
+        self.confidence_scores.add(confidence)
+        totals = self.categories.get(category)
+        if totals is None:
+            totals = self.categories[category] = [0, 0.0, 0.0]
+        totals[0] += 1
+        totals[1] += response_time
+        totals[2] += confidence
+    def _evict(self):
+        category, response_time, confidence = self.entries.popleft()
+        self.response_time_sum -= response_time
+        self.confidence_sum -= confidence
+        self.response_times.remove(response_time)
+        self.confidence_scores.remove(confidence)
+        totals = self.categories[category]
+        if totals[0] == 1:
+            del self.categories[category]
+        else:
+            totals[0] -= 1
+            totals[1] -= response_time
+            totals[2] -= confidence
+    def stats(self) -> Dict[str, Any]:
+        count = len(self.entries)
+        if not count:
+            return {"window": self.size, "recent_queries": 0, "avg_response_time": 0, "avg_confidence": 0}
+        def percentiles(sketch: QuantileSketch) -> Dict[str, float]:
+            return {f"p{round(q * 100)}": value for q, value in sketch.quantiles(SUMMARY_QUANTILES).items()}
+        return {
+            "window": self.size,
+            "recent_queries": count,
+            "avg_response_time": self.response_time_sum / count,
+            "avg_confidence": self.confidence_sum / count,
+            "response_times": percentiles(self.response_times),
+            "confidence_scores": percentiles(self.confidence_scores),
+            "recent_categories": {category: totals[0] for category, totals in self.categories.items()},
+            "category_stats": {
+                category: {
+                    "count": n,
+                    "avg_response_time": response_time_sum / n,
+                    "avg_confidence": confidence_sum / n,
+                }
+                for category, (n, response_time_sum, confidence_sum) in self.categories.items()
+            },
+        }
+class MetricsTracker:
+    """
+    Track performance and quality metrics for the RAG service.
+    Safe to call from concurrent request handlers and worker threads: every
+    update and read holds one lock for a constant amount of work (a sketch
+    read is bounded by its bucket count, never by the number of queries).
+    """
+    def __init__(self, recent_queries: int = RECENT_QUERIES):
+        self._lock = threading.Lock()
+        self.recent_queries = recent_queries
+        # Optional MetricsHistory; kept across reset()
+        self.history = None
+        self._reset()
+    def _reset(self):
+        self.queries = deque(maxlen=self.recent_queries)
+        self._windows: "OrderedDict[int, SlidingWindow]" = OrderedDict()
+        self.query_count = 0
+        self.response_times = QuantileSketch()
+        self.confidence_scores = QuantileSketch()
         self.category_counts = defaultdict(int)
         self.error_count = 0
         self.success_count = 0
+        self.stage_latencies: Dict[Tuple[str, str, str], QuantileSketch] = {}
+        self._stage_categories = set()
+        # Fixed buckets for /metrics; stage histograms leave out the category
+        # to keep the number of exported series small
+        self.response_time_histogram = Histogram(LATENCY_BUCKETS)
+        self.confidence_histogram = Histogram(CONFIDENCE_BUCKETS)
+        self.stage_histograms: Dict[Tuple[str, str], Histogram] = {}
     def record_query(
         self,
         category: str,
@@ -22,99 +166,156 @@ class MetricsTracker:
         success: bool = True,
     ):
         """Record a query with its metrics"""
-        self.queries.append(
-            {
-                "category": category,
-                "response_time": response_time,
-                "confidence": confidence,
-                "success": success,
-                "timestamp": time.time(),
-            }
-        )
-        self.response_times.append(response_time)
-        self.confidence_scores.append(confidence)
-        self.category_counts[category] += 1
-        if success:
-            self.success_count += 1
-        else:
-            self.error_count += 1
+        query = {
+            "category": category,
+            "response_time": response_time,
+            "confidence": confidence,
+            "success": success,
+            "timestamp": time.time(),
+        }
+        with self._lock:
+            self.queries.append(query)
+            for window in self._windows.values():
+                window.add(category, response_time, confidence)
+            self.query_count += 1
+            self.response_times.add(response_time)
+            self.confidence_scores.add(confidence)
+            self.response_time_histogram.observe(response_time / 1000)
+            self.confidence_histogram.observe(confidence)
+            self.category_counts[category] += 1
+            if success:
+                self.success_count += 1
+            else:
+                self.error_count += 1
+        if self.history is not None:
+            self.history.record(category, response_time, confidence, success)
     def record_error(self, category: str = "unknown"):
         """Record an error"""
-        self.error_count += 1
-        self.category_counts[category] += 1
+        with self._lock:
+            self.error_count += 1
+            self.category_counts[category] += 1
+    def record_stages(self, category: str, method: str, trace: StageTrace):
+        """Record a finished request's stage latencies (ms) and its total."""
+        stages = dict(trace.stages)
+        stages["total"] = trace.elapsed_ns()
+        with self._lock:
+            category = self._category_label(category)
+            for stage, elapsed_ns in stages.items():
+                key = (stage, category, method)
+                sketch = self.stage_latencies.get(key)
+                if sketch is None:
+                    sketch = self.stage_latencies[key] = QuantileSketch()
+                sketch.add(elapsed_ns / 1e6)
+                histogram = self.stage_histograms.get((stage, method))
+                if histogram is None:
+                    histogram = self.stage_histograms[(stage, method)] = Histogram(LATENCY_BUCKETS)
+                histogram.observe(elapsed_ns / 1e9)
+    def _category_label(self, category: str) -> str:
+        """category, or "other" once MAX_STAGE_CATEGORIES others are in use (caller holds _lock)."""
+        if category not in self._stage_categories:
+            if len(self._stage_categories) >= MAX_STAGE_CATEGORIES:
+                return "other"
+            self._stage_categories.add(category)
+        return category
+    def _stage_summary(self) -> Dict[str, Any]:
+        """Per-stage latency distributions, overall and by method and category."""
+        merged = {}
+        for (stage, category, method), sketch in self.stage_latencies.items():
+            groups = merged.setdefault(stage, {"all": QuantileSketch(), "by_method": {}, "by_category": {}})
+            groups["all"].merge(sketch)
+            groups["by_method"].setdefault(method, QuantileSketch()).merge(sketch)
+            groups["by_category"].setdefault(category, QuantileSketch()).merge(sketch)
+        order = {stage: i for i, stage in enumerate(STAGES)}
+        summary = {}
+        for stage in sorted(merged, key=lambda s: order.get(s, len(order))):
+            groups = merged[stage]
+            summary[stage] = {
+                **self._distribution(groups["all"]),
+                "by_method": {m: self._distribution(s) for m, s in groups["by_method"].items()},
+                "by_category": {c: self._distribution(s) for c, s in groups["by_category"].items()},
+            }
+        return summary
+    @staticmethod
+    def _distribution(sketch: QuantileSketch) -> Dict[str, float]:
+        quantiles = sketch.quantiles(SUMMARY_QUANTILES)
+        return {
+            "count": sketch.count,
+            "avg": sketch.mean,
+            "min": sketch.min,
+            "max": sketch.max,
+            "median": quantiles[0.5],
+            **{f"p{round(q * 100)}": value for q, value in quantiles.items()},
+        }
     def get_summary(self) -> Dict[str, Any]:
         """Get comprehensive metrics summary"""
-        total_queries = len(self.queries)
-        if total_queries == 0:
+        with self._lock:
+            total_queries = self.query_count
+            if total_queries == 0:
+                return {
+                    "total_queries": 0,
+                    "success_rate": 0,
+                    "avg_response_time": 0,
+                    "avg_confidence": 0,
+                    "category_distribution": {},
+                    "stage_latency_ms": self._stage_summary(),
+                }
             return {
-                "total_queries": 0,
-                "success_rate": 0,
-                "avg_response_time": 0,
-                "avg_confidence": 0,
-                "category_distribution": {},
+                "total_queries": total_queries,
+                "success_count": self.success_count,
+                "error_count": self.error_count,
+                "success_rate": self.success_count / total_queries,
+                "response_times": self._distribution(self.response_times),
+                "confidence_scores": self._distribution(self.confidence_scores),
+                "category_distribution": dict(self.category_counts),
+                "stage_latency_ms": self._stage_summary(),
             }
-        return {
-            "total_queries": total_queries,
-            "success_count": self.success_count,
-            "error_count": self.error_count,
-            "success_rate": (
-                self.success_count / total_queries if total_queries > 0 else 0
-            ),
-            "response_times": {
-                "avg": (
-                    statistics.mean(self.response_times) if self.response_times else 0
-                ),
-                "min": min(self.response_times) if self.response_times else 0,
-                "max": max(self.response_times) if self.response_times else 0,
-                "median": (
-                    statistics.median(self.response_times) if self.response_times else 0
-                ),
-            },
-            "confidence_scores": {
-                "avg": (
-                    statistics.mean(self.confidence_scores)
-                    if self.confidence_scores
-                    else 0
-                ),
-                "min": min(self.confidence_scores) if self.confidence_scores else 0,
-                "max": max(self.confidence_scores) if self.confidence_scores else 0,
-            },
-            "category_distribution": dict(self.category_counts),
-        }
+    def to_metric_set(self) -> MetricSet:
+        """Counters and histograms for the OpenMetrics endpoint."""
+        metric_set = MetricSet()
+        with self._lock:
+            for outcome, count in (("success", self.success_count), ("error", self.error_count)):
+                metric_set.counter("rag_queries", "Resolution requests by outcome", count, {"outcome": outcome})
+            category_counts = defaultdict(int)
+            for category, count in self.category_counts.items():
+                category_counts[self._category_label(category)] += count
+            for category, count in category_counts.items():
+                metric_set.counter(
+                    "rag_category_queries", "Resolution requests by ticket category", count, {"category": category}
+                )
+            metric_set.histogram(
+                "rag_response_time_seconds", "End-to-end resolution time", self.response_time_histogram
+            )
+            metric_set.histogram("rag_confidence", "Confidence of returned resolutions", self.confidence_histogram)
+            for (stage, method), histogram in self.stage_histograms.items():
+                metric_set.histogram(
+                    "rag_stage_duration_seconds",
+                    "Time spent in each resolution pipeline stage",
+                    histogram,
+                    {"stage": stage, "method": method},
+                )
+        return metric_set
     def get_realtime_stats(self, limit: int = 100) -> Dict[str, Any]:
-        """Get real-time stats for the last N queries"""
-        recent_queries = (
-            self.queries[-limit:] if len(self.queries) > limit else self.queries
-        )
-        if not recent_queries:
-            return {"recent_queries": 0, "avg_response_time": 0, "avg_confidence": 0}
-        recent_response_times = [q["response_time"] for q in recent_queries]
-        recent_confidences = [q["confidence"] for q in recent_queries]
-        return {
-            "recent_queries": len(recent_queries),
-            "avg_response_time": (
-                statistics.mean(recent_response_times) if recent_response_times else 0
-            ),
-            "avg_confidence": (
-                statistics.mean(recent_confidences) if recent_confidences else 0
-            ),
-            "recent_categories": defaultdict(
-                int,
-                {
-                    q["category"]: sum(
-                        1 for x in recent_queries if x["category"] == q["category"]
-                    )
-                    for q in recent_queries
-                },
-            ),
-        }
+        """
+        Real-time stats for the last `limit` queries (at most the number kept
+        in memory). The first read of a window size builds it from the recent
+        queries; after that it is updated as queries are recorded.
+        """
+        limit = max(1, min(limit, self.recent_queries))
+        with self._lock:
+            window = self._windows.get(limit)
+            if window is None:
+                window = SlidingWindow(limit)
+                for query in list(self.queries)[-limit:]:
+                    window.add(query["category"], query["response_time"], query["confidence"])
+                self._windows[limit] = window
+                if len(self._windows) > MAX_REALTIME_WINDOWS:
+                    self._windows.popitem(last=False)
+            else:
+                self._windows.move_to_end(limit)
+            return window.stats()
     def reset(self):
         """Reset all metrics"""
-        self.queries = []
-        self.response_times = []
-        self.confidence_scores = []
-        self.category_counts = defaultdict(int)
-        self.error_count = 0
-        self.success_count = 0
+        with self._lock:
+            self._reset()
 # Global metrics tracker instance
 metrics_tracker = MetricsTracker()
@@ -0,0 +1,311 @@
+"""
+Metrics History
+Persistent query metrics in one SQLite database (WAL mode) shared by every
+worker and surviving restarts. Recorded queries are buffered in memory and
+appended to an events table in batches; a background pass folds events not
+yet rolled up into 1-minute and 1-hour buckets, each holding counts, sums and
+mergeable latency/confidence sketches (quantile_sketch.py). Rollups advance
+by event id rather than time, so events a worker flushes late still land in
+their bucket. Raw events and minute buckets are pruned after their
+retention, so months of trends take a few rows per hour. history() reads
+only the rollups.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, List, Optional
+from quantile_sketch import QuantileSketch
+logger = logging.getLogger(__name__)
+MINUTE = 60
+HOUR = 3600
+RESOLUTIONS = (MINUTE, HOUR)
+# Largest number of points history() returns
+MAX_HISTORY_POINTS = 10000
+# Events kept in memory while the database cannot be written; the oldest go first
+MAX_BUFFERED_EVENTS = 100000
+HISTORY_QUANTILES = (0.5, 0.9, 0.99)
+class _Bucket:
+    """Aggregates of one rollup bucket."""
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.response_time_max = 0.0
+        self.response_times = QuantileSketch()
+        self.confidence_scores = QuantileSketch()
+        self.categories: Dict[str, int] = {}
+    def add_event(self, category: str, response_time: float, confidence: float, success: bool):
+        self.count += 1
+        self.errors += 0 if success else 1
+        self.response_time_max = max(self.response_time_max, response_time)
+        self.response_times.add(response_time)
+        self.confidence_scores.add(confidence)
+        self.categories[category] = self.categories.get(category, 0) + 1
+    def merge_row(self, row: tuple):
+        count, errors, response_time_max, response_times, confidence_scores, categories = row
+        self.count += count
+        self.errors += errors
+        self.response_time_max = max(self.response_time_max, response_time_max)
+        self.response_times.merge(QuantileSketch.from_dict(json.loads(response_times)))
+        self.confidence_scores.merge(QuantileSketch.from_dict(json.loads(confidence_scores)))
+        for category, n in json.loads(categories).items():
+            self.categories[category] = self.categories.get(category, 0) + n
+    def to_row(self) -> tuple:
+        return (
+            self.count,
+            self.errors,
+            self.response_time_max,
+            json.dumps(self.response_times.to_dict(), separators=(",", ":")),
+            json.dumps(self.confidence_scores.to_dict(), separators=(",", ":")),
+            json.dumps(self.categories, separators=(",", ":")),
+        )
+    def to_point(self, start: float) -> Dict:
+        response_quantiles = self.response_times.quantiles(HISTORY_QUANTILES)
+        return {
+            "start": start,
+            "count": self.count,
+            "errors": self.errors,
+            "avg_response_time": self.response_times.mean,
+            "max_response_time": self.response_time_max,
+            **{f"p{round(q * 100)}_response_time": value for q, value in response_quantiles.items()},
+            "avg_confidence": self.confidence_scores.mean,
+            "p50_confidence": self.confidence_scores.quantile(0.5),
+            "categories": self.categories,
+        }
+class MetricsHistory:
+    """
+    Append-only metrics log with 1-minute and 1-hour rollups.
+    record() only appends to a buffer; flush() writes it and rolls up, and
+    start() runs flush() every flush_seconds on a daemon thread. A batch that
+    cannot be written stays buffered for the next flush. The database is
+    opened on first use, so constructing one has no side effects.
+    """
+    def __init__(
+        self,
+        path: str,
+        flush_seconds: float = 5,
+        raw_retention_seconds: float = 2 * 86400,
+        minute_retention_seconds: float = 14 * 86400,
+        hour_retention_seconds: float = 400 * 86400,
+        clock=time.time,
+    ):
+        self.path = path
+        self.flush_seconds = flush_seconds
+        self.raw_retention_seconds = raw_retention_seconds
+        self.minute_retention_seconds = minute_retention_seconds
+        self.hour_retention_seconds = hour_retention_seconds
+        self._clock = clock
+        self._buffer: List[tuple] = []
+        self._buffer_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._stop = threading.Event()
+        self._thread = None
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS metric_events ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " ts REAL NOT NULL,"
+                " category TEXT NOT NULL,"
+                " response_time REAL NOT NULL,"
+                " confidence REAL NOT NULL,"
+                " success INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS metric_events_ts ON metric_events (ts)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS metric_rollups ("
+                " resolution INTEGER NOT NULL,"
+                " bucket REAL NOT NULL,"
+                " count INTEGER NOT NULL,"
+                " errors INTEGER NOT NULL,"
+                " response_time_max REAL NOT NULL,"
+                " response_times TEXT NOT NULL,"
+                " confidence_scores TEXT NOT NULL,"
+                " categories TEXT NOT NULL,"
+                " PRIMARY KEY (resolution, bucket))"
+            )
+            # Id of the last event folded into the rollups
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS metric_rollup_state ("
+                " id INTEGER PRIMARY KEY CHECK (id = 0),"
+                " last_event_id INTEGER NOT NULL)"
+            )
+            conn.commit()
+            self._conn = conn
+        return self._conn
+    def record(self, category: str, response_time: float, confidence: float, success: bool = True):
+        """Buffer one query (response time in ms); written on the next flush."""
+        event = (self._clock(), category, float(response_time), float(confidence), 1 if success else 0)
+        with self._buffer_lock:
+            self._buffer.append(event)
+    def flush(self):
+        """Write buffered events, fold them into the rollups and prune old data."""
+        with self._buffer_lock:
+            events, self._buffer = self._buffer, []
+        with self._lock:
+            try:
+                conn = self._connect()
+                if events:
+                    with conn:
+                        conn.executemany(
+                            "INSERT INTO metric_events (ts, category, response_time, confidence, success)"
+                            " VALUES (?, ?, ?, ?, ?)",
+                            events,
+                        )
+            except Exception as e:
+                logger.warning(
+                    f"Could not write {len(events)} metrics history events, "
+                    f"retrying on the next flush: {e}"
+                )
+                self._requeue(events)
+                raise
+            # BEGIN IMMEDIATE: one worker at a time folds events into the rollups
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                last_event_id = self._roll_up(conn)
+                self._prune(conn, self._clock(), last_event_id)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+    def _requeue(self, events: List[tuple]):
+        with self._buffer_lock:
+            self._buffer[:0] = events
+            dropped = len(self._buffer) - MAX_BUFFERED_EVENTS
+            if dropped > 0:
+                del self._buffer[:dropped]
+                logger.warning(f"Metrics history buffer full, dropped the {dropped} oldest events")
+    def _store(self, conn: sqlite3.Connection, resolution: int, buckets: Dict[float, _Bucket]):
+        for start, bucket in buckets.items():
+            # The bucket may already hold earlier events
+            row = conn.execute(
+                "SELECT count, errors, response_time_max, response_times, confidence_scores, categories"
+                " FROM metric_rollups WHERE resolution = ? AND bucket = ?",
+                (resolution, start),
+            ).fetchone()
+            if row is not None:
+                bucket.merge_row(row)
+            conn.execute(
+                "INSERT OR REPLACE INTO metric_rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (resolution, start, *bucket.to_row()),
+            )
+    def _roll_up(self, conn: sqlite3.Connection) -> int:
+        """Fold events added since the last pass into their buckets; returns the last event id."""
+        row = conn.execute("SELECT last_event_id FROM metric_rollup_state WHERE id = 0").fetchone()
+        last_event_id = row[0] if row else 0
+        buckets = {resolution: {} for resolution in RESOLUTIONS}
+        for event_id, ts, category, response_time, confidence, success in conn.execute(
+            "SELECT id, ts, category, response_time, confidence, success FROM metric_events"
+            " WHERE id > ? ORDER BY id",
+            (last_event_id,),
+        ):
+            for resolution in RESOLUTIONS:
+                start = ts // resolution * resolution
+                bucket = buckets[resolution].get(start)
+                if bucket is None:
+                    bucket = buckets[resolution][start] = _Bucket()
+                bucket.add_event(category, response_time, confidence, bool(success))
+            last_event_id = event_id
+        for resolution in RESOLUTIONS:
+            self._store(conn, resolution, buckets[resolution])
+        conn.execute(
+            "INSERT OR REPLACE INTO metric_rollup_state (id, last_event_id) VALUES (0, ?)",
+            (last_event_id,),
+        )
+        return last_event_id
+    def _prune(self, conn: sqlite3.Connection, now: float, last_event_id: int):
+        conn.execute(
+            "DELETE FROM metric_events WHERE id <= ? AND ts < ?",
+            (last_event_id, now - self.raw_retention_seconds),
+        )
+        for resolution, retention in (
+            (MINUTE, self.minute_retention_seconds),
+            (HOUR, self.hour_retention_seconds),
+        ):
+            conn.execute(
+                "DELETE FROM metric_rollups WHERE resolution = ? AND bucket < ?",
+                (resolution, now - retention),
+            )
+    def history(self, start: float, end: float, step: int) -> Dict:
+        """
+        Points of `step` seconds from start to end, aggregated from the hour
+        rollups when step is a whole number of hours, else the minute rollups.
+        Raises ValueError for a step that is not a positive multiple of 60 s,
+        a range needing more than MAX_HISTORY_POINTS points, or a sub-hour step
+        from before the minute rollups' retention (they would already be pruned).
+        """
+        if step <= 0 or step % MINUTE:
+            raise ValueError("step must be a positive multiple of 60 seconds")
+        if end <= start:
+            raise ValueError("to must be after from")
+        if (end - start) / step > MAX_HISTORY_POINTS:
+            raise ValueError(f"Range needs more than {MAX_HISTORY_POINTS} points; use a larger step")
+        resolution = HOUR if step % HOUR == 0 else MINUTE
+        if resolution == MINUTE and start < self._clock() - self.minute_retention_seconds:
+            raise ValueError(
+                f"Minute rollups are kept for {self.minute_retention_seconds / 86400:g} days;"
+                " use a step that is a whole number of hours for older ranges"
+            )
+        points: Dict[int, _Bucket] = {}
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                "SELECT bucket, count, errors, response_time_max, response_times, confidence_scores, categories"
+                " FROM metric_rollups WHERE resolution = ? AND bucket >= ? AND bucket < ?"
+                " ORDER BY bucket",
+                (resolution, start // resolution * resolution, end),
+            ).fetchall()
+        for row in rows:
+            index = int((max(row[0], start) - start) // step)
+            bucket = points.get(index)
+            if bucket is None:
+                bucket = points[index] = _Bucket()
+            bucket.merge_row(row[1:])
+        return {
+            "from": start,
+            "to": end,
+            "step": step,
+            "resolution": resolution,
+            "points": [points[index].to_point(start + index * step) for index in sorted(points)],
+        }
+    def start(self):
+        """Flush every flush_seconds from a daemon thread."""
+        def run():
+            while not self._stop.wait(self.flush_seconds):
+                try:
+                    self.flush()
+                except Exception as e:
+                    logger.warning(f"Failed to flush metrics history: {e}")
+        self._thread = threading.Thread(target=run, name="metrics-history", daemon=True)
+        self._thread.start()
+    def close(self):
+        """Stop the flush thread and write what is still buffered."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_seconds + 5)
+        try:
+            self.flush()
+        except Exception as e:
+            logger.warning(f"Failed to flush metrics history: {e}")
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+def create_metrics_history_from_env() -> Optional[MetricsHistory]:
+    """MetricsHistory at METRICS_HISTORY_PATH, or None (disabled) while that is unset."""
+    path = os.getenv("METRICS_HISTORY_PATH", "")
+    if path.lower() in ("", "none", "off", "disabled"):
+        return None
+    return MetricsHistory(
+        path,
+        flush_seconds=float(os.getenv("METRICS_FLUSH_SECONDS", "5")),
+        raw_retention_seconds=float(os.getenv("METRICS_RAW_RETENTION_HOURS", "48")) * 3600,
+    )
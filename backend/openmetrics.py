@@ -0,0 +1,207 @@
+"""
+OpenMetrics Exposition
+Pre-aggregated metric families rendered in the OpenMetrics text format for
+GET /metrics. A MetricSet holds counters, gauges and fixed-bucket histograms
+keyed by label set, so rendering costs O(number of series) however many
+queries were recorded. Under several uvicorn workers each worker publishes
+its MetricSet to a FileRegistry directory and a scrape merges them: counters
+and histograms add up, gauges add up or take the maximum as declared.
+Histograms are classic ones with fixed buckets rather than native (sparse)
+histograms: the OpenMetrics 1.0 text format cannot carry native histograms,
+which Prometheus only scrapes through its protobuf format.
+"""
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+logger = logging.getLogger(__name__)
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+# Upper bounds (seconds) for latency histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONFIDENCE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1)
+class Histogram:
+    """Fixed-bucket histogram; counts[i] holds values <= bounds[i] and above bounds[i - 1]."""
+    def __init__(self, bounds: Sequence[float]):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+    def to_dict(self) -> Dict:
+        return {"bounds": list(self.bounds), "counts": list(self.counts), "sum": self.sum}
+def _label_key(labels: Dict[str, str]) -> str:
+    return json.dumps(sorted((name, str(value)) for name, value in labels.items()))
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+def _format_labels(pairs: List[Tuple[str, str]]) -> str:
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+def _format_value(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return str(value)
+class MetricSet:
+    """
+    Metric families by name: type (counter, gauge or histogram), help text,
+    merge mode for gauges ("sum" or "max") and samples by label set.
+    Serialises to JSON for FileRegistry.
+    """
+    def __init__(self):
+        self.families: Dict[str, Dict] = {}
+    def _family(self, name: str, kind: str, help_text: str, merge: str = "sum") -> Dict:
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = {"type": kind, "help": help_text, "merge": merge, "samples": {}}
+        return family
+    def counter(self, name: str, help_text: str, value: float, labels: Dict[str, str] = None):
+        self._family(name, "counter", help_text)["samples"][_label_key(labels or {})] = value
+    def gauge(self, name: str, help_text: str, value: float, labels: Dict[str, str] = None, merge: str = "sum"):
+        self._family(name, "gauge", help_text, merge)["samples"][_label_key(labels or {})] = value
+    def histogram(self, name: str, help_text: str, histogram: Histogram, labels: Dict[str, str] = None):
+        self._family(name, "histogram", help_text)["samples"][_label_key(labels or {})] = histogram.to_dict()
+    def merge(self, other: "MetricSet"):
+        """Add another worker's families into this set."""
+        for name, theirs in other.families.items():
+            ours = self._family(name, theirs["type"], theirs["help"], theirs["merge"])
+            samples = ours["samples"]
+            for key, value in theirs["samples"].items():
+                current = samples.get(key)
+                if current is None:
+                    samples[key] = json.loads(json.dumps(value)) if isinstance(value, dict) else value
+                elif theirs["type"] == "histogram":
+                    if current["bounds"] != value["bounds"]:
+                        raise ValueError(f"Histogram {name} has different buckets across workers")
+                    current["counts"] = [a + b for a, b in zip(current["counts"], value["counts"])]
+                    current["sum"] += value["sum"]
+                elif ours["merge"] == "max":
+                    samples[key] = max(current, value)
+                else:
+                    samples[key] = current + value
+    def to_dict(self) -> Dict:
+        return {"families": self.families}
+    @classmethod
+    def from_dict(cls, data: Dict) -> "MetricSet":
+        metric_set = cls()
+        metric_set.families = data["families"]
+        return metric_set
+    def render(self) -> str:
+        """OpenMetrics text exposition, ending with # EOF."""
+        lines = []
+        for name, family in self.families.items():
+            kind = family["type"]
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"# HELP {name} {_escape(family['help'])}")
+            for key in sorted(family["samples"]):
+                pairs = [tuple(pair) for pair in json.loads(key)]
+                value = family["samples"][key]
+                if kind == "counter":
+                    lines.append(f"{name}_total{_format_labels(pairs)} {_format_value(value)}")
+                elif kind == "gauge":
+                    lines.append(f"{name}{_format_labels(pairs)} {_format_value(value)}")
+                else:
+                    cumulative = 0
+                    bounds = [_format_value(float(b)) for b in value["bounds"]] + ["+Inf"]
+                    for bound, count in zip(bounds, value["counts"]):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(pairs + [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_count{_format_labels(pairs)} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(pairs)} {_format_value(value['sum'])}")
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+class FileRegistry:
+    """
+    Shares MetricSets between worker processes through a directory: each
+    worker writes worker_<pid>_<instance>.json (atomically, by rename) and
+    collect() merges the files of running workers. The random instance id
+    keeps a worker that reuses an exited worker's pid from being mistaken
+    for it. A worker removes its file on stop(), and collect() removes the
+    files of workers that exited without stopping, so restarted workers do
+    not pile up; their series restart from zero, which Prometheus reads as a
+    counter reset.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.instance = uuid.uuid4().hex[:12]
+        self.path = os.path.join(directory, f"worker_{os.getpid()}_{self.instance}.json")
+        self._thread = None
+        self._stop = threading.Event()
+    def publish(self, metric_set: MetricSet):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "pid": os.getpid(),
+                    "instance": self.instance,
+                    "updated_at": time.time(),
+                    **metric_set.to_dict(),
+                },
+                f,
+            )
+        os.replace(tmp_path, self.path)
+    def collect(self) -> MetricSet:
+        """Merged MetricSet of every worker that has published (reads files: keep off the event loop)."""
+        merged = MetricSet()
+        for name in sorted(os.listdir(self.directory)):
+            if not (name.startswith("worker_") and name.endswith(".json")):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics file {name}: {e}")
+                continue
+            pid = data.get("pid")
+            if pid == os.getpid():
+                # Our pid in another file belonged to an exited process
+                alive = data.get("instance") == self.instance
+            else:
+                alive = isinstance(pid, int) and _pid_alive(pid)
+            if not alive:
+                _remove(path)
+                continue
+            merged.merge(MetricSet.from_dict(data))
+        return merged
+    def start(self, snapshot: Callable[[], MetricSet], interval: float):
+        """Publish snapshot() every interval seconds from a daemon thread."""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.publish(snapshot())
+                except Exception as e:
+                    logger.warning(f"Failed to publish worker metrics: {e}")
+        self._thread = threading.Thread(target=run, name="metrics-publisher", daemon=True)
+        self._thread.start()
+    def stop(self):
+        """Stop publishing and remove this worker's file."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        _remove(self.path)
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+def create_registry_from_env():
+    """FileRegistry in METRICS_MULTIPROC_DIR, or None for a single worker."""
+    directory = os.getenv("METRICS_MULTIPROC_DIR")
+    return FileRegistry(directory) if directory else None
@@ -0,0 +1,197 @@
+"""
+Parallel TF-IDF
+Process-pool, out-of-core replacement for TfidfVectorizer.fit_transform in the
+knowledge base builder. Texts are cut into shards that are spilled to a
+temporary directory as they stream in; workers tokenise and count each shard,
+the per-shard document/term frequency tables are merged, the vocabulary is
+pruned exactly as CountVectorizer does (min_df, max_df, max_features), and
+workers then transform the shards into CSR blocks that are stacked in order.
+The fitted vectorizer and matrix equal those of a single-process fit_transform.
+"""
+import os
+import time
+import numbers
+import pickle
+import logging
+import tempfile
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterable, List, Tuple
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from kb_store import fitted_vectorizer
+logger = logging.getLogger(__name__)
+SHARD_ROWS = 20_000
+# Worker state for the transform pass, set by _init_transform_worker
+_worker_vectorizer = None
+def _load_shard(path: str) -> List[str]:
+    with open(path, "rb") as f:
+        return pickle.load(f)
+def _count_shard(params: Dict, path: str) -> Tuple[int, Counter, Counter, float]:
+    """(documents, document frequencies, term frequencies, seconds) for one shard."""
+    start_time = time.perf_counter()
+    texts = _load_shard(path)
+    analyze = TfidfVectorizer(**params).build_analyzer()
+    doc_freq = Counter()
+    term_freq = Counter()
+    for text in texts:
+        terms = analyze(text)
+        term_freq.update(terms)
+        doc_freq.update(set(terms))
+    return len(texts), doc_freq, term_freq, time.perf_counter() - start_time
+def _init_transform_worker(params: Dict, terms: List[str], idf):
+    global _worker_vectorizer
+    _worker_vectorizer = fitted_vectorizer(TfidfVectorizer(**params), terms, idf)
+def _transform_shard(path: str) -> Tuple[sp.csr_matrix, float]:
+    start_time = time.perf_counter()
+    matrix = _worker_vectorizer.transform(_load_shard(path))
+    return matrix, time.perf_counter() - start_time
+class ParallelTfidf:
+    """
+    fit_transform for a TfidfVectorizer spread over a process pool.
+    Only memory for the merged frequency tables and the output matrix grows
+    with the corpus; texts live on disk between the two passes. After
+    fit_transform(), stats holds timings. parallelism (busy_seconds, the
+    summed worker time, over wall_seconds) is how many workers were busy on
+    average: a parallel-efficiency estimate, not a measured speedup, since
+    workers contend for the machine and spilling and merging in this
+    process are not counted as busy. scripts/bench_kb_build.py
+    --compare-single measures the speedup over a single-process fit.
+    """
+    def __init__(
+        self,
+        vectorizer: TfidfVectorizer,
+        workers: int = None,
+        shard_rows: int = SHARD_ROWS,
+        tmp_dir: str = None,
+    ):
+        if vectorizer.vocabulary is not None:
+            raise ValueError("ParallelTfidf fits a vocabulary; the vectorizer has a fixed one")
+        self.params = vectorizer.get_params()
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_rows = shard_rows
+        self.tmp_dir = tmp_dir
+        self.stats = {}
+    def fit_transform(self, texts: Iterable[str]) -> Tuple[TfidfVectorizer, sp.csr_matrix]:
+        """Fitted vectorizer and TF-IDF matrix for texts, which is consumed once."""
+        start_time = time.perf_counter()
+        with tempfile.TemporaryDirectory(prefix="tfidf-shards-", dir=self.tmp_dir) as tmp:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                shards, n_docs, doc_freq, term_freq, count_busy = self._count(pool, texts, tmp)
+            count_time = time.perf_counter() - start_time
+            terms, idf = self._select_vocabulary(n_docs, doc_freq, term_freq)
+            del doc_freq, term_freq
+            transform_start = time.perf_counter()
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_transform_worker,
+                initargs=(self.params, terms, idf),
+            ) as pool:
+                results = list(pool.map(_transform_shard, shards))
+        blocks = [matrix for matrix, _ in results]
+        matrix = (
+            sp.vstack(blocks, format="csr")
+            if blocks
+            else sp.csr_matrix((0, len(terms)), dtype=self.params["dtype"])
+        )
+        wall = time.perf_counter() - start_time
+        busy = count_busy + sum(seconds for _, seconds in results)
+        self.stats = {
+            "documents": n_docs,
+            "shards": len(shards),
+            "workers": self.workers,
+            "cpu_count": os.cpu_count(),
+            "count_seconds": round(count_time, 3),
+            "transform_seconds": round(time.perf_counter() - transform_start, 3),
+            "wall_seconds": round(wall, 3),
+            "busy_seconds": round(busy, 3),
+            "parallelism": round(busy / wall, 2) if wall else 0.0,
+        }
+        logger.info(
+            f"Parallel TF-IDF: {n_docs} documents, {len(terms)} terms in {wall:.2f} s "
+            f"on {self.workers} workers ({self.stats['parallelism']} busy on average)"
+        )
+        vectorizer = fitted_vectorizer(TfidfVectorizer(**self.params), terms, idf)
+        return vectorizer, matrix
+    def _count(self, pool, texts: Iterable[str], tmp: str):
+        """Spill shards to tmp and count them, merging tables as workers finish."""
+        shards = []
+        pending = set()
+        n_docs = 0
+        doc_freq = Counter()
+        term_freq = Counter()
+        busy = 0.0
+        def merge(done):
+            nonlocal n_docs, busy
+            for future in done:
+                shard_docs, shard_df, shard_tf, seconds = future.result()
+                n_docs += shard_docs
+                doc_freq.update(shard_df)
+                term_freq.update(shard_tf)
+                busy += seconds
+        shard = []
+        def submit():
+            path = os.path.join(tmp, f"shard-{len(shards):06d}.pkl")
+            with open(path, "wb") as f:
+                pickle.dump(shard, f, protocol=pickle.HIGHEST_PROTOCOL)
+            shards.append(path)
+            pending.add(pool.submit(_count_shard, self.params, path))
+        for text in texts:
+            shard.append(text)
+            if len(shard) >= self.shard_rows:
+                submit()
+                shard = []
+                # Bound the unmerged count tables held in finished futures
+                if len(pending) >= 2 * self.workers:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    pending.difference_update(done)
+                    merge(done)
+        if shard:
+            submit()
+        merge(pending)
+        return shards, n_docs, doc_freq, term_freq, busy
+    def _select_vocabulary(
+        self, n_docs: int, doc_freq: Counter, term_freq: Counter
+    ) -> Tuple[List[str], np.ndarray]:
+        """
+        Kept terms in column order and their IDF, reproducing
+        CountVectorizer._sort_features/_limit_features and TfidfTransformer.fit
+        (including argsort tie-breaking) on the merged tables.
+        """
+        terms = sorted(doc_freq)
+        if not terms:
+            raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+        params = self.params
+        dtype = np.dtype(params["dtype"])
+        dfs = np.fromiter((doc_freq[t] for t in terms), dtype=np.int64, count=len(terms))
+        max_df, min_df = params["max_df"], params["min_df"]
+        max_doc_count = max_df if isinstance(max_df, numbers.Integral) else max_df * n_docs
+        min_doc_count = min_df if isinstance(min_df, numbers.Integral) else min_df * n_docs
+        if max_doc_count < min_doc_count:
+            raise ValueError("max_df corresponds to < documents than min_df")
+        mask = (dfs <= max_doc_count) & (dfs >= min_doc_count)
+        limit = params["max_features"]
+        if limit is not None and mask.sum() > limit:
+            if params["binary"]:
+                tfs = dfs.astype(dtype)
+            else:
+                tfs = np.fromiter(
+                    (term_freq[t] for t in terms), dtype=np.int64, count=len(terms)
+                ).astype(dtype)
+            mask_inds = (-tfs[mask]).argsort()[:limit]
+            new_mask = np.zeros(len(dfs), dtype=bool)
+            new_mask[np.where(mask)[0][mask_inds]] = True
+            mask = new_mask
+        kept = np.flatnonzero(mask)
+        if len(kept) == 0:
+            raise ValueError(
+                "After pruning, no terms remain. Try a lower min_df or a higher max_df."
+            )
+        idf = None
+        if params["use_idf"]:
+            df = dfs[kept].astype(dtype if dtype in (np.float64, np.float32) else np.float64)
+            df += float(params["smooth_idf"])
+            n_samples = n_docs + int(params["smooth_idf"])
+            idf = np.log(n_samples / df) + 1.0
+        return [terms[i] for i in kept], idf
@@ -0,0 +1,158 @@
+"""
+Quantile Sketch
+Fixed-memory, mergeable quantile estimates for metrics streams. Values fall
+into logarithmic buckets (the DDSketch scheme, akin to an HDR histogram): a
+bucket's bounds differ by a factor of (1 + a) / (1 - a), so every quantile is
+returned within relative error a of the exact value, whatever the range.
+Response times from 1 ms to 100 s need about 600 buckets at the default 1%.
+The sketch also keeps the count, sum, min and max, and two sketches with the
+same accuracy merge exactly, e.g. across workers or time windows. Bucket
+counts also make removal exact, so a sketch can track a sliding window.
+"""
+import math
+from typing import Dict, Iterable, Optional
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_MAX_BUCKETS = 2048
+# Values at or below this (including zero and negatives) share one bucket
+MIN_INDEXABLE_VALUE = 1e-9
+class QuantileSketch:
+    """
+    Streaming quantiles within relative_accuracy of the exact value.
+    Not thread-safe: callers serialise add() and reads (see metrics.py).
+    Past max_buckets the lowest buckets are collapsed into each other, which
+    keeps memory fixed and only coarsens the smallest values.
+    """
+    def __init__(
+        self,
+        relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY,
+        max_buckets: int = DEFAULT_MAX_BUCKETS,
+    ):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+    def _index(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+    def _value(self, index: int) -> float:
+        # Midpoint (in relative terms) of (gamma^(i-1), gamma^i]
+        return 2 * self.gamma ** index / (self.gamma + 1)
+    def add(self, value: float, count: int = 1):
+        if value > MIN_INDEXABLE_VALUE:
+            index = self._index(value)
+            self.buckets[index] = self.buckets.get(index, 0) + count
+            if len(self.buckets) > self.max_buckets:
+                self._collapse()
+        else:
+            self.zero_count += count
+        self.count += count
+        self.sum += value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+    def remove(self, value: float, count: int = 1):
+        """
+        Take back a value added earlier (e.g. one leaving a sliding window).
+        min and max keep their extremes until the sketch empties; quantiles
+        are still correct since they only clamp to that range.
+        """
+        if value > MIN_INDEXABLE_VALUE:
+            index = self._index(value)
+            if index not in self.buckets and self.buckets:
+                # Collapsed into the lowest bucket
+                index = min(self.buckets)
+            remaining = self.buckets[index] - count
+            if remaining > 0:
+                self.buckets[index] = remaining
+            else:
+                del self.buckets[index]
+        else:
+            self.zero_count -= count
+        self.count -= count
+        self.sum -= value * count
+        if not self.count:
+            self.sum = 0.0
+            self.min = math.inf
+            self.max = -math.inf
+    def _collapse(self):
+        lowest = sorted(self.buckets)[: len(self.buckets) - self.max_buckets + 1]
+        target = lowest[-1]
+        for index in lowest[:-1]:
+            self.buckets[target] += self.buckets.pop(index)
+    def merge(self, other: "QuantileSketch"):
+        """Add another sketch's values to this one (same relative accuracy)."""
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        if len(self.buckets) > self.max_buckets:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+    def quantile(self, q: float) -> Optional[float]:
+        """Estimate of the q-quantile (0 <= q <= 1); None while empty."""
+        return self.quantiles([q])[q]
+    def quantiles(self, qs: Iterable[float]) -> Dict[float, Optional[float]]:
+        """Several quantile estimates in one pass over the buckets."""
+        qs = sorted(qs)
+        if any(not 0 <= q <= 1 for q in qs):
+            raise ValueError("Quantiles must be between 0 and 1")
+        if not self.count:
+            return {q: None for q in qs}
+        result = {}
+        pending = iter(qs)
+        q = next(pending, None)
+        seen = self.zero_count
+        while q is not None and seen > q * (self.count - 1):
+            result[q] = max(self.min, 0.0)
+            q = next(pending, None)
+        for index in sorted(self.buckets):
+            if q is None:
+                break
+            seen += self.buckets[index]
+            while q is not None and seen > q * (self.count - 1):
+                result[q] = min(max(self._value(index), self.min), self.max)
+                q = next(pending, None)
+        while q is not None:
+            result[q] = self.max
+            q = next(pending, None)
+        return result
+    def to_dict(self) -> Dict:
+        """JSON-serialisable state (see from_dict)."""
+        return {
+            "relative_accuracy": self.relative_accuracy,
+            "buckets": {str(index): count for index, count in self.buckets.items()},
+            "zero_count": self.zero_count,
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+        }
+    @classmethod
+    def from_dict(cls, data: Dict, max_buckets: int = DEFAULT_MAX_BUCKETS) -> "QuantileSketch":
+        sketch = cls(data["relative_accuracy"], max_buckets)
+        sketch.buckets = {int(index): count for index, count in data["buckets"].items()}
+        sketch.zero_count = data["zero_count"]
+        sketch.count = data["count"]
+        sketch.sum = data["sum"]
+        if sketch.count:
+            sketch.min, sketch.max = data["min"], data["max"]
+        return sketch
+    def copy(self) -> "QuantileSketch":
+        sketch = QuantileSketch(self.relative_accuracy, self.max_buckets)
+        sketch.merge(self)
+        return sketch
@@ -0,0 +1,128 @@
+"""
+Semantic Query Cache
+Keeps recent query TF-IDF vectors with their full suggest_resolution result.
+A new query whose cosine similarity to a cached one passes the threshold is
+answered from the cache, skipping retrieval and the LLM call.
+"""
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import numpy as np
+import scipy.sparse as sp
+logger = logging.getLogger(__name__)
+class SemanticQueryCache:
+    """
+    Bounded LRU/TTL cache of (query vector, result) pairs.
+    Entries are scoped (by ticket category and priority) so a match never
+    crosses scopes.
+    Cached vectors are stacked into one sparse matrix, rebuilt lazily after
+    inserts, so a lookup is a single sparse product over at most max_entries
+    rows. invalidate() drops everything and bumps the generation, so results
+    computed against an older knowledge base are never stored. Vectors of a
+    different width (another vocabulary) never match.
+    """
+    def __init__(
+        self,
+        max_entries: int = 512,
+        threshold: float = 0.92,
+        ttl_seconds: float = 600,
+        clock=time.time,
+    ):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()  # entry id -> (vector, scope, result, expires_at)
+        self._next_id = 0
+        self._matrix = None
+        self._row_ids = []
+        self._lock = threading.Lock()
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+    def lookup(self, query_vec, scope: str) -> Optional[Tuple[Dict, float]]:
+        """Return (cached result, similarity) for the closest match, or None."""
+        now = self._clock()
+        with self._lock:
+            if self._entries and self._matrix is None:
+                self._rebuild()
+            if self._entries and self._matrix.shape[1] == query_vec.shape[1]:
+                similarities = (self._matrix @ query_vec.T).toarray().ravel()
+                for row in np.argsort(-similarities, kind="stable"):
+                    similarity = float(similarities[row])
+                    if similarity < self.threshold:
+                        break
+                    entry_id = self._row_ids[row]
+                    entry = self._entries.get(entry_id)
+                    if entry is None or entry[1] != scope:
+                        continue
+                    if entry[3] <= now:
+                        self._remove(entry_id)
+                        continue
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry[2], similarity
+            self.misses += 1
+            return None
+    def store(self, query_vec, scope: str, result: Dict, generation: int):
+        """Cache a result computed while the cache was at the given generation."""
+        with self._lock:
+            if generation != self.generation:
+                return
+            if self._entries:
+                width = next(iter(self._entries.values()))[0].shape[1]
+                if width != query_vec.shape[1]:
+                    # Left over from a knowledge base with another vocabulary
+                    self._entries.clear()
+            self._entries[self._next_id] = (
+                sp.csr_matrix(query_vec),
+                scope,
+                result,
+                self._clock() + self.ttl_seconds,
+            )
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+    def invalidate(self):
+        """Drop all entries, e.g. after the knowledge base changes."""
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+            self._row_ids = []
+            self.generation += 1
+    def _remove(self, entry_id: int):
+        del self._entries[entry_id]
+        self._matrix = None
+    def _rebuild(self):
+        self._row_ids = list(self._entries.keys())
+        self._matrix = sp.vstack(
+            [entry[0] for entry in self._entries.values()], format="csr"
+        )
+    def stats(self) -> Dict:
+        """Cache size and hit rate for /api/metrics."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0,
+        }
+def create_query_cache_from_env() -> Optional[SemanticQueryCache]:
+    """Build the cache configured by QUERY_CACHE_* environment variables."""
+    max_entries = int(os.getenv("QUERY_CACHE_SIZE", "512"))
+    if max_entries <= 0:
+        return None
+    threshold = float(os.getenv("QUERY_CACHE_THRESHOLD", "0.92"))
+    ttl_seconds = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "600"))
+    logger.info(
+        f"Semantic query cache enabled (max {max_entries} entries, "
+        f"threshold {threshold}, TTL {ttl_seconds:.0f}s)"
+    )
+    return SemanticQueryCache(max_entries, threshold, ttl_seconds)
@@ -0,0 +1,144 @@
+"""
+Query Encoder
+TF-IDF encoding of query text compiled from a fitted vocabulary. The
+vocabulary is turned into a token trie, one level per n-gram order, so n-grams
+are matched by walking from each token instead of generating every n-gram
+string and probing a dict: a walk stops at the first token no vocabulary term
+continues with. Matched columns are counted straight into index/value arrays,
+and sublinear TF, IDF and the norm are applied to them in place. The result is
+identical to TfidfVectorizer.transform for the same fitted state.
+"""
+import math
+from typing import Callable, Dict, Iterable, List, Optional
+import numpy as np
+import scipy.sparse as sp
+# Trie node: token -> [column or -1, child node or None]
+Trie = Dict[str, list]
+def compile_trie(vocabulary: Dict[str, int]) -> Trie:
+    """Token trie of vocabulary terms (n-grams are space-joined tokens)."""
+    root = {}
+    for term, column in vocabulary.items():
+        node = root
+        tokens = term.split(" ")
+        for depth, token in enumerate(tokens):
+            entry = node.get(token)
+            if entry is None:
+                entry = node[token] = [-1, None]
+            if depth == len(tokens) - 1:
+                entry[0] = column
+            else:
+                if entry[1] is None:
+                    entry[1] = {}
+                node = entry[1]
+    return root
+class QueryEncoder:
+    """
+    Encode texts into TF-IDF rows for a fitted vocabulary.
+    preprocess and tokenize are the vectorizer's preprocessor and tokenizer;
+    stop words are dropped before n-grams are formed, as the word analyzer
+    does. Use supports() first: tokens containing spaces would be ambiguous in
+    the trie, and only float64 output with l1/l2/no normalisation is
+    implemented.
+    """
+    def __init__(
+        self,
+        vocabulary: Dict[str, int],
+        idf: Optional[np.ndarray],
+        params: Dict,
+        stop_words: Optional[frozenset],
+        preprocess: Callable[[str], str],
+        tokenize: Callable[[str], List[str]],
+    ):
+        self.n_features = len(vocabulary)
+        self.trie = compile_trie(vocabulary)
+        self.idf = np.asarray(idf, dtype=np.float64) if idf is not None else None
+        self.min_n, self.max_n = params["ngram_range"]
+        self.binary = params["binary"]
+        self.sublinear_tf = params["sublinear_tf"]
+        self.norm = params["norm"]
+        self.stop_words = stop_words
+        self.preprocess = preprocess
+        self.tokenize = tokenize
+    @staticmethod
+    def supports(params: Dict, tokenize: Callable[[str], List[str]]) -> bool:
+        if params["norm"] not in (None, "l1", "l2") or np.dtype(params["dtype"]) != np.float64:
+            return False
+        return not any(" " in token for token in tokenize("a b ab cd ab  cd e"))
+    @classmethod
+    def from_vectorizer(cls, vectorizer) -> "QueryEncoder":
+        """Encoder for a fitted TfidfVectorizer (or TfidfModel)."""
+        params = vectorizer.get_params()
+        idf = vectorizer.idf_ if params["use_idf"] else None
+        return cls(
+            vectorizer.vocabulary_,
+            idf,
+            params,
+            vectorizer.get_stop_words(),
+            vectorizer.build_preprocessor(),
+            vectorizer.build_tokenizer(),
+        )
+    def _count(self, text: str) -> Dict[int, int]:
+        """{column: count} of the vocabulary terms in text."""
+        tokens = self.tokenize(self.preprocess(text))
+        stop_words = self.stop_words
+        if stop_words is not None:
+            tokens = [w for w in tokens if w not in stop_words]
+        trie = self.trie
+        min_n, max_n = self.min_n, self.max_n
+        n_tokens = len(tokens)
+        counts = {}
+        for start in range(n_tokens):
+            node = trie
+            end = min(start + max_n, n_tokens)
+            for position in range(start, end):
+                entry = node.get(tokens[position])
+                if entry is None:
+                    break
+                column = entry[0]
+                if column >= 0 and position - start + 1 >= min_n:
+                    counts[column] = counts.get(column, 0) + 1
+                node = entry[1]
+                if node is None:
+                    break
+        return counts
+    def encode(self, texts: Iterable[str]) -> sp.csr_matrix:
+        """TF-IDF rows for texts, as vectorizer.transform(texts)."""
+        if isinstance(texts, str):
+            raise ValueError("Iterable over raw text documents expected, string object received.")
+        rows = [self._count(text) for text in texts]
+        indptr = np.zeros(len(rows) + 1, dtype=np.int32)
+        np.cumsum([len(counts) for counts in rows], out=indptr[1:])
+        indices = np.empty(indptr[-1], dtype=np.int32)
+        data = np.empty(indptr[-1], dtype=np.float64)
+        for i, counts in enumerate(rows):
+            if not counts:
+                continue
+            start, end = indptr[i], indptr[i + 1]
+            columns = sorted(counts)
+            indices[start:end] = columns
+            if self.binary:
+                data[start:end] = 1.0
+            else:
+                data[start:end] = [counts[column] for column in columns]
+            self._weight(data[start:end], indices[start:end])
+        return sp.csr_matrix((data, indices, indptr), shape=(len(rows), self.n_features))
+    def _weight(self, values: np.ndarray, columns: np.ndarray):
+        """Sublinear TF, IDF and the norm applied in place to one row's values."""
+        if self.sublinear_tf:
+            np.log(values, out=values)
+            values += 1
+        if self.idf is not None:
+            values *= self.idf[columns]
+        if self.norm is None:
+            return
+        # Sum left to right like sklearn's row normalisation
+        total = 0.0
+        if self.norm == "l2":
+            for value in values.tolist():
+                total += value * value
+            total = math.sqrt(total)
+        else:
+            for value in values.tolist():
+                total += abs(value)
+        if total != 0.0:
+            values /= total
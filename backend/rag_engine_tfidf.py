@@ -3,20 +3,63 @@ RAG Engine - TF-IDF Version
 Uses TF-IDF similarity instead of embeddings (much faster!)
 """
 import os
-import pickle
+import shutil
+import asyncio
+import importlib.util
+import functools
+import threading
 import numpy as np
+import scipy.sparse as sp
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
 from typing import List, Dict, Optional
 import logging
 import time
-from sklearn.metrics.pairwise import cosine_similarity
-from metrics import metrics_tracker
+import uuid
+from collections import OrderedDict
+from metrics import NO_TRACE, StageTrace, metrics_tracker
+from kb_build import (
+    build_config_from_manifest,
+    build_knowledge_base,
+    make_vectorizer,
+    resolve_build_config,
+)
+from kb_ingest import (
+    append_delta_log,
+    document_text,
+    normalize_ticket,
+    read_delta_log,
+    weighted_text,
+    write_delta_log,
+)
+from kb_snapshot import KnowledgeBaseSnapshot
+from kb_store import (
+    is_kb_dir,
+    kb_dir_for,
+    kb_write_lock,
+    live_kb_dir,
+    load_category_matrix,
+    load_kb_dir,
+    migrate_pickle,
+    pickle_is_newer,
+    publish_kb_version,
+    read_manifest,
+    save_kb_dir,
+    write_kb_version,
+)
+from llm_cache import create_llm_cache_from_env, make_cache_key
+from openmetrics import MetricSet
+from query_cache import create_query_cache_from_env
+from retrieval import MAX_BOOST, rerank, top_k_similar, top_k_similar_batch
+from ticket_source import read_ticket_chunks
+from ticket_store import TicketStore, hash_tokens
 logger = logging.getLogger(__name__)
-# Import Hugging Face for AI generation
-try:
-    from huggingface_hub import InferenceClient
-    HUGGINGFACE_AVAILABLE = True
-except ImportError:
-    HUGGINGFACE_AVAILABLE = False
+# Finished reload jobs kept for GET /api/reload-knowledge-base/{job_id}
+RELOAD_JOB_HISTORY = 20
+# Hugging Face for AI generation; imported when the client is created so
+# importing the engine stays cheap
+HUGGINGFACE_AVAILABLE = importlib.util.find_spec("huggingface_hub") is not None
+if not HUGGINGFACE_AVAILABLE:
     logger.warning(
         "huggingface_hub not installed. Please install: pip install huggingface_hub"
     )
@@ -24,15 +67,22 @@ class RAGEngine:
     """
     Retrieval-Augmented Generation Engine using TF-IDF similarity.
     """
-    def __init__(self, knowledge_base_path="data/knowledge_base.pkl"):
-        """Initialize the RAG engine."""
+    def __init__(self, knowledge_base_path="data/knowledge_base.pkl", lazy: bool = False):
+        """
+        Initialize the RAG engine.
+        The AI client is created and the knowledge base loaded (or built) here
+        unless lazy is set, in which case the engine starts warming and
+        start_loading() does both in the background.
+        """
         # Log current working directory for debugging
         logger.info(f"Current working directory: {os.getcwd()}")
         logger.info(f"Looking for knowledge base at: {knowledge_base_path}")
         self.knowledge_base_path = knowledge_base_path
-        self.tickets = None
-        self.vectorizer = None
-        self.tfidf_matrix = None
+        # Knowledge base serving queries; replaced as a whole, never modified
+        self.snapshot: Optional[KnowledgeBaseSnapshot] = None
+        # Startup progress for health checks: "warming" until the first
+        # snapshot is published ("ready") or none can be loaded ("failed")
+        self.load_status = {"state": "warming", "stage": "queued", "started_at": time.time()}
         self.hf_client = None  # Hugging Face client
         self.ai_provider = "huggingface"  # Only using Hugging Face
         # Configuration
@@ -40,10 +90,87 @@ class RAGEngine:
         self.min_similarity = float(
             os.getenv("MIN_SIMILARITY", "0.25")
         )  # Higher threshold for more relevant matches
-        # Initialize Hugging Face AI
+        # Candidates retrieved per result (k * factor) before re-ranking; a wider
+        # pool lets boosted tickets from further down the list make the top k
+        self.candidate_pool_factor = max(1, int(os.getenv("CANDIDATE_POOL_FACTOR", "3")))
+        # Retrieval mode: "global" scores the whole corpus; "category-first"
+        # scores the requested category's partition and only falls back to the
+        # whole corpus when fewer than k tickets pass the threshold
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "global").lower()
+        # Retrieval backend: "matrix" (sparse product over the whole corpus) or
+        # "inverted" (only touches postings of the query terms)
+        self.retrieval_backend = os.getenv("RETRIEVAL_BACKEND", "matrix").lower()
+        self.early_termination = os.getenv(
+            "RETRIEVAL_EARLY_TERMINATION", "true"
+        ).lower() in ("1", "true", "yes")
+        # Bounded worker pool for the blocking retrieval + LLM pipeline so async
+        # callers never stall the event loop while waiting on the model
+        self.max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_concurrency, thread_name_prefix="rag-worker"
+        )
+        # Chat model calls currently waiting on the model (the /metrics gauge)
+        self.llm_in_flight = 0
+        self._llm_lock = threading.Lock()
+        # Incremental ingestion: the delta segment is merged into the knowledge
+        # base directory in the background once it holds KB_DELTA_MERGE_ROWS
+        # tickets; the vocabulary and IDF are refit when ingested text drifts
+        # from the vocabulary or every KB_REFIT_INTERVAL_SECONDS (0 = never)
+        self.delta_merge_rows = int(os.getenv("KB_DELTA_MERGE_ROWS", "1000"))
+        self.refit_drift = float(os.getenv("KB_REFIT_DRIFT", "0.15"))
+        self.refit_min_tickets = int(os.getenv("KB_REFIT_MIN_TICKETS", "100"))
+        self.refit_interval = float(os.getenv("KB_REFIT_INTERVAL_SECONDS", "0"))
+        # Writers (ingestion, merges, reloads) serialise on _kb_lock to publish
+        # snapshots; queries never take it. Merges and reloads share a single
+        # background worker, so at most one new snapshot is built at a time
+        self._kb_lock = threading.RLock()
+        self._maintenance = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix="kb-maintenance"
+        )
+        self._maintenance_pending = False
+        self._reload_jobs = OrderedDict()  # job_id -> status dict, most recent last
+        # Response cache in front of the chat model (LLM_CACHE_BACKEND=memory|sqlite|none)
+        self.llm_cache = create_llm_cache_from_env()
+        # Near-duplicate query cache in front of retrieval + generation
+        self.query_cache = create_query_cache_from_env()
+        if not lazy:
+            self._init_huggingface_client()
+            self._run_initial_load()
+    def start_loading(self) -> Future:
+        """
+        Create the AI client and load the knowledge base on the maintenance
+        worker; is_ready() turns True when done.
+        """
+        logger.info("Loading knowledge base in the background")
+        return self._maintenance.submit(self._warm_up)
+    def _warm_up(self):
         self._init_huggingface_client()
-        # Load knowledge base
-        self._load_knowledge_base()
+        self._run_initial_load()
+    def _run_initial_load(self):
+        """Load (or build) and publish the first snapshot, recording progress in load_status."""
+        start_time = time.time()
+        try:
+            snapshot = self._load_snapshot()
+            if snapshot is not None:
+                with self._kb_lock:
+                    self._publish(self._carry_delta(snapshot))
+        except Exception as e:
+            self.load_status.update(state="failed", stage="failed", error=str(e))
+            logger.error(f"Failed to load knowledge base: {e}")
+            raise
+        finally:
+            self.load_status["load_seconds"] = round(time.time() - start_time, 3)
+        if snapshot is None:
+            self.load_status.update(
+                state="failed", stage="failed", error="No knowledge base could be loaded or built"
+            )
+        else:
+            self.load_status.update(state="ready", stage="ready")
+            logger.info(f"Knowledge base ready in {self.load_status['load_seconds']:.2f} s")
+    def _load_stage(self, stage: str):
+        """Record a startup stage; reloads after startup leave load_status alone."""
+        if self.load_status["state"] == "warming":
+            self.load_status["stage"] = stage
     def _init_huggingface_client(self) -> bool:
         """Initialize Hugging Face client for AI-powered resolutions. Returns True if successful."""
         if not HUGGINGFACE_AVAILABLE:
@@ -57,6 +184,7 @@ class RAGEngine:
             # Initialize Hugging Face Inference Client
             # Using Qwen - free chat model that works with serverless inference
             model = os.getenv("HF_MODEL", "Qwen/Qwen2.5-Coder-32B-Instruct")
+            from huggingface_hub import InferenceClient
             self.hf_client = InferenceClient(
                 model=model, token=hf_token  # None = use free tier
             )
@@ -80,61 +208,214 @@ class RAGEngine:
     def has_ai_client(self) -> bool:
         """Check if Hugging Face AI client is available."""
         return self.hf_client is not None
-    def _load_knowledge_base(self):
-        """Load the pre-built knowledge base."""
-        # Check if knowledge base exists and try to load it
-        kb_exists = os.path.exists(self.knowledge_base_path)
-        if kb_exists:
-            try:
-                # Try to load it
-                with open(self.knowledge_base_path, "rb") as f:
-                    data = pickle.load(f)
-                    # Test if vectorizer works
-                    test_text = ["test"]
-                    data["vectorizer"].transform(test_text)
-                # If we got here, it works!
-                self.tickets = data["tickets"]
-                self.vectorizer = data["vectorizer"]
-                self.tfidf_matrix = data["tfidf_matrix"]
-                logger.info(f"Loaded knowledge base with {len(self.tickets)} tickets")
-                logger.info(f"TF-IDF matrix shape: {self.tfidf_matrix.shape}")
+    @contextmanager
+    def _llm_call(self):
+        """Count a chat model call in llm_in_flight while it runs."""
+        with self._llm_lock:
+            self.llm_in_flight += 1
+        try:
+            yield
+        finally:
+            with self._llm_lock:
+                self.llm_in_flight -= 1
+    def _chat_completion(
+        self, messages: List[Dict], max_tokens: int, temperature: float
+    ) -> str:
+        """Call the chat model through the response cache and return the reply text."""
+        def generate() -> str:
+            with self._llm_call():
+                response = self.hf_client.chat_completion(
+                    messages=messages, max_tokens=max_tokens, temperature=temperature
+                )
+            # Extract the response text
+            return response.choices[0].message.content
+        if self.llm_cache is None:
+            return generate()
+        key = make_cache_key(
+            os.getenv("HF_MODEL", "Qwen/Qwen2.5-Coder-32B-Instruct"),
+            messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+        )
+        return self.llm_cache.get_or_generate(key, generate)
+    def _stream_chat_completion(
+        self, messages: List[Dict], max_tokens: int, temperature: float
+    ):
+        """Streaming _chat_completion: yields reply text chunks, cached replies in one chunk."""
+        key = None
+        if self.llm_cache is not None:
+            key = make_cache_key(
+                os.getenv("HF_MODEL", "Qwen/Qwen2.5-Coder-32B-Instruct"),
+                messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+            )
+            cached = self.llm_cache.lookup(key)
+            if cached is not None:
+                yield cached
                 return
+        parts = []
+        with self._llm_call():
+            for chunk in self.hf_client.chat_completion(
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stream=True,
+            ):
+                if not chunk.choices:
+                    continue
+                text = chunk.choices[0].delta.content
+                if text:
+                    parts.append(text)
+                    yield text
+        if key is not None:
+            self.llm_cache.store(key, "".join(parts))
+    def get_cache_stats(self) -> Dict:
+        """Get cache statistics for the metrics endpoint."""
+        return {
+            "llm_cache": self.llm_cache.stats() if self.llm_cache else {"enabled": False},
+            "query_cache": (
+                self.query_cache.stats() if self.query_cache else {"enabled": False}
+            ),
+        }
+    def add_metric_gauges(self, metric_set: MetricSet):
+        """Knowledge base, cache and LLM gauges (and cache counters) for /metrics."""
+        kb = self.snapshot
+        metric_set.gauge(
+            "rag_knowledge_base_tickets",
+            "Tickets in the loaded knowledge base, including the delta segment",
+            len(kb) if kb is not None else 0,
+            merge="max",
+        )
+        metric_set.gauge(
+            "rag_knowledge_base_delta_tickets",
+            "Ingested tickets not yet merged into the stored knowledge base",
+            len(kb.delta) if kb is not None else 0,
+            merge="max",
+        )
+        metric_set.gauge(
+            "rag_llm_in_flight", "Chat model calls in progress", self.llm_in_flight
+        )
+        caches = (("query", self.query_cache, "sum"), ("llm", self.llm_cache, "sum"))
+        for name, cache, merge in caches:
+            if cache is None:
+                continue
+            stats = cache.stats()
+            if stats.get("backend") == "sqlite":
+                # One database shared by every worker
+                merge = "max"
+            metric_set.gauge(
+                f"rag_{name}_cache_entries",
+                f"Entries in the {name} cache",
+                stats["size"],
+                merge=merge,
+            )
+            for result, key in (("hit", "hits"), ("miss", "misses")):
+                metric_set.counter(
+                    f"rag_{name}_cache_lookups",
+                    f"{name.capitalize()} cache lookups by result",
+                    stats[key],
+                    {"result": result},
+                )
+    def _load_snapshot(self) -> Optional[KnowledgeBaseSnapshot]:
+        """
+        Load the pre-built knowledge base into a new, validated snapshot
+        without touching the one serving queries.
+        The directory format next to knowledge_base_path is preferred; a legacy
+        pickle found without one is migrated to it first; one written after the
+        live version is not (that would drop merged ingested tickets) but is
+        logged. Returns None if no knowledge base exists or can be built.
+        """
+        kb_dir = kb_dir_for(self.knowledge_base_path)
+        if not is_kb_dir(kb_dir) and os.path.exists(self.knowledge_base_path):
+            self._load_stage("migrating")
+            try:
+                migrate_pickle(self.knowledge_base_path, kb_dir)
+            except Exception as e:
+                logger.warning(f"Could not migrate pickled knowledge base: {e}")
+        elif pickle_is_newer(self.knowledge_base_path, kb_dir):
+            logger.warning(
+                f"{self.knowledge_base_path} is newer than the live knowledge base in {kb_dir} and is not loaded; "
+                f"rebuild with scripts/build_knowledge_base_tfidf.py or run kb_store.migrate_pickle to replace it"
+            )
+        if is_kb_dir(kb_dir):
+            self._load_stage("loading")
+            try:
+                return self._open_kb_dir(kb_dir)
             except Exception as e:
                 logger.warning(f"Existing knowledge base is incompatible: {e}")
                 logger.info("Will rebuild knowledge base...")
-                # Delete the incompatible file
-                try:
-                    os.remove(self.knowledge_base_path)
-                except:
-                    pass
         # Build new knowledge base
         logger.info("Attempting to build knowledge base from Sample-Data.xlsx...")
+        self._load_stage("building")
         build_success = self._build_knowledge_base_from_excel()
-        if not build_success or not os.path.exists(self.knowledge_base_path):
+        if not build_success or not is_kb_dir(kb_dir):
             logger.error(
                 "Failed to build knowledge base. Please run: python scripts/build_knowledge_base_tfidf.py"
             )
             logger.error("RAG engine will not be functional!")
-            return
+            return None
         # Load the newly built knowledge base
+        self._load_stage("loading")
         try:
-            with open(self.knowledge_base_path, "rb") as f:
-                data = pickle.load(f)
-                self.tickets = data["tickets"]
-                self.vectorizer = data["vectorizer"]
-                self.tfidf_matrix = data["tfidf_matrix"]
-            logger.info(
-                f"Loaded newly built knowledge base with {len(self.tickets)} tickets"
-            )
-            logger.info(f"TF-IDF matrix shape: {self.tfidf_matrix.shape}")
+            return self._open_kb_dir(kb_dir)
         except Exception as e:
             logger.error(f"Failed to load newly built knowledge base: {e}")
             raise
+    def _open_kb_dir(self, kb_dir: str, **kwargs) -> KnowledgeBaseSnapshot:
+        """Memory-map a knowledge base directory into a snapshot with its retrieval indexes."""
+        start_time = time.time()
+        # Resolve the live version once, so a concurrent publish cannot mix two
+        kb_dir = live_kb_dir(kb_dir)
+        build_config = build_config_from_manifest(read_manifest(kb_dir))
+        tickets, vectorizer, tfidf_matrix = load_kb_dir(kb_dir)
+        snapshot = KnowledgeBaseSnapshot.build(
+            tickets,
+            vectorizer,
+            tfidf_matrix,
+            kb_dir,
+            inverted=self.retrieval_backend == "inverted",
+            category_matrix=load_category_matrix(kb_dir),
+            build_config=build_config,
+            **kwargs,
+        )
+        logger.info(
+            f"Loaded knowledge base with {len(tickets)} tickets from {kb_dir} "
+            f"in {(time.time() - start_time) * 1000:.2f} ms "
+            f"(build config '{build_config['name']}', "
+            f"category weight {build_config['category_weight']})"
+        )
+        logger.info(f"TF-IDF matrix shape: {tfidf_matrix.shape}")
+        return snapshot
+    def _carry_delta(self, snapshot: KnowledgeBaseSnapshot) -> KnowledgeBaseSnapshot:
+        """
+        Re-ingest tickets not yet merged into snapshot's directory: those in
+        its delta log, which every worker appends to (caller holds _kb_lock).
+        A rebuilt directory takes over the log of the one it replaced when it
+        is published (see publish_kb_version).
+        """
+        with kb_write_lock(kb_dir_for(self.knowledge_base_path)):
+            tickets = read_delta_log(snapshot.kb_dir)
+        if tickets:
+            snapshot, _ = snapshot.ingest(tickets)
+            logger.info(f"Replayed {len(tickets)} ingested tickets into the delta segment")
+        return snapshot
+    def _publish(self, snapshot: KnowledgeBaseSnapshot):
+        """
+        Make snapshot the one new queries see (caller holds _kb_lock). This is
+        a single reference swap: queries already running finish on the
+        snapshot they captured.
+        """
+        self.snapshot = snapshot
+        # Cached results may be missing a better match from the new snapshot
+        if self.query_cache is not None:
+            self.query_cache.invalidate()
     def _build_knowledge_base_from_excel(self):
-        """Build knowledge base from Excel file on startup."""
+        """
+        Build the knowledge base from Sample-Data.xlsx on startup, with the
+        same pipeline and config (KB_BUILD_CONFIG) as the build script.
+        """
         try:
-            import pandas as pd
-            from sklearn.feature_extraction.text import TfidfVectorizer
             # Try multiple possible paths
             possible_paths = [
                 "data/Sample-Data.xlsx",
@@ -154,66 +435,22 @@ class RAGEngine:
                 if os.path.exists("data"):
                     logger.info(f"Files in data/: {os.listdir('data')}")
                 return
-            logger.info(f"Building knowledge base from {excel_path}...")
-            # Read Excel file
-            df = pd.read_excel(excel_path)
-            # Detect columns (simple version)
-            col_mapping = {}
-            for col in df.columns:
-                col_lower = col.strip().lower()
-                if "category" in col_lower or "type" in col_lower:
-                    col_mapping["category"] = col
-                elif "description" in col_lower or "issue" in col_lower:
-                    col_mapping["description"] = col
-                elif "resolution" in col_lower or "solution" in col_lower:
-                    col_mapping["resolution"] = col
-                elif "priority" in col_lower:
-                    col_mapping["priority"] = col
-            if "description" not in col_mapping or "resolution" not in col_mapping:
-                logger.error(
-                    "Could not find required columns (description, resolution)"
-                )
-                return
-            # Build tickets list
-            tickets = []
-            for idx, row in df.iterrows():
-                ticket = {
-                    "ticket_id": f"T{idx+1:04d}",
-                    "category": row.get(col_mapping.get("category", ""), "General"),
-                    "description": str(row[col_mapping["description"]]),
-                    "resolution": str(row[col_mapping["resolution"]]),
-                    "priority": row.get(col_mapping.get("priority", ""), "Medium"),
-                }
-                tickets.append(ticket)
-            # Build TF-IDF vectors
-            logger.info("Building TF-IDF vectors...")
-            vectorizer = TfidfVectorizer(
-                max_features=3000,  # Increased for better vocabulary coverage
-                stop_words="english",
-                ngram_range=(1, 3),  # Include trigrams for better phrase matching
-                min_df=1,  # Keep rare but specific terms (like "Teams", "login")
-                max_df=0.7,  # More aggressive filtering of common terms
-                sublinear_tf=True,  # Use log scaling for term frequency
-                token_pattern=r"(?u)\b[a-zA-Z][a-zA-Z]+\b",  # Only words with 2+ letters
+            build_config = resolve_build_config()
+            logger.info(
+                f"Building knowledge base from {excel_path} "
+                f"with build config '{build_config['name']}'..."
+            )
+            tickets, vectorizer, tfidf_matrix, _ = build_knowledge_base(
+                read_ticket_chunks(excel_path), build_config
             )
-            # Combine category and description with smart weighting
-            # Category 3x weight helps category matching, description is the main content
-            texts = [
-                f"{t['category']} {t['category']} {t['category']} {t['description']}"
-                for t in tickets
-            ]
-            tfidf_matrix = vectorizer.fit_transform(texts)
             # Save knowledge base
-            os.makedirs(os.path.dirname(self.knowledge_base_path), exist_ok=True)
-            with open(self.knowledge_base_path, "wb") as f:
-                pickle.dump(
-                    {
-                        "tickets": tickets,
-                        "vectorizer": vectorizer,
-                        "tfidf_matrix": tfidf_matrix,
-                    },
-                    f,
-                )
+            save_kb_dir(
+                kb_dir_for(self.knowledge_base_path),
+                tickets,
+                vectorizer,
+                tfidf_matrix,
+                build_config=build_config,
+            )
             logger.info(
                 f"Knowledge base built successfully with {len(tickets)} tickets"
             )
@@ -224,7 +461,13 @@ class RAGEngine:
             logger.error(f"Traceback: {traceback.format_exc()}")
             return False
     def find_similar_tickets(
-        self, query_text: str, k: int = None, category: str = None
+        self,
+        query_text: str,
+        k: int = None,
+        category: str = None,
+        query_vec=None,
+        kb: KnowledgeBaseSnapshot = None,
+        trace: StageTrace = None,
     ) -> List[Dict]:
         """
         Find similar tickets using TF-IDF similarity with category filtering.
@@ -232,44 +475,203 @@ class RAGEngine:
             query_text: The ticket description to find similar tickets for
             k: Number of similar tickets to return
             category: Optional category to prioritize in results
+            query_vec: Precomputed TF-IDF vector of query_text, if available
+            kb: Snapshot query_vec was computed against (default: current)
+            trace: Request trace for the encoding, scoring and rerank stages
         Returns:
             List of similar tickets with similarity scores
         """
-        if not self.is_ready():
-            raise RuntimeError("RAG engine not ready. Knowledge base not loaded.")
+        if kb is None:
+            kb = self._require_snapshot()
+        if trace is None:
+            trace = NO_TRACE
         k = k or self.top_k
         # Transform query using TF-IDF vectorizer
-        query_vec = self.vectorizer.transform([query_text])
-        # Calculate cosine similarity
-        similarities = cosine_similarity(query_vec, self.tfidf_matrix)[0]
-        # Get top k*3 indices to allow for category filtering
-        top_indices = similarities.argsort()[-(k * 3) :][::-1]
-        # Extract key terms from query for keyword matching
-        query_lower = query_text.lower()
-        query_words = set(query_lower.split())
-        # Build result list with category and keyword boosting
+        if query_vec is None:
+            with trace.span("encoding"):
+                query_vec = kb.vectorizer.transform([query_text])
+        if self.retrieval_mode == "category-first" and category:
+            similar_tickets = self._with_delta(
+                kb,
+                self._find_in_category(kb, query_text, query_vec, k, category, trace),
+                query_text,
+                query_vec,
+                k,
+                category,
+                category_only=True,
+                trace=trace,
+            )
+            if len(similar_tickets) >= k:
+                return similar_tickets
+        # Sparse dot product (rows are L2-normalised, so this is cosine similarity)
+        # keeping a pool of candidates for re-ranking
+        pool_size = k * self.candidate_pool_factor
+        with trace.span("scoring"):
+            if kb.inverted_index is not None:
+                # The threshold applies after boosting, so only raw scores below
+                # min_similarity / MAX_BOOST can never pass
+                top_indices, top_scores = kb.inverted_index.top_k(
+                    query_vec,
+                    pool_size,
+                    early_termination=self.early_termination,
+                    min_score=self.min_similarity / MAX_BOOST,
+                )
+            else:
+                top_indices, top_scores = top_k_similar(
+                    kb.tfidf_matrix, query_vec, pool_size
+                )
+        with trace.span("rerank"):
+            similar_tickets = self._rank_candidates(
+                kb.tickets, query_text, top_indices, top_scores, k, category
+            )
+        return self._with_delta(
+            kb, similar_tickets, query_text, query_vec, k, category, trace=trace
+        )
+    def _with_delta(
+        self,
+        kb: KnowledgeBaseSnapshot,
+        similar_tickets: List[Dict],
+        query_text: str,
+        query_vec,
+        k: int,
+        category: str = None,
+        category_only: bool = False,
+        trace: StageTrace = NO_TRACE,
+    ) -> List[Dict]:
+        """Merge ranked base-segment results with matches from the delta segment."""
+        delta = kb.delta
+        if not delta:
+            return similar_tickets
+        # The delta segment is small; category-only searches score all of it
+        pool_size = len(delta) if category_only else k * self.candidate_pool_factor
+        with trace.span("scoring"):
+            top_indices, top_scores = top_k_similar(delta.matrix, query_vec, pool_size)
+            if category_only:
+                in_category = delta.store.matches(top_indices, "category", category)
+                top_indices, top_scores = top_indices[in_category], top_scores[in_category]
+        with trace.span("rerank"):
+            merged = similar_tickets + self._rank_candidates(
+                delta.store, query_text, top_indices, top_scores, k, category
+            )
+            merged.sort(key=lambda t: t["similarity_score"], reverse=True)
+        return merged[:k]
+    def _find_in_category(
+        self,
+        kb: KnowledgeBaseSnapshot,
+        query_text: str,
+        query_vec,
+        k: int,
+        category: str,
+        trace: StageTrace = NO_TRACE,
+    ) -> List[Dict]:
+        """find_similar_tickets over the requested category's partition only."""
+        with trace.span("scoring"):
+            codes = kb.tickets.matching_codes("category", category)
+            if not codes:
+                return []
+            top_indices, top_scores = kb.category_partitions.top_k(
+                query_vec, codes, k * self.candidate_pool_factor
+            )
+        with trace.span("rerank"):
+            return self._rank_candidates(
+                kb.tickets, query_text, top_indices, top_scores, k, category
+            )
+    def find_similar_tickets_batch(
+        self,
+        query_texts: List[str],
+        k: int = None,
+        categories: List[str] = None,
+        kb: KnowledgeBaseSnapshot = None,
+        trace: StageTrace = None,
+    ) -> List[List[Dict]]:
+        """
+        Batched find_similar_tickets: one vectorizer.transform call for all
+        queries and one sparse matrix-matrix product to score them.
+        Args:
+            query_texts: Ticket query texts
+            k: Number of similar tickets to return per query
+            categories: Optional category per query to prioritize in results
+            kb: Snapshot to search (default: current)
+            trace: Trace for the whole batch's encoding, scoring and rerank stages
+        Returns:
+            One list of similar tickets per query, in input order
+        """
+        if kb is None:
+            kb = self._require_snapshot()
+        if trace is None:
+            trace = NO_TRACE
+        if not query_texts:
+            return []
+        k = k or self.top_k
+        categories = categories or [None] * len(query_texts)
+        with trace.span("encoding"):
+            query_matrix = kb.vectorizer.transform(query_texts)
+        if self.retrieval_mode == "category-first":
+            # Each query scores its own partition; the transform is still shared
+            return [
+                self.find_similar_tickets(
+                    query_text,
+                    k,
+                    category,
+                    query_vec=query_matrix[i],
+                    kb=kb,
+                    trace=trace,
+                )
+                for i, (query_text, category) in enumerate(zip(query_texts, categories))
+            ]
+        with trace.span("scoring"):
+            candidates = top_k_similar_batch(
+                kb.tfidf_matrix, query_matrix, k * self.candidate_pool_factor
+            )
+        results = []
+        for i, (query_text, (top_indices, top_scores), category) in enumerate(
+            zip(query_texts, candidates, categories)
+        ):
+            with trace.span("rerank"):
+                similar_tickets = self._rank_candidates(
+                    kb.tickets, query_text, top_indices, top_scores, k, category
+                )
+            results.append(
+                self._with_delta(
+                    kb,
+                    similar_tickets,
+                    query_text,
+                    query_matrix[i],
+                    k,
+                    category,
+                    trace=trace,
+                )
+            )
+        return results
+    def _rank_candidates(
+        self,
+        tickets: TicketStore,
+        query_text: str,
+        top_indices,
+        top_scores,
+        k: int,
+        category: str = None,
+    ) -> List[Dict]:
+        """Apply category and keyword boosts, then the threshold, to retrieval candidates."""
+        top_indices = np.asarray(top_indices, dtype=np.int64)
+        if category:
+            category_match = tickets.matches(top_indices, "category", category)
+        else:
+            category_match = np.zeros(len(top_indices), dtype=bool)
+        # Count query terms in each candidate's precomputed keyword set
+        # (login, teams, password, etc.) for all candidates at once
+        query_ids = hash_tokens(query_text.lower().split())
+        overlaps = tickets.keyword_index().overlap_counts(top_indices, query_ids)
+        rows, scores = rerank(
+            top_indices, top_scores, category_match, overlaps, k, self.min_similarity
+        )
+        # Materialise ticket dicts only for the results
         similar_tickets = []
-        for idx in top_indices:
-            score = float(similarities[idx])
-            if score >= self.min_similarity:
-                ticket = self.tickets[idx].copy()
-                # Apply category boost if categories match
-                if category and ticket.get("category", "").lower() == category.lower():
-                    # Boost by 30% for exact category match
-                    score = min(score * 1.3, 1.0)
-                # Apply keyword boost for important matching terms
-                ticket_text = f"{ticket.get('description', '')} {ticket.get('resolution', '')}".lower()
-                ticket_words = set(ticket_text.split())
-                # Check for important keyword matches (login, teams, password, etc.)
-                important_keywords = query_words & ticket_words
-                if len(important_keywords) >= 2:  # At least 2 matching important words
-                    score = min(score * 1.15, 1.0)  # 15% boost
-                ticket["similarity_score"] = score
-                similar_tickets.append(ticket)
-        # Sort by final score (after category boosting)
-        similar_tickets.sort(key=lambda x: x["similarity_score"], reverse=True)
-        # Return only top k after filtering and sorting
-        return similar_tickets[:k]
+        for idx, score in zip(rows.tolist(), scores.tolist()):
+            ticket = tickets[idx]
+            ticket["similarity_score"] = score
+            similar_tickets.append(ticket)
+        return similar_tickets
     def _generate_template_resolution(self, best_ticket: Dict) -> str:
         """Generate a template-based resolution when AI is not available."""
         resolution = f"""Based on similar resolved tickets, here's the suggested resolution:
@@ -279,14 +681,41 @@ Category: {best_ticket['category']}
 Please adapt the steps above to your specific situation. If you need further assistance, contact IT support."""
         return resolution
     def _generate_ai_fallback_resolution(
-        self, category: str, priority: str, description: str
+        self,
+        category: str,
+        priority: str,
+        description: str,
+        trace: StageTrace = NO_TRACE,
     ) -> str:
         """
         Generate an AI-powered resolution when no similar tickets are found.
         Uses Hugging Face to provide intelligent troubleshooting steps.
         """
         try:
-            system_prompt = """You are an expert IT support assistant with deep knowledge across various technical domains including:
+            # Fallback to Hugging Face (free alternative)
+            if self.hf_client and self.ai_provider == "huggingface":
+                with trace.span("prompt_build"):
+                    messages = self._build_fallback_messages(
+                        category, priority, description
+                    )
+                with trace.span("llm_generation"):
+                    ai_resolution = self._chat_completion(
+                        messages, max_tokens=800, temperature=0.7
+                    )
+            else:
+                raise Exception("No AI provider available")
+            # Add disclaimer
+            header, footer = self._fallback_wrapper()
+            return f"{header}{ai_resolution}{footer}"
+        except Exception as e:
+            logger.error(f"Failed to generate AI fallback resolution: {e}")
+            # Return a generic but helpful fallback
+            return self._generic_fallback_resolution(category, priority)
+    def _build_fallback_messages(
+        self, category: str, priority: str, description: str
+    ) -> List[Dict]:
+        """Chat messages for the no-similar-tickets AI fallback."""
+        system_prompt = """You are an expert IT support assistant with deep knowledge across various technical domains including:
 - Hardware issues (printers, computers, monitors, peripherals)
 - Software problems (applications, OS issues, installations)
 - Network connectivity (Wi-Fi, VPN, ethernet)
@@ -299,7 +728,7 @@ Provide step-by-step resolution guidance that is:
 2. Comprehensive with common troubleshooting steps
 3. Escalation path if the issue persists
 4. Safety warnings if applicable"""
-            user_query = f"""I need help resolving an IT support ticket with the following details:
+        user_query = f"""I need help resolving an IT support ticket with the following details:
 Category: {category}
 Priority: {priority}
 Issue Description: {description}
@@ -311,27 +740,19 @@ Include:
 4. When to escalate to senior support or specialists
 5. Any important warnings or precautions
 Format your response clearly with numbered steps."""
-            # Fallback to Hugging Face (free alternative)
-            if self.hf_client and self.ai_provider == "huggingface":
-                # Use chat completion format
-                full_prompt = f"{system_prompt}\n\n{user_query}"
-                messages = [{"role": "user", "content": full_prompt}]
-                response = self.hf_client.chat_completion(
-                    messages=messages, max_tokens=800, temperature=0.7
-                )
-                ai_resolution = response.choices[0].message.content
-            else:
-                raise Exception("No AI provider available")
-            # Add disclaimer
-            full_resolution = f"""⚠️ **AI-Generated Solution** (No similar historical tickets found)
-{ai_resolution}
+        # Use chat completion format
+        full_prompt = f"{system_prompt}\n\n{user_query}"
+        return [{"role": "user", "content": full_prompt}]
+    def _fallback_wrapper(self):
+        """Disclaimer (header, footer) placed around AI fallback text."""
+        header = "⚠️ **AI-Generated Solution** (No similar historical tickets found)\n"
+        footer = """
 ---
 **Note:** This resolution was generated by AI based on general IT support knowledge. Since no similar tickets were found in the historical database, please verify these steps are appropriate for your specific environment. If the issue persists, please contact IT support for personalized assistance."""
-            return full_resolution
-        except Exception as e:
-            logger.error(f"Failed to generate AI fallback resolution: {e}")
-            # Return a generic but helpful fallback
-            return f"""⚠️ **No Similar Tickets Found**
+        return header, footer
+    def _generic_fallback_resolution(self, category: str, priority: str) -> str:
+        """Static guidance used when AI fallback generation fails."""
+        return f"""⚠️ **No Similar Tickets Found**
 We couldn't find similar resolved tickets in our database for this issue.
 **Suggested Next Steps:**
 1. **Basic Troubleshooting:**
@@ -379,7 +800,11 @@ Provide a clear, step-by-step resolution that follows the patterns from the simi
 Be specific and actionable."""
         return system_prompt, user_query
     def suggest_resolution(
-        self, category: str, priority: str, description: str
+        self,
+        category: str,
+        priority: str,
+        description: str,
+        trace: StageTrace = None,
     ) -> Dict:
         """
         Suggest resolution for a ticket using RAG approach.
@@ -387,124 +812,438 @@ Be specific and actionable."""
             category: Ticket category
             priority: Ticket priority
             description: Ticket description
+            trace: Trace started when the request was queued for the worker
+                pool (the wait is recorded as llm_queue); None starts one here
         Returns:
             Dict with suggested resolution and similar tickets
         """
         try:
+            if trace is None:
+                trace = StageTrace()
+            else:
+                trace.add("llm_queue", trace.elapsed_ns())
             # Start total timer
             total_start_time = time.time()
-            # Combine inputs for better similarity search
-            # Match the weighting used during knowledge base building (3x category weight)
-            query_text = f"{category} {category} {category} {description}"
+            # Pin one snapshot for the whole request
+            kb = self.snapshot
+            with trace.span("encoding"):
+                query_text = self._build_query_text(category, description, kb)
             # Find similar tickets (time this step)
             search_start_time = time.time()
+            query_vec = None
+            if self.query_cache is not None and kb is not None:
+                with trace.span("encoding"):
+                    query_vec = kb.vectorizer.transform([query_text])
+                with trace.span("cache_lookup"):
+                    cache_generation = self.query_cache.generation
+                    cache_scope = self._query_cache_scope(kb, category, priority)
+                    cached = self.query_cache.lookup(query_vec, cache_scope)
+                if cached is not None:
+                    result = self._cached_resolution(
+                        category, *cached, total_start_time=total_start_time
+                    )
+                    self._record_trace(category, result, trace)
+                    return result
             similar_tickets = self.find_similar_tickets(
-                query_text, k=self.top_k, category=category
+                query_text,
+                k=self.top_k,
+                category=category,
+                query_vec=query_vec,
+                kb=kb,
+                trace=trace,
             )
             search_time = time.time() - search_start_time
-            if not similar_tickets:
-                logger.warning("No similar tickets found - Using AI-powered fallback")
-                # Generate AI-powered solution even without similar tickets
-                generation_start_time = time.time()
-                if self.has_ai_client():
-                    # Use Hugging Face to generate solution without similar tickets
-                    ai_resolution = self._generate_ai_fallback_resolution(
-                        category, priority, description
+            result = self._generate_resolution(
+                category,
+                priority,
+                description,
+                similar_tickets,
+                search_time,
+                total_start_time,
+                trace,
+            )
+            if query_vec is not None and self._is_query_cacheable(result):
+                self.query_cache.store(query_vec, cache_scope, result, cache_generation)
+            self._record_trace(category, result, trace)
+            return result
+        except Exception as e:
+            logger.error(f"Error generating resolution: {e}")
+            raise
+    def _query_cache_scope(
+        self, kb: KnowledgeBaseSnapshot, category: str, priority: str
+    ) -> str:
+        """
+        Query cache scope: entries never match across snapshots, categories or
+        priorities (the priority is part of the prompt).
+        """
+        return f"{kb.version}:{category.lower()}:{priority.lower()}"
+    def _is_query_cacheable(self, result: Dict) -> bool:
+        """
+        Only cache retrieval-backed answers from a healthy pipeline; AI fallback
+        output may be the generic error text and is not reused.
+        """
+        return (
+            result["method"] == "ai-refined"
+            and result["metadata"].get("model") != "template-fallback"
+        )
+    def stream_resolution(self, category: str, priority: str, description: str):
+        """
+        Streaming variant of suggest_resolution.
+        Yields (event, data) pairs:
+            similar_tickets: formatted similar tickets, as soon as retrieval is done
+            token: a chunk of the resolution text as the model produces it
+            error: the model failed part-way through its reply; the last
+                event, recorded as an error rather than a resolution
+            done: confidence, method, timing and metadata
+        The token texts concatenate to the suggested_resolution that
+        suggest_resolution would return for the same model reply.
+        """
+        trace = StageTrace()
+        total_start_time = time.time()
+        kb = self.snapshot
+        with trace.span("encoding"):
+            query_text = self._build_query_text(category, description, kb)
+        search_start_time = time.time()
+        query_vec = None
+        if self.query_cache is not None and kb is not None:
+            with trace.span("encoding"):
+                query_vec = kb.vectorizer.transform([query_text])
+            with trace.span("cache_lookup"):
+                cache_generation = self.query_cache.generation
+                cache_scope = self._query_cache_scope(kb, category, priority)
+                cached = self.query_cache.lookup(query_vec, cache_scope)
+            if cached is not None:
+                result = self._cached_resolution(
+                    category, *cached, total_start_time=total_start_time
+                )
+                self._record_trace(category, result, trace)
+                yield "similar_tickets", {
+                    "similar_tickets": result["similar_tickets"],
+                    "search_time_ms": result["timing"]["search_time_ms"],
+                }
+                yield "token", {"text": result["suggested_resolution"]}
+                yield "done", self._done_payload(result)
+                return
+        similar_tickets = self.find_similar_tickets(
+            query_text,
+            k=self.top_k,
+            category=category,
+            query_vec=query_vec,
+            kb=kb,
+            trace=trace,
+        )
+        search_time = time.time() - search_start_time
+        yield "similar_tickets", {
+            "similar_tickets": self._format_similar_tickets(similar_tickets),
+            "search_time_ms": round(search_time * 1000, 2),
+        }
+        generation_start_time = time.time()
+        if similar_tickets:
+            avg_similarity = float(
+                np.mean([t["similarity_score"] for t in similar_tickets])
+            )
+            deployment_name = "template"
+            streamed = False
+            if self.has_ai_client():
+                header, footer = self._refinement_wrapper(avg_similarity)
+                with trace.span("prompt_build"):
+                    messages = self._build_refinement_messages(
+                        category, priority, description, similar_tickets
                     )
-                    generation_time = time.time() - generation_start_time
-                    total_time = time.time() - total_start_time
-                    logger.info("=" * 60)
-                    logger.info("⚠️  NO SIMILAR TICKETS - AI FALLBACK MODE")
-                    logger.info("=" * 60)
-                    logger.info(f"🔍 Search time: {search_time * 1000:.2f} ms")
-                    logger.info(
-                        f"🤖 AI Generation time: {generation_time * 1000:.2f} ms"
+                # Includes time the client takes to read the streamed tokens
+                with trace.span("llm_generation"):
+                    outcome = yield from self._stream_ai_text(
+                        messages, 450, 0.4, header, footer
                     )
-                    logger.info(f"⚡ Total time: {total_time * 1000:.2f} ms")
-                    logger.info("=" * 60)
-                    # Record metrics
-                    try:
-                        metrics_tracker.record_query(
-                            category=category,
-                            response_time=total_time * 1000,
-                            confidence=0.5,  # Moderate confidence for AI-generated solutions
-                            success=True,
-                        )
-                    except Exception as e:
-                        logger.warning(f"Failed to record metrics: {e}")
-                    return {
-                        "suggested_resolution": ai_resolution,
-                        "confidence": 0.5,  # Moderate confidence for AI-generated
-                        "similar_tickets": [],
-                        "method": "ai-fallback",
-                        "timing": {
-                            "search_time_ms": round(search_time * 1000, 2),
-                            "generation_time_ms": round(generation_time * 1000, 2),
-                            "total_time_ms": round(total_time * 1000, 2),
-                        },
-                        "metadata": {
-                            "model": os.getenv("HF_MODEL", "Qwen/Qwen2.5-Coder-32B-Instruct"),
-                            "num_similar_tickets": 0,
-                            "ai_generated": True,
-                            "note": "Generated using AI without similar ticket context",
-                        },
-                    }
-                else:
-                    # No AI client available
-                    total_time = time.time() - total_start_time
-                    return {
-                        "suggested_resolution": "No similar tickets found. Please create a manual resolution or contact support.\n\nNote: AI-powered suggestions are currently unavailable. Please configure Hugging Face credentials to enable intelligent fallback solutions.",
-                        "confidence": 0.0,
-                        "similar_tickets": [],
-                        "method": "fallback",
-                        "timing": {
-                            "search_time_ms": round(search_time * 1000, 2),
-                            "generation_time_ms": 0,
-                            "total_time_ms": round(total_time * 1000, 2),
-                        },
-                        "metadata": {
-                            "num_similar_tickets": 0,
-                            "ai_unavailable": True,
-                        },
-                    }
-            # Generate resolution
-            generation_start_time = time.time()
-            # Calculate average similarity
-            avg_similarity = np.mean([t["similarity_score"] for t in similar_tickets])
-            # NEW STRATEGY: Always use AI to refine solutions (even 100% matches)
-            # This ensures every resolution is properly adapted and refined
-            use_ai_refinement = True
-            # Initialize deployment_name with default
-            deployment_name = "unknown"
-            # Debug: Check AI client status
-            logger.info(
-                f"AI Client available: {self.has_ai_client()}, HF Client: {self.hf_client is not None}"
+                if outcome == "failed":
+                    self._record_stream_failure(category, total_start_time)
+                    return
+                streamed = outcome == "streamed"
+                deployment_name = (
+                    os.getenv("HF_MODEL", "Qwen/Qwen2.5-Coder-32B-Instruct")
+                    if streamed
+                    else "template-fallback"
+                )
+            if not streamed:
+                with trace.span("template"):
+                    text = self._generate_template_resolution(similar_tickets[0])
+                yield "token", {"text": text}
+            generation_time = time.time() - generation_start_time
+            total_time = time.time() - total_start_time
+            result = self._refined_response(
+                "",
+                similar_tickets,
+                avg_similarity,
+                deployment_name,
+                search_time,
+                generation_time,
+                total_time,
             )
+            self._record_query_metrics(category, total_time, avg_similarity)
+        elif self.has_ai_client():
+            header, footer = self._fallback_wrapper()
+            with trace.span("prompt_build"):
+                messages = self._build_fallback_messages(category, priority, description)
+            with trace.span("llm_generation"):
+                outcome = yield from self._stream_ai_text(
+                    messages, 800, 0.7, header, footer
+                )
+            if outcome == "failed":
+                self._record_stream_failure(category, total_start_time)
+                return
+            if outcome == "unavailable":
+                yield "token", {
+                    "text": self._generic_fallback_resolution(category, priority)
+                }
+            generation_time = time.time() - generation_start_time
+            total_time = time.time() - total_start_time
+            result = self._ai_fallback_response(
+                "", search_time, generation_time, total_time
+            )
+            self._record_query_metrics(category, total_time, result["confidence"])
+        else:
+            result = self._no_ai_response(search_time, time.time() - total_start_time)
+            yield "token", {"text": result["suggested_resolution"]}
+        self._record_trace(category, result, trace)
+        logger.info(
+            f"⚡ Streamed resolution ({result['method']}) in {result['timing']['total_time_ms']:.2f} ms"
+        )
+        yield "done", self._done_payload(result)
+    def _stream_ai_text(
+        self,
+        messages: List[Dict],
+        max_tokens: int,
+        temperature: float,
+        header: str,
+        footer: str,
+    ):
+        """
+        Yield token events for header + streamed model reply + footer.
+        Returns "streamed" when the reply is complete. If the model fails
+        before its first chunk, returns "unavailable" having yielded nothing,
+        so the caller can substitute a non-AI resolution; if it fails after,
+        yields an error event instead of the footer and returns "failed".
+        """
+        started = False
+        try:
+            for text in self._stream_chat_completion(messages, max_tokens, temperature):
+                if not started:
+                    yield "token", {"text": header}
+                    started = True
+                yield "token", {"text": text}
+        except Exception as e:
+            logger.error(f"Hugging Face streaming call failed: {e}")
+            if not started:
+                return "unavailable"
+            yield "error", {"detail": str(e)}
+            return "failed"
+        if not started:
+            yield "token", {"text": header}
+        yield "token", {"text": footer}
+        return "streamed"
+    def _record_stream_failure(self, category: str, total_start_time: float):
+        """Record a stream that ended with an error event instead of a resolution."""
+        logger.info(
+            f"Streamed resolution failed after {(time.time() - total_start_time) * 1000:.2f} ms"
+        )
+        try:
+            metrics_tracker.record_error(category)
+        except Exception as e:
+            logger.warning(f"Failed to record metrics: {e}")
+    def _done_payload(self, result: Dict) -> Dict:
+        """Final streaming event: everything except the text and similar tickets."""
+        return {
+            key: value
+            for key, value in result.items()
+            if key not in ("suggested_resolution", "similar_tickets")
+        }
+    def _cached_resolution(
+        self, category: str, cached: Dict, similarity: float, total_start_time: float
+    ) -> Dict:
+        """Serve a near-duplicate query from the semantic query cache."""
+        total_time = time.time() - total_start_time
+        logger.info(
+            f"♻️  Semantic cache hit (similarity {similarity:.3f}) in {total_time * 1000:.2f} ms"
+        )
+        try:
+            metrics_tracker.record_query(
+                category=category,
+                response_time=total_time * 1000,
+                confidence=cached["confidence"],
+                success=True,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to record metrics: {e}")
+        return {
+            **cached,
+            "similar_tickets": [dict(t) for t in cached["similar_tickets"]],
+            "timing": {
+                "search_time_ms": round(total_time * 1000, 2),
+                "generation_time_ms": 0,
+                "total_time_ms": round(total_time * 1000, 2),
+            },
+            "metadata": {
+                **cached["metadata"],
+                "query_cache_hit": True,
+                "query_cache_similarity": round(similarity, 4),
+            },
+        }
+    def _build_query_text(
+        self, category: str, description: str, kb: KnowledgeBaseSnapshot = None
+    ) -> str:
+        """Combine inputs for similarity search, weighted like kb's documents (default: current)."""
+        if kb is None:
+            kb = self.snapshot
+        category_weight = kb.category_weight if kb is not None else 1
+        return weighted_text(category, description, category_weight)
+    def _generate_resolution(
+        self,
+        category: str,
+        priority: str,
+        description: str,
+        similar_tickets: List[Dict],
+        search_time: float,
+        total_start_time: float,
+        trace: StageTrace = NO_TRACE,
+    ) -> Dict:
+        """
+        Generation stage of suggest_resolution: AI refinement of the similar
+        tickets, AI fallback when there are none, or a template without AI.
+        Args:
+            category: Ticket category
+            priority: Ticket priority
+            description: Ticket description
+            similar_tickets: Output of find_similar_tickets
+            search_time: Seconds spent in retrieval
+            total_start_time: time.time() when the request started
+            trace: Request trace for the prompt, template and LLM stages
+        Returns:
+            Dict with suggested resolution and similar tickets
+        """
+        if not similar_tickets:
+            logger.warning("No similar tickets found - Using AI-powered fallback")
+            # Generate AI-powered solution even without similar tickets
+            generation_start_time = time.time()
             if self.has_ai_client():
-                # Use Hugging Face AI to refine solution based on similar tickets
+                # Use Hugging Face to generate solution without similar tickets
+                ai_resolution = self._generate_ai_fallback_resolution(
+                    category, priority, description, trace
+                )
+                generation_time = time.time() - generation_start_time
+                total_time = time.time() - total_start_time
+                logger.info("=" * 60)
+                logger.info("⚠️  NO SIMILAR TICKETS - AI FALLBACK MODE")
+                logger.info("=" * 60)
+                logger.info(f"🔍 Search time: {search_time * 1000:.2f} ms")
                 logger.info(
-                    f"🤖 Using AI to refine resolution (confidence: {avg_similarity:.1%})"
+                    f"🤖 AI Generation time: {generation_time * 1000:.2f} ms"
+                )
+                logger.info(f"⚡ Total time: {total_time * 1000:.2f} ms")
+                logger.info("=" * 60)
+                result = self._ai_fallback_response(
+                    ai_resolution, search_time, generation_time, total_time
                 )
-                try:
-                    # Build context from similar tickets
-                    similar_context = "\n\n".join(
-                        [
-                            f"Similar Ticket #{i+1} (Match: {t['similarity_score']:.0%}):\n"
-                            f"Category: {t['category']}\n"
-                            f"Description: {t['description'][:200]}\n"
-                            f"Resolution: {t['resolution'][:300]}"
-                            for i, t in enumerate(similar_tickets[:3])  # Top 3 matches
-                        ]
+                self._record_query_metrics(category, total_time, result["confidence"])
+                return result
+            else:
+                # No AI client available
+                total_time = time.time() - total_start_time
+                return self._no_ai_response(search_time, total_time)
+        # Generate resolution
+        generation_start_time = time.time()
+        # Calculate average similarity
+        avg_similarity = np.mean([t["similarity_score"] for t in similar_tickets])
+        # NEW STRATEGY: Always use AI to refine solutions (even 100% matches)
+        # This ensures every resolution is properly adapted and refined
+        # Initialize deployment_name with default
+        deployment_name = "unknown"
+        # Debug: Check AI client status
+        logger.info(
+            f"AI Client available: {self.has_ai_client()}, HF Client: {self.hf_client is not None}"
+        )
+        if self.has_ai_client():
+            # Use Hugging Face AI to refine solution based on similar tickets
+            logger.info(
+                f"🤖 Using AI to refine resolution (confidence: {avg_similarity:.1%})"
+            )
+            try:
+                # Call Hugging Face using chat completion format
+                with trace.span("prompt_build"):
+                    messages = self._build_refinement_messages(
+                        category, priority, description, similar_tickets
                     )
-                    # Create prompt for Hugging Face
-                    # Extract key info from best matches
-                    best_resolutions = "\n".join(
-                        [
-                            f"{i+1}. {t['resolution'][:250]}"
-                            for i, t in enumerate(similar_tickets[:3])
-                        ]
+                with trace.span("llm_generation"):
+                    ai_text = self._chat_completion(
+                        messages,
+                        max_tokens=450,  # Enough for detailed professional steps
+                        temperature=0.4,  # Lower for more professional, factual output
+                    )
+                header, footer = self._refinement_wrapper(avg_similarity)
+                suggested_resolution = f"{header}{ai_text}{footer}"
+                deployment_name = os.getenv(
+                    "HF_MODEL", "Qwen/Qwen2.5-Coder-32B-Instruct"
+                )
+            except Exception as e:
+                logger.error(f"Hugging Face AI call failed: {e}")
+                import traceback
+                logger.error(f"Traceback: {traceback.format_exc()}")
+                # Fallback to template-based resolution
+                with trace.span("template"):
+                    suggested_resolution = self._generate_template_resolution(
+                        similar_tickets[0]
                     )
-                    prompt = f"""You are a professional IT Support Specialist. Provide a clear, structured resolution for the following technical issue.
+                deployment_name = "template-fallback"
+        else:
+            # Use template-based resolution (no AI)
+            with trace.span("template"):
+                suggested_resolution = self._generate_template_resolution(
+                    similar_tickets[0]
+                )
+            deployment_name = "template"
+        generation_time = time.time() - generation_start_time
+        # Calculate total time
+        total_time = time.time() - total_start_time
+        # Confidence already calculated above
+        confidence = float(avg_similarity)
+        # Log timing information to console
+        logger.info("=" * 60)
+        logger.info("⏱️  PERFORMANCE METRICS")
+        logger.info("=" * 60)
+        logger.info(f"🔍 Search time: {search_time * 1000:.2f} ms")
+        logger.info(f"🤖 Generation time: {generation_time * 1000:.2f} ms")
+        logger.info(f"⚡ Total time: {total_time * 1000:.2f} ms")
+        logger.info(f"📊 Similar tickets found: {len(similar_tickets)}")
+        logger.info(f"🎯 Confidence: {confidence:.4f}")
+        logger.info(f"🤖 Resolution method: AI-Refined (Hugging Face)")
+        logger.info("=" * 60)
+        # Record metrics (store total response time in ms)
+        self._record_query_metrics(category, total_time, confidence)
+        return self._refined_response(
+            suggested_resolution,
+            similar_tickets,
+            confidence,
+            deployment_name,
+            search_time,
+            generation_time,
+            total_time,
+        )
+    def _build_refinement_messages(
+        self,
+        category: str,
+        priority: str,
+        description: str,
+        similar_tickets: List[Dict],
+    ) -> List[Dict]:
+        """Chat messages asking the model to refine the top similar resolutions."""
+        # Create prompt for Hugging Face
+        # Extract key info from best matches
+        best_resolutions = "\n".join(
+            [
+                f"{i+1}. {t['resolution'][:250]}"
+                for i, t in enumerate(similar_tickets[:3])
+            ]
+        )
+        prompt = f"""You are a professional IT Support Specialist. Provide a clear, structured resolution for the following technical issue.
 **Incident Details:**
 - Category: {category}
 - Priority: {priority}
@@ -518,134 +1257,508 @@ Provide a professional, step-by-step resolution (5-8 actionable steps) that:
 3. Provides troubleshooting alternatives
 4. Indicates when to escalate
 Format your response as numbered steps without preamble."""
-                    # Call Hugging Face using chat completion format
-                    messages = [{"role": "user", "content": prompt}]
-                    response = self.hf_client.chat_completion(
-                        messages=messages,
-                        max_tokens=450,  # Enough for detailed professional steps
-                        temperature=0.4,  # Lower for more professional, factual output
-                    )
-                    # Extract the response text
-                    ai_text = response.choices[0].message.content
-                    # Only show "no similar tickets" message if similarity is low (< 95%)
-                    if avg_similarity < 0.95:
-                        footer_message = "*No similar tickets found in the database. This resolution was generated using AI based on IT support best practices.*"
-                    else:
-                        footer_message = "*This resolution was generated by AI based on similar resolved tickets in the database.*"
-                    suggested_resolution = f"""## AI-Generated Resolution
-{ai_text}
----
-{footer_message}"""
-                    deployment_name = os.getenv(
-                        "HF_MODEL", "Qwen/Qwen2.5-Coder-32B-Instruct"
-                    )
-                except Exception as e:
-                    logger.error(f"Hugging Face AI call failed: {e}")
-                    import traceback
-                    logger.error(f"Traceback: {traceback.format_exc()}")
-                    # Fallback to template-based resolution
-                    suggested_resolution = self._generate_template_resolution(
-                        similar_tickets[0]
-                    )
-                    deployment_name = "template-fallback"
-            else:
-                # Use template-based resolution (no AI)
-                suggested_resolution = self._generate_template_resolution(
-                    similar_tickets[0]
-                )
-                deployment_name = "template"
-            generation_time = time.time() - generation_start_time
-            # Calculate total time
-            total_time = time.time() - total_start_time
-            # Confidence already calculated above
-            confidence = float(avg_similarity)
-            # Log timing information to console
-            logger.info("=" * 60)
-            logger.info("⏱️  PERFORMANCE METRICS")
-            logger.info("=" * 60)
-            logger.info(f"🔍 Search time: {search_time * 1000:.2f} ms")
-            logger.info(f"🤖 Generation time: {generation_time * 1000:.2f} ms")
-            logger.info(f"⚡ Total time: {total_time * 1000:.2f} ms")
-            logger.info(f"📊 Similar tickets found: {len(similar_tickets)}")
-            logger.info(f"🎯 Confidence: {confidence:.4f}")
-            logger.info(f"🤖 Resolution method: AI-Refined (Hugging Face)")
-            logger.info("=" * 60)
-            # Record metrics (store total response time in ms)
+        return [{"role": "user", "content": prompt}]
+    def _refinement_wrapper(self, avg_similarity: float):
+        """(header, footer) placed around AI-refined text."""
+        # Only show "no similar tickets" message if similarity is low (< 95%)
+        if avg_similarity < 0.95:
+            footer_message = "*No similar tickets found in the database. This resolution was generated using AI based on IT support best practices.*"
+        else:
+            footer_message = "*This resolution was generated by AI based on similar resolved tickets in the database.*"
+        return "## AI-Generated Resolution\n", f"\n---\n{footer_message}"
+    def _record_trace(self, category: str, result: Dict, trace: StageTrace):
+        """Record a request's stage latencies, labelled by category and how it was resolved."""
+        method = result["method"]
+        if result["metadata"].get("query_cache_hit"):
+            method = "query-cache"
+        elif result["metadata"].get("model") in ("template", "template-fallback"):
+            method = "template"
+        try:
+            metrics_tracker.record_stages(category, method, trace)
+        except Exception as e:
+            logger.warning(f"Failed to record stage metrics: {e}")
+    def _record_query_metrics(self, category: str, total_time: float, confidence: float):
+        """Record a completed query (total response time stored in ms)."""
+        try:
+            metrics_tracker.record_query(
+                category=category,
+                response_time=total_time * 1000,
+                confidence=confidence,
+                success=True,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to record metrics: {e}")
+    def _format_similar_tickets(self, similar_tickets: List[Dict]) -> List[Dict]:
+        """Format similar tickets for response."""
+        formatted_similar_tickets = []
+        for ticket in similar_tickets:
+            formatted_similar_tickets.append(
+                {
+                    "ticket_id": ticket.get("ticket_id", "N/A"),
+                    "category": ticket["category"],
+                    "description": ticket["description"][
+                        :200
+                    ],  # Truncate long descriptions
+                    "resolution": ticket["resolution"][
+                        :300
+                    ],  # Truncate long resolutions
+                    "priority": ticket.get("priority", "N/A"),
+                    "similarity_score": float(
+                        ticket["similarity_score"]
+                    ),  # Convert numpy float to Python float
+                }
+            )
+        return formatted_similar_tickets
+    def _refined_response(
+        self,
+        suggested_resolution: str,
+        similar_tickets: List[Dict],
+        confidence: float,
+        deployment_name: str,
+        search_time: float,
+        generation_time: float,
+        total_time: float,
+    ) -> Dict:
+        """Response for a resolution built from similar tickets."""
+        return {
+            "suggested_resolution": suggested_resolution,
+            "confidence": float(confidence),  # Ensure Python float
+            "similar_tickets": self._format_similar_tickets(similar_tickets),
+            "method": "ai-refined",
+            "timing": {
+                "search_time_ms": round(search_time * 1000, 2),
+                "generation_time_ms": round(generation_time * 1000, 2),
+                "total_time_ms": round(total_time * 1000, 2),
+            },
+            "metadata": {
+                "model": deployment_name,
+                "ai_provider": (
+                    self.ai_provider if self.has_ai_client() else "template"
+                ),
+                "num_similar_tickets": len(similar_tickets),
+                "avg_similarity": float(confidence),  # Ensure Python float
+                "resolution_strategy": "AI-Refined Resolution",
+                "ai_generated": True,  # Always using AI now
+            },
+        }
+    def _ai_fallback_response(
+        self,
+        ai_resolution: str,
+        search_time: float,
+        generation_time: float,
+        total_time: float,
+    ) -> Dict:
+        """Response for an AI resolution generated without similar tickets."""
+        return {
+            "suggested_resolution": ai_resolution,
+            "confidence": 0.5,  # Moderate confidence for AI-generated
+            "similar_tickets": [],
+            "method": "ai-fallback",
+            "timing": {
+                "search_time_ms": round(search_time * 1000, 2),
+                "generation_time_ms": round(generation_time * 1000, 2),
+                "total_time_ms": round(total_time * 1000, 2),
+            },
+            "metadata": {
+                "model": os.getenv("HF_MODEL", "Qwen/Qwen2.5-Coder-32B-Instruct"),
+                "num_similar_tickets": 0,
+                "ai_generated": True,
+                "note": "Generated using AI without similar ticket context",
+            },
+        }
+    def _no_ai_response(self, search_time: float, total_time: float) -> Dict:
+        """Response when there are no similar tickets and no AI client."""
+        return {
+            "suggested_resolution": "No similar tickets found. Please create a manual resolution or contact support.\n\nNote: AI-powered suggestions are currently unavailable. Please configure Hugging Face credentials to enable intelligent fallback solutions.",
+            "confidence": 0.0,
+            "similar_tickets": [],
+            "method": "fallback",
+            "timing": {
+                "search_time_ms": round(search_time * 1000, 2),
+                "generation_time_ms": 0,
+                "total_time_ms": round(total_time * 1000, 2),
+            },
+            "metadata": {
+                "num_similar_tickets": 0,
+                "ai_unavailable": True,
+            },
+        }
+    async def asuggest_resolution(
+        self, category: str, priority: str, description: str
+    ) -> Dict:
+        """
+        Async variant of suggest_resolution for use inside the event loop.
+        The blocking pipeline runs on the engine's bounded worker pool, so at most
+        LLM_MAX_CONCURRENCY tickets hit the model at once and the rest queue
+        without blocking other requests.
+        """
+        loop = asyncio.get_running_loop()
+        # Started now so the wait for a worker is recorded as llm_queue
+        trace = StageTrace()
+        return await loop.run_in_executor(
+            self._executor,
+            functools.partial(
+                self.suggest_resolution, category, priority, description, trace
+            ),
+        )
+    def suggest_resolutions(self, tickets: List[Dict]) -> Dict:
+        """
+        Suggest resolutions for a batch of tickets.
+        Retrieval for the whole batch is one vectorised pass (single transform,
+        single sparse matrix-matrix product); generation then runs on the worker
+        pool, so at most LLM_MAX_CONCURRENCY LLM calls are in flight.
+        Args:
+            tickets: Dicts with category, priority and description
+        Returns:
+            Dict with per-ticket results (None where a ticket failed), errors
+            and batch-level timing
+        """
+        batch_start_time = time.time()
+        if not tickets:
+            return self._batch_response(tickets, [], 0.0, batch_start_time)
+        similar, search_time = self._retrieve_batch(tickets)
+        share = search_time / len(tickets)
+        futures = [
+            self._executor.submit(
+                self._generate_batch_item, ticket, similar_tickets, share, StageTrace()
+            )
+            for ticket, similar_tickets in zip(tickets, similar)
+        ]
+        outcomes = []
+        for future in futures:
             try:
-                metrics_tracker.record_query(
-                    category=category,
-                    response_time=total_time * 1000,
-                    confidence=confidence,
-                    success=True,
-                )
+                outcomes.append(future.result())
             except Exception as e:
-                logger.warning(f"Failed to record metrics: {e}")
-            # Format similar tickets for response
-            formatted_similar_tickets = []
-            for ticket in similar_tickets:
-                formatted_similar_tickets.append(
-                    {
-                        "ticket_id": ticket.get("ticket_id", "N/A"),
-                        "category": ticket["category"],
-                        "description": ticket["description"][
-                            :200
-                        ],  # Truncate long descriptions
-                        "resolution": ticket["resolution"][
-                            :300
-                        ],  # Truncate long resolutions
-                        "priority": ticket.get("priority", "N/A"),
-                        "similarity_score": float(
-                            ticket["similarity_score"]
-                        ),  # Convert numpy float to Python float
-                    }
+                outcomes.append(e)
+        return self._batch_response(tickets, outcomes, search_time, batch_start_time)
+    async def asuggest_resolutions(self, tickets: List[Dict]) -> Dict:
+        """Async variant of suggest_resolutions for use inside the event loop."""
+        loop = asyncio.get_running_loop()
+        batch_start_time = time.time()
+        if not tickets:
+            return self._batch_response(tickets, [], 0.0, batch_start_time)
+        similar, search_time = await loop.run_in_executor(
+            self._executor, self._retrieve_batch, tickets
+        )
+        share = search_time / len(tickets)
+        outcomes = await asyncio.gather(
+            *(
+                loop.run_in_executor(
+                    self._executor,
+                    self._generate_batch_item,
+                    ticket,
+                    similar_tickets,
+                    share,
+                    StageTrace(),
                 )
-            return {
-                "suggested_resolution": suggested_resolution,
-                "confidence": float(confidence),  # Ensure Python float
-                "similar_tickets": formatted_similar_tickets,
-                "method": "ai-refined",
-                "timing": {
-                    "search_time_ms": round(search_time * 1000, 2),
-                    "generation_time_ms": round(generation_time * 1000, 2),
-                    "total_time_ms": round(total_time * 1000, 2),
-                },
-                "metadata": {
-                    "model": deployment_name,
-                    "ai_provider": (
-                        self.ai_provider if self.has_ai_client() else "template"
-                    ),
-                    "num_similar_tickets": len(similar_tickets),
-                    "avg_similarity": float(confidence),  # Ensure Python float
-                    "resolution_strategy": "AI-Refined Resolution",
-                    "ai_generated": True,  # Always using AI now
-                },
-            }
+                for ticket, similar_tickets in zip(tickets, similar)
+            ),
+            return_exceptions=True,
+        )
+        return self._batch_response(tickets, outcomes, search_time, batch_start_time)
+    def _retrieve_batch(self, tickets: List[Dict]):
+        """
+        Batched retrieval stage. Returns (similar tickets per ticket, seconds).
+        Its stages are recorded once per batch, with method "batch".
+        """
+        search_start_time = time.time()
+        trace = StageTrace()
+        kb = self._require_snapshot()
+        with trace.span("encoding"):
+            query_texts = [
+                self._build_query_text(t["category"], t["description"], kb)
+                for t in tickets
+            ]
+        similar = self.find_similar_tickets_batch(
+            query_texts,
+            k=self.top_k,
+            categories=[t["category"] for t in tickets],
+            kb=kb,
+            trace=trace,
+        )
+        try:
+            metrics_tracker.record_stages("all", "batch", trace)
         except Exception as e:
-            logger.error(f"Error generating resolution: {e}")
-            raise
-    def is_ready(self) -> bool:
-        """Check if RAG engine is ready."""
+            logger.warning(f"Failed to record stage metrics: {e}")
+        return similar, time.time() - search_start_time
+    def _generate_batch_item(
+        self,
+        ticket: Dict,
+        similar_tickets: List[Dict],
+        search_time: float,
+        trace: StageTrace = None,
+    ) -> Dict:
+        """
+        Generation stage for one batch ticket, charged its share of the search.
+        trace, if given, was started when the ticket was queued for a worker.
+        """
+        if trace is None:
+            trace = StageTrace()
+        else:
+            trace.add("llm_queue", trace.elapsed_ns())
+        # Backdate the start so total_time_ms stays comparable to the single path
+        total_start_time = time.time() - search_time
+        result = self._generate_resolution(
+            ticket["category"],
+            ticket["priority"],
+            ticket["description"],
+            similar_tickets,
+            search_time,
+            total_start_time,
+            trace,
+        )
+        self._record_trace(ticket["category"], result, trace)
+        return result
+    def _batch_response(
+        self,
+        tickets: List[Dict],
+        outcomes: List,
+        search_time: float,
+        batch_start_time: float,
+    ) -> Dict:
+        """Assemble the batch result, turning per-ticket exceptions into errors."""
+        results = []
+        errors = []
+        for index, (ticket, outcome) in enumerate(zip(tickets, outcomes)):
+            if isinstance(outcome, Exception):
+                logger.error(f"Batch ticket {index} failed: {outcome}")
+                metrics_tracker.record_error(ticket.get("category", "unknown"))
+                results.append(None)
+                errors.append({"index": index, "detail": str(outcome)})
+            else:
+                results.append(outcome)
+        total_time = time.time() - batch_start_time
+        return {
+            "results": results,
+            "errors": errors,
+            "timing": {
+                "num_tickets": len(tickets),
+                "search_time_ms": round(search_time * 1000, 2),
+                "total_time_ms": round(total_time * 1000, 2),
+            },
+        }
+    def add_tickets(self, tickets: List[Dict]) -> Dict:
+        """
+        Add resolved tickets to the knowledge base without a rebuild.
+        Tickets are transformed with the current vocabulary into the delta
+        segment, searchable immediately, and logged so they survive a restart.
+        Merging into the knowledge base directory and refitting the vocabulary
+        run in the background when due.
+        Args:
+            tickets: Dicts with category, description and resolution, and
+                optionally ticket_id, priority and status
+        Returns:
+            Ingestion summary with the assigned ticket IDs
+        """
+        self._require_snapshot()
+        with self._kb_lock:
+            kb, added = self.snapshot.ingest(tickets)
+            stale = False
+            if kb.kb_dir:
+                root = kb_dir_for(self.knowledge_base_path)
+                with kb_write_lock(root):
+                    # Another worker may have published a version since this
+                    # snapshot was loaded; only the live version's log is merged
+                    live_dir = live_kb_dir(root)
+                    append_delta_log(live_dir, added)
+                stale = live_dir != kb.kb_dir
+            self._publish(kb)
+            refit = self._refit_due(kb)
+            merge = refit or len(kb.delta) >= self.delta_merge_rows
+            scheduled = merge and self._schedule_maintenance(refit)
+            if stale and not scheduled and not self._reload_queued():
+                logger.info("Knowledge base version changed on disk, reloading it")
+                self.reload_knowledge_base()
+        logger.info(f"Ingested {len(added)} tickets ({len(kb.delta)} in delta segment)")
+        return {
+            "added": len(added),
+            "ticket_ids": [t["ticket_id"] for t in added],
+            "total_tickets": len(kb),
+            "delta_tickets": len(kb.delta),
+            "merge_scheduled": scheduled,
+            "refit_scheduled": scheduled and refit,
+            "drift": round(kb.vocabulary_drift(), 4),
+        }
+    def vocabulary_drift(self) -> float:
+        """Out-of-vocabulary drift of ingested tickets (see KnowledgeBaseSnapshot)."""
+        kb = self.snapshot
+        return kb.vocabulary_drift() if kb is not None else 0.0
+    def _refit_due(self, kb: KnowledgeBaseSnapshot) -> bool:
+        if not kb.drift["tickets"]:
+            return False
+        if self.refit_interval > 0 and time.time() - kb.fitted_at >= self.refit_interval:
+            return True
         return (
-            self.tickets is not None
-            and self.vectorizer is not None
-            and self.tfidf_matrix is not None
+            kb.drift["tickets"] >= self.refit_min_tickets
+            and kb.vocabulary_drift() > self.refit_drift
         )
+    def _schedule_maintenance(self, refit: bool) -> bool:
+        """Queue a background merge (or refit); False if one is already queued."""
+        if self._maintenance_pending or not self.snapshot.kb_dir:
+            return False
+        self._maintenance_pending = True
+        self._maintenance.submit(self._run_maintenance, refit)
+        return True
+    def _run_maintenance(self, refit: bool):
+        """
+        Fold the delta log into a new knowledge base version, optionally
+        refitting the vocabulary and IDF on all tickets, then publish it.
+        Workers share the knowledge base directory, so the merge starts from
+        the live version and its log (every worker's ingested tickets), not
+        from this worker's snapshot. If another worker publishes first, the
+        merge starts again from that version. Tickets logged while it runs
+        are written to the new version's log before it goes live, so a crash
+        on either side of the swap loses no ingested ticket and replays none
+        twice.
+        """
+        start_time = time.time()
+        root = kb_dir_for(self.knowledge_base_path)
+        try:
+            while True:
+                # Load under the lock: a concurrent publish cannot prune the
+                # version before it is memory-mapped
+                with kb_write_lock(root):
+                    live_dir = live_kb_dir(root)
+                    logged = read_delta_log(live_dir)
+                    build_config = build_config_from_manifest(read_manifest(live_dir))
+                    base_tickets, vectorizer, base_matrix = load_kb_dir(live_dir)
+                category_weight = build_config["category_weight"]
+                logged = [normalize_ticket(t, base_tickets.fields) for t in logged]
+                tickets = base_tickets
+                if logged:
+                    tickets = TicketStore.concat([base_tickets, TicketStore.from_dicts(logged)])
+                if refit:
+                    vectorizer = make_vectorizer({"vectorizer": vectorizer.get_params()})
+                    matrix = vectorizer.fit_transform(
+                        document_text(t, category_weight) for t in tickets
+                    )
+                else:
+                    rows = vectorizer.transform([document_text(t, category_weight) for t in logged])
+                    matrix = sp.vstack([base_matrix, rows], format="csr")
+                version_dir = write_kb_version(
+                    root, tickets, vectorizer, matrix, build_config=build_config
+                )
+                # Reload so the new segment is memory-mapped like one loaded at startup
+                merged = self._open_kb_dir(
+                    version_dir, fitted_at=None if refit else self.snapshot.fitted_at
+                )
+                # Ingestion holds both locks to append, so nothing is added
+                # to the old log between reading its tail and the swap
+                with self._kb_lock, kb_write_lock(root):
+                    if live_kb_dir(root) != live_dir:
+                        shutil.rmtree(version_dir, ignore_errors=True)
+                        logger.info("Another worker published a knowledge base version, merging again")
+                        continue
+                    remaining = read_delta_log(live_dir)[len(logged):]
+                    write_delta_log(version_dir, remaining)
+                    publish_kb_version(root, version_dir)
+                    live = self.snapshot
+                    # Rows ingested meanwhile are transformed with the new vocabulary
+                    merged, _ = merged.ingest(remaining)
+                    if not refit:
+                        merged = merged.with_delta(merged.delta, live.drift)
+                    self._publish(merged)
+                break
+            logger.info(
+                f"{'Refit' if refit else 'Merged'} knowledge base: {len(tickets)} tickets "
+                f"({len(logged)} from the delta log) in {(time.time() - start_time) * 1000:.0f} ms"
+            )
+        except Exception as e:
+            logger.error(f"Knowledge base maintenance failed: {e}")
+        finally:
+            self._maintenance_pending = False
+    def shutdown(self):
+        """Stop the worker pools, waiting for in-flight work to finish."""
+        self._executor.shutdown(wait=True)
+        self._maintenance.shutdown(wait=True)
+    def is_ready(self) -> bool:
+        """Check if RAG engine is ready."""
+        return self.snapshot is not None
+    def get_load_status(self) -> Dict:
+        """Startup state and stage, with seconds spent warming so far (or in total)."""
+        status = dict(self.load_status)
+        if "load_seconds" not in status:
+            status["elapsed_seconds"] = round(time.time() - status["started_at"], 3)
+        return status
+    def _require_snapshot(self) -> KnowledgeBaseSnapshot:
+        kb = self.snapshot
+        if kb is None:
+            raise RuntimeError("RAG engine not ready. Knowledge base not loaded.")
+        return kb
+    # Read-only views of the current snapshot
+    @property
+    def tickets(self) -> Optional[TicketStore]:
+        return self.snapshot.tickets if self.snapshot is not None else None
+    @property
+    def vectorizer(self):
+        return self.snapshot.vectorizer if self.snapshot is not None else None
+    @property
+    def tfidf_matrix(self):
+        return self.snapshot.tfidf_matrix if self.snapshot is not None else None
+    @property
+    def delta(self):
+        return self.snapshot.delta if self.snapshot is not None else None
+    @property
+    def kb_dir(self) -> Optional[str]:
+        return self.snapshot.kb_dir if self.snapshot is not None else None
     def get_knowledge_base_size(self) -> int:
         """Get the number of tickets in knowledge base."""
-        return len(self.tickets) if self.tickets else 0
+        kb = self.snapshot
+        return len(kb) if kb is not None else 0
     def get_top_categories(self, limit: int = 10) -> Dict:
         """Get top categories from knowledge base."""
-        if not self.tickets:
+        kb = self.snapshot
+        if kb is None:
             return {}
-        categories = {}
-        for ticket in self.tickets:
-            cat = ticket.get("category", "Unknown")
-            categories[cat] = categories.get(cat, 0) + 1
+        categories = kb.tickets.value_counts("category")
+        for category, count in kb.delta.store.value_counts("category").items():
+            categories[category] = categories.get(category, 0) + count
         # Sort by count and return top
         sorted_categories = sorted(categories.items(), key=lambda x: x[1], reverse=True)
         return dict(sorted_categories[:limit])
-    def reload_knowledge_base(self):
-        """Reload the knowledge base from disk."""
-        logger.info("Reloading knowledge base...")
-        self._load_knowledge_base()
-        logger.info("Knowledge base reloaded successfully")
+    def reload_knowledge_base(self) -> Dict:
+        """
+        Queue a reload of the knowledge base from disk and return its job.
+        The new snapshot is built and validated on the maintenance worker and
+        published with one reference swap; queries keep using the current one
+        until then, and keep it if the reload fails. Poll get_reload_job().
+        """
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": "queued",
+            "created_at": time.time(),
+        }
+        with self._kb_lock:
+            self._reload_jobs[job["job_id"]] = job
+            while len(self._reload_jobs) > RELOAD_JOB_HISTORY:
+                self._reload_jobs.popitem(last=False)
+        self._maintenance.submit(self._run_reload, job)
+        logger.info(f"Queued knowledge base reload {job['job_id']}")
+        return dict(job)
+    def _reload_queued(self) -> bool:
+        return any(job["status"] in ("queued", "running") for job in self._reload_jobs.values())
+    def get_reload_job(self, job_id: str) -> Optional[Dict]:
+        """Status of a reload job, or None if unknown (or too old to be kept)."""
+        job = self._reload_jobs.get(job_id)
+        return dict(job) if job is not None else None
+    def _run_reload(self, job: Dict):
+        start_time = time.time()
+        job["status"] = "running"
+        try:
+            snapshot = self._load_snapshot()
+            if snapshot is None:
+                raise RuntimeError("No knowledge base could be loaded or built")
+            with self._kb_lock:
+                snapshot = self._carry_delta(snapshot)
+                self._publish(snapshot)
+            if self.load_status["state"] != "ready":
+                # A reload can recover an engine whose startup load failed
+                self.load_status.pop("error", None)
+                self.load_status.update(state="ready", stage="ready")
+            job.update(status="succeeded", total_tickets=len(snapshot))
+            logger.info(f"Knowledge base reloaded successfully ({len(snapshot)} tickets)")
+        except Exception as e:
+            logger.error(f"Knowledge base reload failed, keeping the current one: {e}")
+            job.update(status="failed", error=str(e))
+        finally:
+            job["duration_ms"] = round((time.time() - start_time) * 1000, 2)
@@ -0,0 +1,241 @@
+"""
+Retrieval kernels for the TF-IDF knowledge base.
+Rows of the TF-IDF matrix and query vectors are L2-normalised, so cosine
+similarity is a plain sparse dot product.
+"""
+import threading
+import numpy as np
+import scipy.sparse as sp
+from typing import Dict, List, Sequence, Tuple
+# Re-ranking boosts: exact category match, and at least KEYWORD_MIN_OVERLAP
+# query words shared with the ticket's description and resolution
+CATEGORY_BOOST = 1.3
+KEYWORD_BOOST = 1.15
+KEYWORD_MIN_OVERLAP = 2
+MAX_BOOST = CATEGORY_BOOST * KEYWORD_BOOST
+def top_k_similar(tfidf_matrix, query_vec, n: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Score every document against a query and keep the best n.
+    Only documents sharing at least one term with the query get a score, so
+    zero-similarity rows never enter the candidate set. Candidates are ordered
+    by descending score, ties broken by row index for stable results.
+    Args:
+        tfidf_matrix: CSR matrix (n_docs x n_features), rows L2-normalised
+        query_vec: 1 x n_features sparse query vector, L2-normalised
+        n: Number of candidates to keep
+    Returns:
+        (row indices, scores) as NumPy arrays of length <= n
+    """
+    # Sparse (n_docs x 1) result: only rows with a shared term are materialised
+    scores = (tfidf_matrix @ query_vec.T).tocoo()
+    return _select_top_n(scores.row, scores.data, n)
+def top_k_similar_batch(
+    tfidf_matrix, query_matrix, n: int
+) -> List[Tuple[np.ndarray, np.ndarray]]:
+    """
+    Batched top_k_similar: scores all queries with one sparse matrix-matrix
+    product and selects the best n rows per query.
+    Args:
+        tfidf_matrix: CSR matrix (n_docs x n_features), rows L2-normalised
+        query_matrix: n_queries x n_features sparse matrix, rows L2-normalised
+        n: Number of candidates to keep per query
+    Returns:
+        One (row indices, scores) pair per query
+    """
+    # (n_docs x n_queries) in CSC: column j holds the nonzero scores of query j
+    scores = (tfidf_matrix @ query_matrix.T).tocsc()
+    results = []
+    for j in range(scores.shape[1]):
+        start, end = scores.indptr[j], scores.indptr[j + 1]
+        results.append(_select_top_n(scores.indices[start:end], scores.data[start:end], n))
+    return results
+def _select_top_n(
+    rows: np.ndarray, values: np.ndarray, n: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Pick the n best (row, score) pairs, sorted by score then row index."""
+    if n <= 0 or values.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+    if values.size > n:
+        # O(nnz) selection of the n best; only those are sorted below
+        keep = np.argpartition(-values, n - 1)[:n]
+        rows = rows[keep]
+        values = values[keep]
+    order = np.lexsort((rows, -values))
+    return rows[order].astype(np.int64, copy=False), values[order]
+def rerank(
+    rows: np.ndarray,
+    scores: np.ndarray,
+    category_match: np.ndarray,
+    keyword_overlap: np.ndarray,
+    k: int,
+    min_similarity: float,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Boost retrieval candidates, apply the similarity threshold and keep the best k.
+    The threshold is applied to boosted scores, so a candidate in the right
+    category just under min_similarity is kept. Boosted scores are capped at
+    1.0, so equal boosted scores (typically at the cap) are ordered by cosine
+    similarity, then retrieval order.
+    Args:
+        rows: Candidate row indices, in retrieval order
+        scores: Their cosine similarities
+        category_match: Boolean mask of candidates in the requested category
+        keyword_overlap: Query words shared with each candidate's keyword set
+        k: Number of results to keep
+        min_similarity: Threshold on the boosted score
+    Returns:
+        (row indices, boosted scores) of length <= k, best first
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    boosted = np.where(
+        category_match, np.minimum(scores * CATEGORY_BOOST, 1.0), scores
+    )
+    boosted = np.where(
+        np.asarray(keyword_overlap) >= KEYWORD_MIN_OVERLAP,
+        np.minimum(boosted * KEYWORD_BOOST, 1.0),
+        boosted,
+    )
+    passed = np.flatnonzero(boosted >= min_similarity)
+    # lexsort is stable and sorts by its last key first
+    order = passed[np.lexsort((-scores[passed], -boosted[passed]))[:k]]
+    return np.asarray(rows)[order], boosted[order]
+class CategoryPartitions:
+    """
+    Rows of the TF-IDF matrix grouped by category code.
+    rows lists the row indices ordered by category code (ascending row index
+    within a category) and offsets[c]:offsets[c + 1] delimits category c.
+    category_matrix holds the matrix's rows in that order, so each category
+    is a contiguous slice of it, scored in place without copying. It is
+    stored with the knowledge base and memory-mapped like the matrix; for
+    knowledge bases written without it, it is built in memory on first use.
+    """
+    def __init__(self, tfidf_matrix, rows: np.ndarray, offsets: np.ndarray, category_matrix=None):
+        self.tfidf_matrix = tfidf_matrix
+        self.rows = np.asarray(rows)
+        self.offsets = np.asarray(offsets)
+        self._category_matrix = category_matrix
+        self._slices: Dict[int, sp.csr_matrix] = {}
+        self._lock = threading.Lock()
+    @property
+    def category_matrix(self) -> sp.csr_matrix:
+        if self._category_matrix is None:
+            with self._lock:
+                if self._category_matrix is None:
+                    self._category_matrix = sp.csr_matrix(self.tfidf_matrix[self.rows])
+        return self._category_matrix
+    def partition(self, code: int) -> sp.csr_matrix:
+        """CSR view of category code's rows, sharing the category matrix's arrays."""
+        view = self._slices.get(code)
+        if view is None:
+            matrix = self.category_matrix
+            start, end = int(self.offsets[code]), int(self.offsets[code + 1])
+            first, last = matrix.indptr[start], matrix.indptr[end]
+            # Assigned rather than passed to the constructor, which copies
+            # arrays that are small views of a larger one
+            view = sp.csr_matrix((end - start, matrix.shape[1]), dtype=matrix.dtype)
+            view.data = matrix.data[first:last]
+            view.indices = matrix.indices[first:last]
+            view.indptr = (matrix.indptr[start : end + 1] - first).astype(matrix.indices.dtype)
+            self._slices[code] = view
+        return view
+    def top_k(
+        self, query_vec, codes: Sequence[int], n: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """top_k_similar restricted to the given categories, with global row indices."""
+        found_rows = []
+        found_scores = []
+        for code in sorted(set(codes)):
+            local_rows, scores = top_k_similar(self.partition(code), query_vec, n)
+            found_rows.append(self.rows[self.offsets[code] + local_rows])
+            found_scores.append(scores)
+        if len(found_rows) == 1:
+            # Rows ascend within a category, so ties are already by row index
+            return found_rows[0], found_scores[0]
+        if not found_rows:
+            return _select_top_n(np.empty(0, dtype=np.int64), np.empty(0), n)
+        return _select_top_n(np.concatenate(found_rows), np.concatenate(found_scores), n)
+class InvertedIndex:
+    """
+    Term -> postings view of the TF-IDF matrix (CSC layout).
+    Queries only touch the posting lists of their own terms, so latency grows
+    with posting-list length rather than corpus size. Optional MaxScore-style
+    early termination skips postings that cannot change the top-k.
+    """
+    def __init__(self, tfidf_matrix):
+        postings = tfidf_matrix.tocsc()
+        postings.sort_indices()
+        self.n_docs, self.n_terms = postings.shape
+        self.indptr = postings.indptr
+        self.doc_ids = postings.indices
+        self.weights = postings.data
+        # Upper bound of each term's contribution to any document's score
+        self.max_weights = np.zeros(self.n_terms, dtype=np.float64)
+        lengths = np.diff(self.indptr)
+        non_empty = lengths > 0
+        if self.weights.size:
+            self.max_weights[non_empty] = np.maximum.reduceat(
+                self.weights, self.indptr[:-1][non_empty]
+            )
+    def top_k(
+        self,
+        query_vec,
+        n: int,
+        early_termination: bool = True,
+        min_score: float = 0.0,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Accumulate scores term-at-a-time over the query's posting lists.
+        Terms are visited in decreasing order of their score upper bound. Once
+        n candidates are known, documents not yet seen are only admitted while
+        the remaining terms could still lift them to the current n-th best
+        score (or min_score, whichever is higher), and candidates that can no
+        longer reach it are dropped.
+        Args:
+            query_vec: 1 x n_features sparse query vector, L2-normalised
+            n: Number of candidates to keep
+            early_termination: Enable MaxScore pruning
+            min_score: Scores below this are never needed by the caller
+        Returns:
+            (row indices, scores) ordered like top_k_similar
+        """
+        query = query_vec.tocsr()
+        terms = query.indices
+        query_weights = query.data
+        bounds = query_weights * self.max_weights[terms]
+        order = np.argsort(-bounds, kind="stable")
+        order = order[bounds[order] > 0]
+        terms, query_weights, bounds = terms[order], query_weights[order], bounds[order]
+        # remaining[i] = best possible score from terms i.. onwards
+        remaining = np.concatenate([np.cumsum(bounds[::-1])[::-1], [0.0]])
+        cand_ids = np.empty(0, dtype=self.doc_ids.dtype)
+        cand_scores = np.empty(0, dtype=np.float64)
+        threshold = min_score if early_termination else 0.0
+        for i, term in enumerate(terms):
+            start, end = self.indptr[term], self.indptr[term + 1]
+            docs = self.doc_ids[start:end]
+            contrib = self.weights[start:end] * query_weights[i]
+            if early_termination and remaining[i] < threshold:
+                # Unseen documents can no longer make the cut: only update
+                # existing candidates (postings are sorted by doc id)
+                if cand_ids.size:
+                    pos = np.searchsorted(docs, cand_ids)
+                    pos[pos == docs.size] = 0
+                    hit = docs[pos] == cand_ids
+                    cand_scores[hit] += contrib[pos[hit]]
+            else:
+                cand_ids, inverse = np.unique(
+                    np.concatenate([cand_ids, docs]), return_inverse=True
+                )
+                cand_scores = np.bincount(
+                    inverse,
+                    weights=np.concatenate([cand_scores, contrib]),
+                    minlength=cand_ids.size,
+                )
+            if early_termination and cand_ids.size >= n > 0:
+                kth_best = np.partition(cand_scores, cand_ids.size - n)[
+                    cand_ids.size - n
+                ]
+                threshold = max(threshold, kth_best)
+                alive = cand_scores + remaining[i + 1] >= threshold
+                cand_ids, cand_scores = cand_ids[alive], cand_scores[alive]
+        return _select_top_n(cand_ids, cand_scores, n)
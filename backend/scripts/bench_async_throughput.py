@@ -0,0 +1,118 @@
+"""
+Benchmark - Concurrent Resolution Throughput
+
+Compares the old blocking request path (sync suggest_resolution called from
+inside the event loop) against RAGEngine.asuggest_resolution. The LLM is
+replaced by a client that sleeps for a fixed latency so the numbers reflect
+scheduling, not model speed. The LLM and query caches are turned off so every
+request pays that latency instead of repeating a cached answer.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_ROOT))
+
+from rag_engine_tfidf import RAGEngine  # noqa: E402
+
+SAMPLE_TICKETS = [
+    ("Password Reset", "Medium", "I forgot my password and cannot login"),
+    ("Network Problem", "High", "Cannot connect to Wi-Fi network"),
+    ("Email Issues", "Medium", "Emails not syncing on mobile device"),
+    ("Hardware Request", "Low", "Laptop battery not holding charge"),
+]
+
+
+class SimulatedLLMClient:
+    """Stand-in for InferenceClient that blocks like a real HTTP call."""
+
+    def __init__(self, latency_ms):
+        self.latency_s = latency_ms / 1000.0
+
+    def chat_completion(self, messages, max_tokens=None, temperature=None):
+        time.sleep(self.latency_s)
+        message = SimpleNamespace(content="1. Simulated resolution step.")
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+
+async def _probe_loop_latency(stop, samples):
+    """Measure how late a 10 ms timer fires - a proxy for /health latency."""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        samples.append((time.perf_counter() - start - 0.01) * 1000)
+
+
+async def _run(engine, n_requests, use_async):
+    tickets = [SAMPLE_TICKETS[i % len(SAMPLE_TICKETS)] for i in range(n_requests)]
+
+    async def blocking_request(ticket):
+        # What app.suggest_resolution used to do: sync call inside async def
+        return engine.suggest_resolution(*ticket)
+
+    async def async_request(ticket):
+        return await engine.asuggest_resolution(*ticket)
+
+    handler = async_request if use_async else blocking_request
+    stop = asyncio.Event()
+    samples = []
+    probe = asyncio.create_task(_probe_loop_latency(stop, samples))
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    await asyncio.gather(*(handler(t) for t in tickets))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await probe
+    return elapsed, max(samples) if samples else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark concurrent throughput")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument(
+        "--kb",
+        type=str,
+        default=str(BACKEND_ROOT / "data" / "knowledge_base.pkl"),
+        help="Knowledge base path",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    os.chdir(BACKEND_ROOT)
+    engine = RAGEngine(knowledge_base_path=args.kb)
+    if not engine.is_ready():
+        print("❌ Knowledge base not loaded")
+        return
+    engine.hf_client = SimulatedLLMClient(args.llm_latency_ms)
+    # The sample tickets repeat, so cached answers would hide the LLM latency
+    engine.llm_cache = None
+    engine.query_cache = None
+
+    print("=" * 60)
+    print("CONCURRENT THROUGHPUT BENCHMARK")
+    print("=" * 60)
+    print(f"Requests: {args.requests}")
+    print(f"Simulated LLM latency: {args.llm_latency_ms:.0f} ms")
+    print(f"Worker pool size (LLM_MAX_CONCURRENCY): {engine.max_concurrency}")
+    print("LLM and query caches: off")
+
+    for label, use_async in (("blocking (before)", False), ("async (after)", True)):
+        elapsed, worst_lag = asyncio.run(_run(engine, args.requests, use_async))
+        print(f"\n{label}:")
+        print(f"  Wall time: {elapsed:.2f} s")
+        print(f"  Throughput: {args.requests / elapsed:.1f} req/s")
+        print(f"  Worst event-loop stall: {worst_lag:.1f} ms")
+
+    engine.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark - Cold Start
+
+Starts the service with uvicorn in a subprocess and times, from process
+launch: the port accepting connections, /health/live answering and
+/health/ready turning 200 once the knowledge base has loaded. Orchestrators
+only need the first two to consider the container started.
+"""
+
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+
+
+def _port_open(port):
+    with socket.socket() as sock:
+        sock.settimeout(0.2)
+        return sock.connect_ex(("127.0.0.1", port)) == 0
+
+
+def _get(port, path):
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=2) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read() or b"{}")
+    except OSError:
+        return None, None
+
+
+def measure(port, timeout, interval):
+    """Seconds from launch to bound port, live and ready (None if not reached)."""
+    env = dict(os.environ, PYTHONUNBUFFERED="1")
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_ROOT,
+        env=env,
+    )
+    times = {"bound": None, "live": None, "ready": None}
+    try:
+        while time.perf_counter() - start < timeout and process.poll() is None:
+            elapsed = time.perf_counter() - start
+            if times["bound"] is None and _port_open(port):
+                times["bound"] = elapsed
+            if times["bound"] is not None:
+                if times["live"] is None and _get(port, "/health/live")[0] == 200:
+                    times["live"] = time.perf_counter() - start
+                status, body = _get(port, "/health/ready")
+                if status == 200:
+                    times["ready"] = time.perf_counter() - start
+                    break
+                if body and body.get("status") == "failed":
+                    print(f"Knowledge base failed to load: {body['load'].get('error')}")
+                    break
+            time.sleep(interval)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure service cold-start times")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=300.0, help="Seconds per run")
+    parser.add_argument("--interval", type=float, default=0.02, help="Poll interval (s)")
+    args = parser.parse_args()
+
+    print(f"{'run':>4}  {'port bound':>11}  {'live':>8}  {'ready':>8}")
+    for run in range(1, args.runs + 1):
+        times = measure(args.port, args.timeout, args.interval)
+        cells = [f"{t:.2f} s" if t is not None else "-" for t in times.values()]
+        print(f"{run:>4}  {cells[0]:>11}  {cells[1]:>8}  {cells[2]:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Benchmark - Streaming Knowledge Base Build
+
+Writes a synthetic ticket history of the requested size and format, then
+times the streaming reader on its own and the full TF-IDF build, reporting
+rows/sec and peak resident memory of the streaming build. --workers times
+the build with the parallel TF-IDF fit instead (0 = one process per core).
+--compare-single then also times the build with a single-process fit and
+reports the measured speedup. --baseline also times the previous whole-file
+pandas load + iterrows loop on the same file.
+"""
+
+import argparse
+import csv
+import random
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from build_knowledge_base_tfidf import build_knowledge_base_tfidf  # noqa: E402
+from ticket_source import CHUNK_ROWS, TICKET_FIELDS, read_ticket_chunks  # noqa: E402
+
+CATEGORIES = [
+    "Password Reset",
+    "Network Problem",
+    "Email Issues",
+    "Hardware Request",
+    "Software Bug",
+    "VPN Access",
+]
+WORDS = (
+    "cannot login password expired account locked wifi drops vpn tunnel outlook "
+    "sync mobile laptop battery charging teams crashes startup printer offline "
+    "driver update certificate firewall proxy timeout disk full backup restore"
+).split()
+
+
+def synthetic_rows(n, seed=0):
+    rng = random.Random(seed)
+    for i in range(n):
+        category = rng.choice(CATEGORIES)
+        yield (
+            f"TKT-{i + 1:08d}",
+            category,
+            " ".join(rng.choices(WORDS, k=12)),
+            " ".join(rng.choices(WORDS, k=20)),
+            rng.choice(["Low", "Medium", "High"]),
+            "Resolved",
+        )
+
+
+def write_tickets(path, n, chunk_rows):
+    """Write n synthetic tickets to path (.csv, .parquet or .xlsx), chunk by chunk."""
+    rows = synthetic_rows(n)
+    if path.suffix == ".csv":
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(TICKET_FIELDS)
+            writer.writerows(rows)
+    elif path.suffix == ".parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = pa.schema([(field, pa.string()) for field in TICKET_FIELDS])
+        with pq.ParquetWriter(path, schema) as writer:
+            while True:
+                chunk = [row for _, row in zip(range(chunk_rows), rows)]
+                if not chunk:
+                    break
+                columns = list(zip(*chunk))
+                writer.write_table(pa.table(dict(zip(TICKET_FIELDS, columns)), schema=schema))
+    else:
+        import openpyxl
+
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(TICKET_FIELDS)
+        for row in rows:
+            sheet.append(row)
+        workbook.save(path)
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def time_read(path, chunk_rows):
+    start = time.perf_counter()
+    rows = sum(len(chunk["category"]) for chunk in read_ticket_chunks(str(path), chunk_rows))
+    return rows, time.perf_counter() - start
+
+
+def time_baseline(path):
+    """Previous builder: whole file into a DataFrame, then one dict per iterrows() row."""
+    import pandas as pd
+
+    start = time.perf_counter()
+    if path.suffix == ".csv":
+        df = pd.read_csv(path)
+    elif path.suffix == ".parquet":
+        df = pd.read_parquet(path)
+    else:
+        df = pd.read_excel(path)
+    texts = [f"{row['category']} {row['description']}" for _, row in df.iterrows()]
+    return len(texts), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the streaming KB build")
+    parser.add_argument("--rows", type=int, default=200_000, help="Synthetic tickets")
+    parser.add_argument(
+        "--format", choices=["csv", "parquet", "xlsx"], default="csv", help="File format"
+    )
+    parser.add_argument("--chunk-rows", type=int, default=CHUNK_ROWS)
+    parser.add_argument(
+        "--input", type=str, default=None, help="Existing tickets file (skips generation)"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="TF-IDF fit processes (0 = all cores)"
+    )
+    parser.add_argument(
+        "--compare-single",
+        action="store_true",
+        help="Also time a single-process fit and report the speedup of --workers",
+    )
+    parser.add_argument(
+        "--baseline", action="store_true", help="Also time pandas load + iterrows"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.input:
+            path = Path(args.input)
+        else:
+            path = Path(tmp) / f"tickets.{args.format}"
+            start = time.perf_counter()
+            write_tickets(path, args.rows, args.chunk_rows)
+            print(
+                f"Wrote {args.rows:,} tickets to {path.name} "
+                f"({path.stat().st_size / 1024 / 1024:.1f} MB) in {time.perf_counter() - start:.1f} s"
+            )
+
+        rows, elapsed = time_read(path, args.chunk_rows)
+        print(f"Streaming read:  {rows:,} rows in {elapsed:.2f} s = {rows / elapsed:,.0f} rows/sec")
+
+        start = time.perf_counter()
+        tickets, _, tfidf_matrix, _ = build_knowledge_base_tfidf(
+            read_ticket_chunks(str(path), args.chunk_rows), workers=args.workers
+        )
+        elapsed = time.perf_counter() - start
+        print(
+            f"\nFull build: {len(tickets):,} rows in {elapsed:.2f} s = {len(tickets) / elapsed:,.0f} rows/sec "
+            f"(matrix {tfidf_matrix.shape}, {tfidf_matrix.nnz:,} nonzeros)"
+        )
+        print(f"Peak RSS: {peak_rss_mb():,.0f} MB")
+
+        if args.compare_single and args.workers != 1:
+            start = time.perf_counter()
+            build_knowledge_base_tfidf(read_ticket_chunks(str(path), args.chunk_rows), workers=1)
+            single = time.perf_counter() - start
+            print(
+                f"\nSingle-process build: {single:.2f} s; "
+                f"measured speedup of --workers {args.workers}: {single / elapsed:.2f}x"
+            )
+
+        # After the streaming build so its peak RSS is not inflated
+        if args.baseline:
+            rows, elapsed = time_baseline(path)
+            print(f"\npandas+iterrows: {rows:,} rows in {elapsed:.2f} s = {rows / elapsed:,.0f} rows/sec")
+
+
+if __name__ == "__main__":
+    main()
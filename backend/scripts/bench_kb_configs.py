@@ -0,0 +1,136 @@
+"""
+Benchmark - Knowledge Base Build Configs
+
+Builds a knowledge base with each build config (see kb_build.py) from the same
+tickets, holding out every n-th ticket as a query, and compares retrieval
+quality and latency. Quality is measured against the held-out ticket itself:
+hit@1 and precision@k count retrieved tickets in its category, and
+resolution@k whether any retrieved ticket has its exact resolution. Each
+config is queried with its own category weight; --mismatched also queries it
+with a fixed weight, as the engine did before the weight was recorded.
+"""
+
+import argparse
+import pickle
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_ROOT))
+
+from kb_build import BUILD_CONFIGS, build_knowledge_base, resolve_build_config  # noqa: E402
+from kb_ingest import weighted_text  # noqa: E402
+from retrieval import top_k_similar  # noqa: E402
+from ticket_source import FIELD_DEFAULTS, TICKET_FIELDS, read_ticket_chunks  # noqa: E402
+
+
+def load_tickets(path):
+    """Ticket dicts from a knowledge base pickle or any file ticket_source reads."""
+    if path.endswith(".pkl"):
+        with open(path, "rb") as f:
+            return [dict(t) for t in pickle.load(f)["tickets"]]
+    tickets = []
+    for chunk in read_ticket_chunks(path):
+        tickets.extend(dict(zip(chunk, values)) for values in zip(*chunk.values()))
+    return tickets
+
+
+def to_columns(tickets):
+    return {
+        field: [str(t.get(field) or FIELD_DEFAULTS.get(field, "")) for t in tickets]
+        for field in TICKET_FIELDS
+    }
+
+
+def evaluate(tickets, vectorizer, tfidf_matrix, queries, category_weight, k):
+    """Mean quality metrics and per-query latency percentiles (ms)."""
+    hits, precision, resolved, timings = [], [], [], []
+    for query in queries:
+        start = time.perf_counter()
+        query_vec = vectorizer.transform(
+            [weighted_text(query["category"], query["description"], category_weight)]
+        )
+        top_indices, _ = top_k_similar(tfidf_matrix, query_vec, k)
+        timings.append((time.perf_counter() - start) * 1000)
+        retrieved = [tickets[int(i)] for i in top_indices]
+        same_category = [t["category"] == query["category"] for t in retrieved]
+        hits.append(bool(same_category) and same_category[0])
+        precision.append(np.mean(same_category) if same_category else 0.0)
+        resolved.append(any(t["resolution"] == query["resolution"] for t in retrieved))
+    return {
+        "hit@1": np.mean(hits),
+        f"precision@{k}": np.mean(precision),
+        f"resolution@{k}": np.mean(resolved),
+        "p50_ms": np.percentile(timings, 50),
+        "p95_ms": np.percentile(timings, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare knowledge base build configs")
+    parser.add_argument(
+        "--input",
+        type=str,
+        default=str(BACKEND_ROOT / "data" / "knowledge_base.pkl"),
+        help="Tickets: knowledge base pickle, .xlsx, .csv or .parquet",
+    )
+    parser.add_argument(
+        "--configs",
+        nargs="+",
+        default=list(BUILD_CONFIGS),
+        help="Preset names or .json build configs (default: all presets)",
+    )
+    parser.add_argument("--holdout", type=int, default=20, help="Hold out every n-th ticket")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument(
+        "--mismatched",
+        type=int,
+        default=None,
+        metavar="WEIGHT",
+        help="Also query every config with this fixed category weight (e.g. 3)",
+    )
+    args = parser.parse_args()
+
+    tickets = load_tickets(args.input)
+    queries = tickets[:: args.holdout]
+    corpus = [t for i, t in enumerate(tickets) if i % args.holdout]
+    print(f"{len(corpus):,} tickets indexed, {len(queries):,} held-out queries, k={args.k}\n")
+
+    rows = []
+    for name in args.configs:
+        config = resolve_build_config(name)
+        kb_tickets, vectorizer, tfidf_matrix, stats = build_knowledge_base(
+            [to_columns(corpus)], config
+        )
+        kb_tickets = list(kb_tickets)
+        weights = [config["category_weight"]]
+        if args.mismatched and args.mismatched != config["category_weight"]:
+            weights.append(args.mismatched)
+        for weight in weights:
+            result = evaluate(kb_tickets, vectorizer, tfidf_matrix, queries, weight, args.k)
+            rows.append(
+                {
+                    "config": config["name"],
+                    "query_weight": weight,
+                    "build_s": stats["seconds"],
+                    "terms": len(vectorizer.vocabulary_),
+                    "nnz": tfidf_matrix.nnz,
+                    **result,
+                }
+            )
+
+    columns = list(rows[0])
+    print("  ".join(f"{c:>14}" for c in columns))
+    for row in rows:
+        cells = []
+        for c in columns:
+            value = row[c]
+            cells.append(f"{value:>14.3f}" if isinstance(value, float) else f"{value!s:>14}")
+        print("  ".join(cells))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark - Query Encoder
+
+Times per-query TF-IDF encoding against a knowledge base directory, one query
+per call as the engine does: scikit-learn's TfidfVectorizer.transform, the
+generic TfidfModel path (analyzer n-gram strings probed in the vocabulary) and
+the compiled QueryEncoder. Queries are the knowledge base's own tickets, as
+the engine would build them, and every encoder's output is checked to be
+identical to scikit-learn's.
+"""
+
+import argparse
+import copy
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_ROOT))
+
+from kb_build import build_config_from_manifest, make_vectorizer  # noqa: E402
+from kb_ingest import weighted_text  # noqa: E402
+from kb_store import (  # noqa: E402
+    fitted_vectorizer,
+    is_kb_dir,
+    kb_dir_for,
+    load_kb_dir,
+    migrate_pickle,
+    read_manifest,
+)
+from query_encoder import QueryEncoder  # noqa: E402
+
+
+def _time_encoder(encode, queries, repeats):
+    timings = []
+    for _ in range(repeats):
+        for query in queries:
+            start = time.perf_counter_ns()
+            encode([query])
+            timings.append((time.perf_counter_ns() - start) / 1000)
+    return np.median(timings), np.percentile(timings, 99)
+
+
+def _identical(a, b):
+    a, b = a.sorted_indices(), b.sorted_indices()
+    return (
+        a.shape == b.shape
+        and np.array_equal(a.indptr, b.indptr)
+        and np.array_equal(a.indices, b.indices)
+        and np.array_equal(a.data, b.data)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-query TF-IDF encoding")
+    parser.add_argument(
+        "--kb",
+        type=str,
+        default=str(BACKEND_ROOT / "data" / "knowledge_base"),
+        help="Knowledge base directory (or a legacy pickle to migrate)",
+    )
+    parser.add_argument("--queries", type=int, default=500, help="Tickets used as queries")
+    parser.add_argument("--repeats", type=int, default=5)
+    args = parser.parse_args()
+
+    path = args.kb
+    if not is_kb_dir(kb_dir_for(path)) and path.endswith(".pkl"):
+        migrate_pickle(path)
+    path = kb_dir_for(path)
+    tickets, model, _ = load_kb_dir(path)
+    build_config = build_config_from_manifest(read_manifest(path))
+    weight = build_config["category_weight"]
+    step = max(1, len(tickets) // args.queries)
+    queries = [
+        weighted_text(tickets[i]["category"], tickets[i]["description"], weight)
+        for i in range(0, len(tickets), step)
+    ][: args.queries]
+
+    terms = sorted(model.vocabulary_, key=model.vocabulary_.get)
+    sklearn_vectorizer = fitted_vectorizer(
+        make_vectorizer({"vectorizer": model.get_params()}), terms, model.idf_
+    )
+    generic = copy.copy(model)
+    generic._encoder = None
+    encoder = QueryEncoder.from_vectorizer(sklearn_vectorizer)
+
+    print("=" * 60)
+    print("QUERY ENCODER BENCHMARK")
+    print("=" * 60)
+    print(f"Knowledge base: {path} ({build_config['name']} config)")
+    print(f"Vocabulary: {len(terms):,} terms, ngram_range={model.ngram_range}")
+    print(f"Queries: {len(queries):,} x {args.repeats} repeats")
+
+    expected = sklearn_vectorizer.transform(queries)
+    encoders = [
+        ("TfidfVectorizer.transform", sklearn_vectorizer.transform),
+        ("TfidfModel analyzer path", generic.transform),
+        ("QueryEncoder", encoder.encode),
+    ]
+    baseline = None
+    for label, encode in encoders:
+        p50, p99 = _time_encoder(encode, queries, args.repeats)
+        baseline = baseline or p50
+        print(f"\n{label}:")
+        print(f"  p50: {p50:.1f} us ({baseline / p50:.1f}x)")
+        print(f"  p99: {p99:.1f} us")
+        print(f"  identical to scikit-learn: {_identical(encode(queries), expected)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,119 +9,60 @@ Uses TF-IDF similarity instead of embeddings (no embedding API needed!)
 import argparse
 import os
 import sys
-import pandas as pd
 import pickle
-import numpy as np
 from pathlib import Path
 from tqdm import tqdm
 from dotenv import load_dotenv
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_ROOT))
 
-def _detect_columns(df):
-    """Detect and map required columns from a variety of common headers.
-
-    Returns a dict mapping canonical names to actual df column names.
-    Raises ValueError if any required column is missing.
-    """
-    cols = [c.strip().lower().replace(" ", "_") for c in df.columns]
-    colset = set(cols)
-
-    candidates = {
-        "category": [
-            "category",
-            "categories",
-            "type",
-            "issue_type",
-            "ticket_category",
-        ],
-        "description": [
-            "description",
-            "ticket_description",
-            "issue",
-            "issue_description",
-            "problem",
-            "summary",
-            "details",
-            "text",
-        ],
-        "resolution": [
-            "resolution",
-            "solution",
-            "fix",
-            "steps",
-            "resolution_notes",
-            "answer",
-            "workaround",
-        ],
-        # Optional
-        "ticket_id": ["ticket_id", "id", "ticketid", "case_id", "incident_id"],
-        "priority": ["priority", "severity", "prio"],
-        "status": ["status", "state"],
-    }
-
-    mapping = {}
-    missing = []
-    for required in ["category", "description", "resolution"]:
-        found = next((c for c in candidates[required] if c in colset), None)
-        if not found:
-            missing.append(required)
-        else:
-            mapping[required] = found
-
-    # Optional fields
-    for opt in ["ticket_id", "priority", "status"]:
-        found = next((c for c in candidates[opt] if c in colset), None)
-        if found:
-            mapping[opt] = found
-
-    if missing:
-        raise ValueError(
-            "Missing required columns: "
-            + ", ".join(missing)
-            + f". Available columns: {list(colset)}"
-        )
-
-    return mapping
+from kb_build import (
+    BUILD_CONFIGS,
+    DEFAULT_BUILD_CONFIG,
+    build_knowledge_base,
+    resolve_build_config,
+)
+from kb_store import load_kb_dir, save_kb_dir
+from ticket_source import CHUNK_ROWS, read_ticket_chunks
+from ticket_store import TicketStore
 
 
 # Load environment
 load_dotenv()
 
 
-def load_tickets_from_excel(excel_path):
-    """Load tickets from Excel file."""
-
-    print(f"Loading tickets from: {excel_path}")
-
-    if not os.path.exists(excel_path):
+def load_tickets(path, chunk_rows=CHUNK_ROWS):
+    """Open a streaming reader over an .xlsx, .csv or .parquet tickets file.
 
-        print(f"❌ File not found: {excel_path}")
-
-        return None
+    Returns an iterator of ticket column chunks (see ticket_source.py), or None
+    if the file cannot be read.
+    """
 
-    df = pd.read_excel(excel_path)
+    print(f"Loading tickets from: {path}")
 
-    # Normalize column names
-    df.columns = df.columns.str.strip().str.lower().str.replace(" ", "_")
-    # Detect and rename columns to canonical names
     try:
-        mapping = _detect_columns(df)
-        df = df.rename(columns={v: k for k, v in mapping.items()})
-    except ValueError as e:
+        chunks = read_ticket_chunks(path, chunk_rows)
+    except FileNotFoundError:
+        print(f"❌ File not found: {path}")
+        return None
+    except (ValueError, ImportError) as e:
         print(f"❌ Column detection error: {e}")
         return None
 
-    print(f"✓ Loaded {len(df)} tickets")
+    print(f"✓ Streaming tickets in chunks of {chunk_rows} rows")
 
-    print(f"  Columns: {list(df.columns)}")
+    return chunks
 
-    return df
 
+def build_knowledge_base_tfidf(chunks, workers=1, shard_rows=None, config=None):
+    """Build knowledge base using TF-IDF vectors.
 
-def build_knowledge_base_tfidf(df):
-    """Build knowledge base using TF-IDF vectors."""
+    Runs the shared pipeline in kb_build.py with a build config (a preset
+    name, JSON file or dict; default KB_BUILD_CONFIG or the default preset).
+    workers=1 fits in this process; any other value fits on that many
+    processes (0 = one per core) with an identical result.
+    """
 
     print("\n" + "=" * 60)
 
@@ -129,90 +70,110 @@ def build_knowledge_base_tfidf(df):
 
     print("=" * 60)
 
-    tickets = []
+    build_config = resolve_build_config(config)
 
-    texts = []
+    print(
+        f"Build config: {build_config['name']} "
+        f"(category weight {build_config['category_weight']}, "
+        f"vectorizer {build_config['vectorizer']})"
+    )
 
-    # Prepare ticket data
+    progress = tqdm(desc="Processing tickets", unit=" tickets")
 
-    for _, row in tqdm(df.iterrows(), total=len(df), desc="Processing tickets"):
+    tickets, vectorizer, tfidf_matrix, stats = build_knowledge_base(
+        chunks,
+        build_config,
+        workers=workers,
+        shard_rows=shard_rows,
+        on_chunk=progress.update,
+    )
 
-        ticket = {
-            "ticket_id": row.get("ticket_id", f"T-{len(tickets)+1}"),
-            "category": str(row["category"]),
-            "description": str(row["description"]),
-            "resolution": str(row["resolution"]),
-            "priority": str(row.get("priority", "Medium")),
-            "status": str(row.get("status", "Resolved")),
-        }
+    progress.close()
 
-        # Create combined text for TF-IDF
+    elapsed = stats["seconds"]
 
-        combined_text = f"{ticket['category']} {ticket['description']}"
+    print(f"\n✓ Processed {len(tickets)} tickets")
 
-        tickets.append(ticket)
+    print(f"✓ Throughput: {len(tickets) / elapsed:,.0f} rows/sec ({elapsed:.1f} s)")
 
-        texts.append(combined_text)
+    print(f"✓ TF-IDF matrix shape: {tfidf_matrix.shape}")
 
-    print(f"\n✓ Processed {len(tickets)} tickets")
+    print(f"✓ Vocabulary size: {len(vectorizer.vocabulary_)}")
 
-    # Create TF-IDF vectorizer
+    if workers != 1:
+        print(
+            f"✓ Parallel fit: {stats['shards']} shards on {stats['workers']} workers "
+            f"({stats['cpu_count']} cores); count {stats['count_seconds']:.1f} s, "
+            f"transform {stats['transform_seconds']:.1f} s"
+        )
 
-    print("\nBuilding TF-IDF index...")
+        # Busy worker time over wall time, not a comparison with a
+        # single-process fit (see scripts/bench_kb_build.py --compare-single)
+        print(
+            f"✓ Parallel efficiency (estimate): {stats['parallelism']:.2f} workers busy "
+            f"on average, {stats['parallelism'] / stats['workers']:.0%} of {stats['workers']}"
+        )
 
-    vectorizer = TfidfVectorizer(
-        max_features=5000, ngram_range=(1, 2), stop_words="english"
-    )
+    return tickets, vectorizer, tfidf_matrix, build_config
 
-    tfidf_matrix = vectorizer.fit_transform(texts)
 
-    print(f"✓ TF-IDF matrix shape: {tfidf_matrix.shape}")
+def save_knowledge_base(tickets, vectorizer, tfidf_matrix, output_path, build_config=None):
+    """Save knowledge base to disk.
 
-    print(f"✓ Vocabulary size: {len(vectorizer.vocabulary_)}")
+    Writes the memory-mappable directory format (see kb_store.py), with the
+    build config in its manifest, or a legacy pickle when output_path ends in
+    .pkl.
+    """
 
-    return tickets, vectorizer, tfidf_matrix
+    if output_path.endswith(".pkl"):
+        Path(output_path).parent.mkdir(parents=True, exist_ok=True)
 
+        data = {
+            "tickets": list(tickets),
+            "vectorizer": vectorizer,
+            "tfidf_matrix": tfidf_matrix,
+        }
 
-def save_knowledge_base(tickets, vectorizer, tfidf_matrix, output_path):
-    """Save knowledge base to disk."""
+        with open(output_path, "wb") as f:
+            pickle.dump(data, f)
 
-    # Create data directory
+        total_size = os.path.getsize(output_path)
+    else:
+        version_dir = save_kb_dir(output_path, tickets, vectorizer, tfidf_matrix, build_config)
 
-    Path(output_path).parent.mkdir(parents=True, exist_ok=True)
+        total_size = sum(p.stat().st_size for p in Path(version_dir).iterdir())
 
-    data = {"tickets": tickets, "vectorizer": vectorizer, "tfidf_matrix": tfidf_matrix}
+    print(f"\n✓ Knowledge base saved to: {output_path}")
 
-    with open(output_path, "wb") as f:
+    print(f"  Size: {total_size / (1024 * 1024):.2f} MB")
 
-        pickle.dump(data, f)
+    print(f"  Total tickets: {len(tickets)}")
 
-    file_size = os.path.getsize(output_path) / (1024 * 1024)  # MB
 
-    print(f"\n✓ Knowledge base saved to: {output_path}")
+def load_knowledge_base(output_path):
+    """Load (tickets, vectorizer, tfidf_matrix) written by save_knowledge_base."""
 
-    print(f"  File size: {file_size:.2f} MB")
+    if output_path.endswith(".pkl"):
+        with open(output_path, "rb") as f:
+            data = pickle.load(f)
 
-    print(f"  Total tickets: {len(tickets)}")
+        return data["tickets"], data["vectorizer"], data["tfidf_matrix"]
+
+    return load_kb_dir(output_path)
 
 
 def validate_knowledge_base(output_path):
     """Validate the knowledge base."""
 
+    from sklearn.metrics.pairwise import cosine_similarity
+
     print("\n" + "=" * 60)
 
     print("VALIDATING KNOWLEDGE BASE")
 
     print("=" * 60)
 
-    with open(output_path, "rb") as f:
-
-        data = pickle.load(f)
-
-    tickets = data["tickets"]
-
-    vectorizer = data["vectorizer"]
-
-    tfidf_matrix = data["tfidf_matrix"]
+    tickets, vectorizer, tfidf_matrix = load_knowledge_base(output_path)
 
     print(f"✓ Tickets: {len(tickets)}")
 
@@ -238,13 +199,16 @@ def validate_knowledge_base(output_path):
 
     # Category distribution
 
-    categories = {}
+    if isinstance(tickets, TicketStore):
+        categories = tickets.value_counts("category")
+    else:
+        categories = {}
 
-    for ticket in tickets:
+        for ticket in tickets:
 
-        cat = ticket["category"]
+            cat = ticket["category"]
 
-        categories[cat] = categories.get(cat, 0) + 1
+            categories[cat] = categories.get(cat, 0) + 1
 
     print(f"\nTop 5 categories:")
 
@@ -297,26 +261,55 @@ def main():
 
     print()
 
-    # Resolve backend root: this file is backend/scripts/...
-    scripts_dir = Path(__file__).resolve().parent
-    backend_root = scripts_dir.parent
+    backend_root = BACKEND_ROOT
 
     parser = argparse.ArgumentParser(
-        description="Build TF-IDF knowledge base from Excel file"
+        description="Build TF-IDF knowledge base from an Excel, CSV or Parquet file"
     )
     parser.add_argument(
+        "--input",
         "--excel",
         dest="excel",
         type=str,
         default=str(backend_root / "data" / "Sample-Data.xlsx"),
-        help="Path to Excel tickets file (default: backend/data/Sample-Data.xlsx)",
+        help=(
+            "Path to .xlsx, .csv or .parquet tickets file "
+            "(default: backend/data/Sample-Data.xlsx)"
+        ),
+    )
+    parser.add_argument(
+        "--chunk-rows",
+        dest="chunk_rows",
+        type=int,
+        default=CHUNK_ROWS,
+        help=f"Rows read per chunk (default: {CHUNK_ROWS})",
+    )
+    parser.add_argument(
+        "--config",
+        dest="config",
+        type=str,
+        default=None,
+        help=(
+            f"Build config: {', '.join(BUILD_CONFIGS)} or a .json file "
+            f"(default: KB_BUILD_CONFIG or {DEFAULT_BUILD_CONFIG})"
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        dest="workers",
+        type=int,
+        default=1,
+        help="Processes for the TF-IDF fit: 1 = in-process (default), 0 = one per core",
     )
     parser.add_argument(
         "--output",
         dest="output",
         type=str,
-        default=str(backend_root / "data" / "knowledge_base.pkl"),
-        help="Output pickle path (default: backend/data/knowledge_base.pkl)",
+        default=str(backend_root / "data" / "knowledge_base"),
+        help=(
+            "Output knowledge base directory (default: backend/data/knowledge_base); "
+            "a path ending in .pkl writes the legacy pickle format"
+        ),
     )
     args = parser.parse_args()
 
@@ -330,25 +323,31 @@ def main():
         print(f"\nCurrent directory: {os.getcwd()}")
         print(f"Looking for: {os.path.abspath(excel_path)}")
         print(
-            "Hint: Place your Excel at backend/data/Sample-Data.xlsx or pass --excel <path>."
+            "Hint: Place your Excel at backend/data/Sample-Data.xlsx or pass --input <path>."
         )
         return
 
     # Load tickets
 
-    df = load_tickets_from_excel(excel_path)
+    chunks = load_tickets(excel_path, args.chunk_rows)
 
-    if df is None:
+    if chunks is None:
 
         return
 
     # Build knowledge base using TF-IDF
 
-    tickets, vectorizer, tfidf_matrix = build_knowledge_base_tfidf(df)
+    try:
+        tickets, vectorizer, tfidf_matrix, build_config = build_knowledge_base_tfidf(
+            chunks, workers=args.workers, config=args.config
+        )
+    except ValueError as e:
+        print(f"❌ {e}")
+        return
 
     # Save knowledge base
 
-    save_knowledge_base(tickets, vectorizer, tfidf_matrix, output_path)
+    save_knowledge_base(tickets, vectorizer, tfidf_matrix, output_path, build_config)
 
     # Validate
 
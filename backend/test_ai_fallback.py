@@ -20,7 +20,7 @@ load_dotenv()
 from rag_engine_tfidf import RAGEngine
 
 
-def test_ai_fallback():
+def test_ai_fallback(bundled_kb):
     """Test AI fallback when no similar tickets are found."""
 
     print("\n" + "=" * 80)
@@ -29,7 +29,7 @@ def test_ai_fallback():
 
     # Initialize RAG engine
     logger.info("Initializing RAG engine...")
-    rag_engine = RAGEngine()
+    rag_engine = RAGEngine(bundled_kb)
 
     if not rag_engine.is_ready():
         logger.error("❌ RAG engine not ready. Please build knowledge base first.")
@@ -0,0 +1,72 @@
+"""
+Tests for resolving tickets off the event loop (run with: python -m pytest test_async_resolution.py)
+Uses the bundled knowledge base with a chat client that blocks until released.
+"""
+import asyncio
+import threading
+from types import SimpleNamespace
+import httpx
+import pytest
+from rag_engine_tfidf import RAGEngine
+TICKET = {"category": "Password Reset", "priority": "Medium", "description": "I forgot my password and cannot login"}
+class BlockingChatClient:
+    """Holds every call until release is set, tracking how many run at once."""
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Semaphore(0)
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+    def chat_completion(self, messages, max_tokens, temperature):
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        self.started.release()
+        try:
+            self.release.wait(timeout=10)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="1. Reset the password"))])
+@pytest.fixture
+def engine(monkeypatch, bundled_kb):
+    monkeypatch.setenv("LLM_MAX_CONCURRENCY", "2")
+    rag_engine = RAGEngine(bundled_kb)
+    if not rag_engine.is_ready():
+        rag_engine.shutdown()
+        pytest.skip("Knowledge base not available")
+    rag_engine.hf_client = BlockingChatClient()
+    rag_engine.llm_cache = None
+    rag_engine.query_cache = None
+    yield rag_engine
+    rag_engine.hf_client.release.set()
+    rag_engine.shutdown()
+async def _wait_for_calls(client, n):
+    for _ in range(n):
+        assert await asyncio.to_thread(client.started.acquire, True, 10)
+def test_event_loop_serves_requests_while_llm_call_blocks(engine, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(app_module, "rag_engine", engine)
+    async def scenario():
+        transport = httpx.ASGITransport(app=app_module.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow = asyncio.create_task(client.post("/api/suggest-resolution", json=TICKET))
+            await _wait_for_calls(engine.hf_client, 1)
+            live = await asyncio.wait_for(client.get("/health/live"), timeout=5)
+            assert live.status_code == 200 and not slow.done()
+            engine.hf_client.release.set()
+            response = await asyncio.wait_for(slow, timeout=10)
+            assert response.status_code == 200 and response.json()["method"] == "ai-refined"
+    asyncio.run(scenario())
+def test_worker_pool_bounds_concurrent_llm_calls(engine):
+    async def scenario():
+        requests = [asyncio.ensure_future(engine.asuggest_resolution(**TICKET)) for _ in range(5)]
+        await _wait_for_calls(engine.hf_client, 2)
+        # Queued requests would start a third call by now if the pool allowed it
+        await asyncio.sleep(0.2)
+        assert engine.hf_client.in_flight == 2
+        engine.hf_client.release.set()
+        results = await asyncio.gather(*requests)
+        assert [result["method"] for result in results] == ["ai-refined"] * 5
+        assert engine.hf_client.max_in_flight == 2
+    asyncio.run(scenario())
@@ -0,0 +1,63 @@
+"""
+Tests for batch resolution (run with: python -m pytest test_batch_resolution.py)
+Uses the bundled knowledge base with the AI client disabled (template path).
+"""
+import pytest
+from metrics import metrics_tracker
+from rag_engine_tfidf import RAGEngine
+TICKETS = [
+    {"category": "Password Reset", "priority": "Medium", "description": "I forgot my password and cannot login"},
+    {"category": "Network Problem", "priority": "High", "description": "Cannot connect to Wi-Fi network"},
+    {"category": "Email Issues", "priority": "Low", "description": "Emails not syncing on mobile device"},
+    {"category": "Hardware Request", "priority": "High", "description": "quantum flux capacitor anomaly"},
+]
+@pytest.fixture(scope="module")
+def engine(bundled_kb):
+    rag_engine = RAGEngine(bundled_kb)
+    if not rag_engine.is_ready():
+        pytest.skip("Knowledge base not available")
+    rag_engine.hf_client = None
+    yield rag_engine
+    rag_engine.shutdown()
+def test_batch_retrieval_matches_single_queries(engine):
+    query_texts = [engine._build_query_text(t["category"], t["description"]) for t in TICKETS]
+    categories = [t["category"] for t in TICKETS]
+    batch = engine.find_similar_tickets_batch(query_texts, categories=categories)
+    for query_text, category, similar in zip(query_texts, categories, batch):
+        single = engine.find_similar_tickets(query_text, category=category)
+        assert [t["ticket_id"] for t in similar] == [t["ticket_id"] for t in single]
+        assert [t["similarity_score"] for t in similar] == pytest.approx(
+            [t["similarity_score"] for t in single]
+        )
+def test_suggest_resolutions_keeps_order_and_timing(engine):
+    response = engine.suggest_resolutions(TICKETS)
+    assert response["errors"] == []
+    assert response["timing"]["num_tickets"] == len(TICKETS)
+    for ticket, result in zip(TICKETS, response["results"]):
+        single = engine.suggest_resolution(**ticket)
+        assert result["method"] == single["method"]
+        assert result["suggested_resolution"] == single["suggested_resolution"]
+        assert set(result["timing"]) == {"search_time_ms", "generation_time_ms", "total_time_ms"}
+def test_suggest_resolutions_reports_failures_per_ticket(engine, monkeypatch):
+    generate = engine._generate_resolution
+    def flaky_generate(category, *args):
+        if category == "Network Problem":
+            raise RuntimeError("LLM unavailable")
+        return generate(category, *args)
+    monkeypatch.setattr(engine, "_generate_resolution", flaky_generate)
+    response = engine.suggest_resolutions(TICKETS[:2])
+    assert response["results"][0] is not None
+    assert response["results"][1] is None
+    assert response["errors"] == [{"index": 1, "detail": "LLM unavailable"}]
+def test_empty_batch(engine):
+    response = engine.suggest_resolutions([])
+    assert response["results"] == [] and response["errors"] == []
+def test_stage_latencies_are_recorded(engine):
+    metrics_tracker.reset()
+    engine.suggest_resolutions(TICKETS[:2])
+    stages = metrics_tracker.get_summary()["stage_latency_ms"]
+    assert stages["encoding"]["by_method"]["batch"]["count"] == 1
+    assert stages["llm_queue"]["count"] == 2
+    assert stages["total"]["count"] == 3
+    assert set(stages["total"]["by_category"]) == {"all", "Password Reset", "Network Problem"}
+    assert stages["total"]["p99"] >= stages["llm_queue"]["p50"] >= 0
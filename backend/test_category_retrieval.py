@@ -0,0 +1,41 @@
+"""
+Tests for category-first retrieval (run with: python -m pytest test_category_retrieval.py)
+Uses the bundled knowledge base.
+"""
+import pytest
+from rag_engine_tfidf import RAGEngine
+@pytest.fixture(scope="module")
+def engine(bundled_kb):
+    rag_engine = RAGEngine(bundled_kb)
+    if not rag_engine.is_ready():
+        pytest.skip("Knowledge base not available")
+    yield rag_engine
+    rag_engine.shutdown()
+@pytest.fixture
+def category_first(engine, monkeypatch):
+    monkeypatch.setattr(engine, "retrieval_mode", "category-first")
+    return engine
+def test_partitions_cover_every_ticket(engine):
+    rows, offsets = engine.tickets.partition("category")
+    codes, labels = engine.tickets.codes("category")
+    assert sorted(rows.tolist()) == list(range(len(engine.tickets)))
+    for code in range(len(labels)):
+        assert set(codes[rows[offsets[code] : offsets[code + 1]]].tolist()) <= {code}
+def test_category_first_returns_requested_category(category_first):
+    query_text = category_first._build_query_text("vpn access", "cannot connect from home network")
+    similar = category_first.find_similar_tickets(query_text, category="vpn access")
+    assert len(similar) == category_first.top_k
+    assert {t["category"] for t in similar} == {"VPN Access"}
+    assert all(t["similarity_score"] >= category_first.min_similarity for t in similar)
+def test_category_first_falls_back_to_global(category_first, monkeypatch):
+    query_text = category_first._build_query_text("Unknown Category", "cannot connect to wifi")
+    fallback = category_first.find_similar_tickets(query_text, category="Unknown Category")
+    monkeypatch.setattr(category_first, "retrieval_mode", "global")
+    assert fallback == category_first.find_similar_tickets(query_text, category="Unknown Category")
+def test_category_first_batch_matches_single(category_first):
+    tickets = [("Password Reset", "forgot my password"), ("Email Issues", "outlook not syncing"), ("Network Problem", "wifi drops")]
+    query_texts = [category_first._build_query_text(c, d) for c, d in tickets]
+    categories = [c for c, _ in tickets]
+    batch = category_first.find_similar_tickets_batch(query_texts, categories=categories)
+    for query_text, category, similar in zip(query_texts, categories, batch):
+        assert similar == category_first.find_similar_tickets(query_text, category=category)
@@ -0,0 +1,36 @@
+"""
+Import-time checks (run with: python -m pytest test_import_time.py -s)
+Imports each module in a fresh interpreter under -X importtime, prints the
+cumulative time and asserts that heavy libraries stay off the startup path.
+"""
+import os
+import subprocess
+import sys
+import pytest
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+# Only needed to fit a knowledge base, read ticket files or call the model
+DEFERRED = ("sklearn", "pandas", "huggingface_hub")
+def _import_times(module: str) -> dict:
+    """{module: cumulative microseconds} from python -X importtime -c 'import module'."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        env=dict(os.environ, PYTHONDONTWRITEBYTECODE="1"),
+    )
+    if result.returncode != 0:
+        pytest.skip(f"Cannot import {module}: {result.stderr.strip().splitlines()[-1]}")
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+@pytest.mark.parametrize("module", ["rag_engine_tfidf", "kb_store", "kb_build", "app"])
+def test_startup_imports_stay_light(module):
+    times = _import_times(module)
+    heavy = sorted(name for name in times if name.split(".")[0] in DEFERRED)
+    print(f"\nimport {module}: {times[module] / 1000:.1f} ms")
+    assert not heavy, f"import {module} pulls in {heavy[:5]}"
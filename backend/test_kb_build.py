@@ -0,0 +1,63 @@
+"""
+Tests for the shared knowledge base build pipeline (run with: python -m pytest test_kb_build.py)
+"""
+import json
+import pytest
+from kb_build import BUILD_CONFIGS, build_config_from_manifest, build_knowledge_base, resolve_build_config
+from kb_ingest import weighted_text
+from kb_store import read_manifest, save_kb_dir
+from rag_engine_tfidf import RAGEngine
+TICKETS = {
+    "ticket_id": ["T1", "T2", "T3", "T4"],
+    "category": ["VPN Access", "Password Reset", "Email Issues", "VPN Access"],
+    "description": ["cannot connect to vpn from home", "forgot password locked out", "outlook not syncing emails", "vpn tunnel drops after login"],
+    "resolution": ["Reset the VPN profile", "Reset via portal", "Rebuilt profile", "Updated the VPN client"],
+    "priority": ["High", "Medium", "Low", "Medium"],
+    "status": ["Resolved"] * 4,
+}
+def _build(tmp_path, config):
+    build_config = resolve_build_config(config)
+    tickets, vectorizer, matrix, stats = build_knowledge_base([TICKETS], build_config)
+    kb_dir = str(tmp_path / "knowledge_base")
+    save_kb_dir(kb_dir, tickets, vectorizer, matrix, build_config)
+    return kb_dir, vectorizer, matrix, stats
+def test_resolve_presets_files_and_errors(tmp_path, monkeypatch):
+    assert resolve_build_config("phrase")["category_weight"] == 3
+    monkeypatch.setenv("KB_BUILD_CONFIG", "standard")
+    assert resolve_build_config() == {"name": "standard", **BUILD_CONFIGS["standard"]}
+    path = tmp_path / "wide.json"
+    path.write_text(json.dumps({"category_weight": 2, "vectorizer": {"ngram_range": [1, 1]}}))
+    assert resolve_build_config(str(path))["name"] == "wide"
+    with pytest.raises(ValueError, match="Unknown build config"):
+        resolve_build_config("missing")
+    with pytest.raises(ValueError, match="tokenizer"):
+        resolve_build_config({"vectorizer": {"tokenizer": str.split}})
+    with pytest.raises(ValueError, match="category_weight"):
+        resolve_build_config({"category_weight": 0})
+def test_build_weights_documents_and_records_config(tmp_path):
+    kb_dir, vectorizer, matrix, stats = _build(tmp_path, "phrase")
+    assert stats["rows"] == 4
+    expected = vectorizer.transform([weighted_text(c, d, 3) for c, d in zip(TICKETS["category"], TICKETS["description"])])
+    assert abs(matrix - expected).max() < 1e-12
+    manifest = read_manifest(kb_dir)
+    assert manifest["build"] == {"name": "phrase", "category_weight": 3}
+    assert build_config_from_manifest(manifest)["vectorizer"]["ngram_range"] == [1, 3]
+def test_legacy_manifest_matches_preset(tmp_path):
+    kb_dir = _build(tmp_path, "phrase")[0]
+    manifest = read_manifest(kb_dir)
+    del manifest["build"]
+    assert build_config_from_manifest(manifest)["category_weight"] == 3
+    manifest["vectorizer"]["max_features"] = 10
+    assert build_config_from_manifest(manifest) == {"name": "legacy", "category_weight": 1, "vectorizer": manifest["vectorizer"]}
+@pytest.mark.parametrize("config, weight", [("standard", 1), ("phrase", 3)])
+def test_engine_weights_queries_like_its_knowledge_base(tmp_path, config, weight):
+    engine = RAGEngine(_build(tmp_path, config)[0])
+    try:
+        assert engine.snapshot.category_weight == weight
+        assert engine._build_query_text("VPN Access", "vpn drops") == weighted_text("VPN Access", "vpn drops", weight)
+        added = engine.add_tickets([{"category": "VPN Access", "description": "token expired", "resolution": "Re-enrolled token"}])
+        assert engine.delta.matrix.shape[0] == added["added"]
+        query_text = engine._build_query_text("VPN Access", "cannot connect to vpn from home")
+        assert engine.find_similar_tickets(query_text, k=1, category="VPN Access")[0]["ticket_id"] == "T1"
+    finally:
+        engine.shutdown()
@@ -0,0 +1,124 @@
+"""
+Tests for incremental knowledge base ingestion (run with: python -m pytest test_kb_ingest.py)
+Each test gets its own knowledge base directory (the engine fixture in conftest.py).
+"""
+import os
+import pytest
+import rag_engine_tfidf
+from kb_ingest import read_delta_log
+from kb_store import kb_dir_for, live_kb_dir
+from rag_engine_tfidf import RAGEngine
+NEW_TICKET = {
+    "category": "VPN Access",
+    "description": "Quasarlink tunnel handshake rejected after firmware upgrade",
+    "resolution": "Re-enrolled the Quasarlink certificate and restarted the tunnel",
+}
+def _wait_for_maintenance(engine):
+    # The maintenance pool has a single worker, so this runs after any queued job
+    engine._maintenance.submit(lambda: None).result()
+def _search(engine, description, category="VPN Access"):
+    query_text = engine._build_query_text(category, description)
+    return engine.find_similar_tickets(query_text, category=category)
+def test_ingested_ticket_is_searchable(engine):
+    base_size = engine.get_knowledge_base_size()
+    result = engine.add_tickets([dict(NEW_TICKET, ticket_id="NEW-1")])
+    assert result["added"] == 1 and result["ticket_ids"] == ["NEW-1"]
+    assert result["total_tickets"] == base_size + 1
+    assert result["delta_tickets"] == 1 and not result["merge_scheduled"]
+    similar = _search(engine, "tunnel handshake rejected after firmware upgrade")
+    assert similar[0]["ticket_id"] == "NEW-1"
+    assert similar[0]["status"] == "Resolved"
+    batch = engine.find_similar_tickets_batch(
+        [engine._build_query_text("VPN Access", "tunnel handshake rejected after firmware upgrade")],
+        categories=["VPN Access"],
+    )
+    assert batch[0][0]["ticket_id"] == "NEW-1"
+def test_category_first_searches_delta(engine, monkeypatch):
+    monkeypatch.setattr(engine, "retrieval_mode", "category-first")
+    engine.add_tickets([dict(NEW_TICKET, ticket_id="NEW-1")])
+    similar = _search(engine, "tunnel handshake rejected after firmware upgrade")
+    assert similar[0]["ticket_id"] == "NEW-1"
+    assert {t["category"] for t in similar} == {"VPN Access"}
+def test_invalid_ticket_changes_nothing(engine):
+    size = engine.get_knowledge_base_size()
+    with pytest.raises(ValueError):
+        engine.add_tickets([NEW_TICKET, dict(NEW_TICKET, resolution=" ")])
+    assert engine.get_knowledge_base_size() == size
+    assert read_delta_log(engine.kb_dir) == []
+def test_delta_log_is_replayed_on_restart(engine):
+    ticket_ids = engine.add_tickets([NEW_TICKET, NEW_TICKET])["ticket_ids"]
+    restarted = RAGEngine(engine.kb_dir)
+    try:
+        assert restarted.get_knowledge_base_size() == engine.get_knowledge_base_size()
+        assert [t["ticket_id"] for t in restarted.delta.tickets] == ticket_ids
+    finally:
+        restarted.shutdown()
+def test_merge_folds_delta_into_base(engine, monkeypatch):
+    monkeypatch.setattr(engine, "delta_merge_rows", 2)
+    base_size = len(engine.tickets)
+    engine.add_tickets([dict(NEW_TICKET, ticket_id="NEW-1")])
+    result = engine.add_tickets([dict(NEW_TICKET, ticket_id="NEW-2")])
+    assert result["merge_scheduled"] and not result["refit_scheduled"]
+    _wait_for_maintenance(engine)
+    assert len(engine.delta) == 0
+    assert len(engine.tickets) == engine.tfidf_matrix.shape[0] == base_size + 2
+    assert read_delta_log(engine.kb_dir) == []
+    assert engine.get_top_categories()["VPN Access"] == engine.tickets.value_counts("category")["VPN Access"]
+    top_ids = {t["ticket_id"] for t in _search(engine, "tunnel handshake rejected after firmware upgrade")[:2]}
+    assert top_ids == {"NEW-1", "NEW-2"}
+@pytest.mark.parametrize("crash_after_swap", [False, True])
+def test_merge_crash_keeps_every_ingested_ticket_once(engine, monkeypatch, crash_after_swap):
+    monkeypatch.setattr(engine, "delta_merge_rows", 2)
+    publish = rag_engine_tfidf.publish_kb_version
+    def crashing_publish(path, version_dir):
+        if crash_after_swap:
+            publish(path, version_dir)
+        raise SystemError("process killed")
+    monkeypatch.setattr(rag_engine_tfidf, "publish_kb_version", crashing_publish)
+    base_size = len(engine.tickets)
+    ticket_ids = engine.add_tickets([NEW_TICKET, NEW_TICKET])["ticket_ids"]
+    _wait_for_maintenance(engine)
+    restarted = RAGEngine(engine.knowledge_base_path)
+    try:
+        assert restarted.get_knowledge_base_size() == base_size + 2
+        if crash_after_swap:
+            assert len(restarted.tickets) == base_size + 2 and len(restarted.delta) == 0
+        else:
+            assert [t["ticket_id"] for t in restarted.delta.tickets] == ticket_ids
+    finally:
+        restarted.shutdown()
+def test_workers_sharing_a_directory_keep_each_others_tickets(engine):
+    other = RAGEngine(engine.knowledge_base_path)
+    try:
+        base_size = len(engine.tickets)
+        engine.add_tickets([dict(NEW_TICKET, ticket_id="NEW-1")])
+        other.add_tickets([dict(NEW_TICKET, ticket_id="NEW-2")])
+        # Each merges from the live version, not from its own stale snapshot;
+        # the last merges prune the version engine still serves
+        for worker in (engine, other, other, other):
+            worker._schedule_maintenance(refit=False)
+            _wait_for_maintenance(worker)
+        assert not os.path.exists(engine.kb_dir)
+        engine.add_tickets([dict(NEW_TICKET, ticket_id="NEW-3")])
+        _wait_for_maintenance(engine)
+        live_dir = live_kb_dir(kb_dir_for(engine.knowledge_base_path))
+        assert engine.kb_dir == live_dir and engine.get_knowledge_base_size() == base_size + 3
+        restarted = RAGEngine(engine.knowledge_base_path)
+        try:
+            ticket_ids = [t["ticket_id"] for t in restarted.tickets][base_size:]
+            ticket_ids += [t["ticket_id"] for t in restarted.delta.tickets]
+            assert sorted(ticket_ids) == ["NEW-1", "NEW-2", "NEW-3"]
+        finally:
+            restarted.shutdown()
+    finally:
+        other.shutdown()
+def test_refit_adds_new_terms_to_vocabulary(engine, monkeypatch):
+    monkeypatch.setattr(engine, "refit_min_tickets", 1)
+    monkeypatch.setattr(engine, "refit_drift", 0.0)
+    assert "quasarlink" not in engine.vectorizer.vocabulary_
+    result = engine.add_tickets([NEW_TICKET])
+    assert result["drift"] > 0 and result["refit_scheduled"]
+    _wait_for_maintenance(engine)
+    assert "quasarlink" in engine.vectorizer.vocabulary_
+    assert len(engine.delta) == 0 and engine.vocabulary_drift() == 0.0
+    assert engine.tfidf_matrix.shape[1] == len(engine.vectorizer.vocabulary_)
@@ -0,0 +1,115 @@
+"""
+Tests for knowledge base snapshots, background loading and reloads (run with: python -m pytest test_kb_snapshot.py)
+Each test gets its own knowledge base directory (the engine fixture in conftest.py).
+"""
+import pytest
+from kb_snapshot import KnowledgeBaseSnapshot
+from kb_store import load_kb_dir
+from rag_engine_tfidf import RAGEngine
+QUERY = ("VPN Access", "cannot connect to vpn from home")
+# Words no bundled ticket uses, so the ingested ticket ranks first however
+# many base tickets reach the 1.0 score cap
+INGESTED_QUERY = ("VPN Access", "Quasarlink client cannot reach the vpn gateway")
+def _wait_for_maintenance(engine):
+    # The maintenance pool has a single worker, so this runs after any queued job
+    engine._maintenance.submit(lambda: None).result()
+def _search(engine, kb=None, query=QUERY):
+    query_text = engine._build_query_text(*query)
+    return engine.find_similar_tickets(query_text, category=query[0], kb=kb)
+def test_reload_publishes_new_snapshot(engine):
+    before = engine.snapshot
+    job = engine.reload_knowledge_base()
+    assert job["status"] in ("queued", "running", "succeeded")
+    _wait_for_maintenance(engine)
+    status = engine.get_reload_job(job["job_id"])
+    assert status["status"] == "succeeded"
+    assert status["total_tickets"] == len(before)
+    assert engine.snapshot is not before
+    assert _search(engine) == _search(engine, kb=before)
+def test_in_flight_query_keeps_its_snapshot(engine):
+    pinned = engine.snapshot
+    expected = _search(engine, kb=pinned, query=INGESTED_QUERY)
+    engine.add_tickets([{"category": "VPN Access", "description": INGESTED_QUERY[1], "resolution": "Reset the VPN profile"}])
+    engine.reload_knowledge_base()
+    _wait_for_maintenance(engine)
+    assert len(pinned.delta) == 0
+    assert _search(engine, kb=pinned, query=INGESTED_QUERY) == expected
+    assert _search(engine, query=INGESTED_QUERY)[0]["resolution"] == "Reset the VPN profile"
+def test_failed_reload_keeps_current_snapshot(engine, monkeypatch):
+    before = engine.snapshot
+    def broken_load():
+        raise ValueError("corrupt knowledge base")
+    monkeypatch.setattr(engine, "_load_snapshot", broken_load)
+    job = engine.reload_knowledge_base()
+    _wait_for_maintenance(engine)
+    status = engine.get_reload_job(job["job_id"])
+    assert status["status"] == "failed" and "corrupt" in status["error"]
+    assert engine.snapshot is before and engine.is_ready()
+def test_reload_keeps_ingested_tickets(engine):
+    ticket_ids = engine.add_tickets([{"category": "VPN Access", "description": "token expired", "resolution": "Re-enrolled token"}])["ticket_ids"]
+    engine.reload_knowledge_base()
+    _wait_for_maintenance(engine)
+    assert [t["ticket_id"] for t in engine.delta.tickets] == ticket_ids
+    restarted = RAGEngine(engine.kb_dir)
+    try:
+        assert restarted.get_knowledge_base_size() == engine.get_knowledge_base_size()
+    finally:
+        restarted.shutdown()
+def test_newer_pickle_is_reported_not_loaded(engine, caplog):
+    pickle_path = engine.knowledge_base_path + ".pkl"
+    with open(pickle_path, "wb") as f:
+        f.write(b"rebuilt")
+    restarted = RAGEngine(pickle_path)
+    try:
+        assert restarted.get_knowledge_base_size() == engine.get_knowledge_base_size()
+        assert any("is newer than the live knowledge base" in r.getMessage() for r in caplog.records)
+    finally:
+        restarted.shutdown()
+def test_build_rejects_mismatched_parts(engine):
+    tickets, vectorizer, matrix = load_kb_dir(engine.kb_dir)
+    with pytest.raises(ValueError):
+        KnowledgeBaseSnapshot.build(tickets, vectorizer, matrix[:-1])
+def test_unknown_reload_job(engine):
+    assert engine.get_reload_job("missing") is None
+def test_lazy_engine_warms_in_background(engine):
+    lazy = RAGEngine(engine.kb_dir, lazy=True)
+    try:
+        assert not lazy.is_ready() and lazy.get_load_status()["state"] == "warming"
+        lazy.start_loading().result()
+        status = lazy.get_load_status()
+        assert lazy.is_ready() and status["state"] == "ready" and "load_seconds" in status
+        assert lazy.get_knowledge_base_size() == engine.get_knowledge_base_size()
+    finally:
+        lazy.shutdown()
+def test_health_reports_warming_then_ready(engine, monkeypatch):
+    from fastapi.testclient import TestClient
+    import app as app_module
+    lazy = RAGEngine(engine.kb_dir, lazy=True)
+    monkeypatch.setattr(app_module, "rag_engine", lazy)
+    # No context manager: skip startup so loading starts when the test says
+    client = TestClient(app_module.app)
+    try:
+        assert client.get("/health/live").json() == {"status": "alive", "state": "warming"}
+        response = client.get("/health/ready")
+        assert response.status_code == 503 and response.headers["Retry-After"]
+        response = client.post("/api/suggest-resolution", json={"category": QUERY[0], "priority": "High", "description": QUERY[1]})
+        assert response.status_code == 503 and "Retry-After" in response.headers
+        lazy.start_loading().result()
+        assert client.get("/health").status_code == 200
+        assert client.get("/health/ready").json()["load"]["state"] == "ready"
+    finally:
+        lazy.shutdown()
+def test_failed_startup_load_is_not_retryable(engine, monkeypatch):
+    from fastapi.testclient import TestClient
+    import app as app_module
+    lazy = RAGEngine(engine.kb_dir, lazy=True)
+    monkeypatch.setattr(lazy, "_load_snapshot", lambda: None)
+    monkeypatch.setattr(app_module, "rag_engine", lazy)
+    try:
+        lazy.start_loading().result()
+        assert lazy.get_load_status()["state"] == "failed"
+        response = TestClient(app_module.app).get("/health/ready")
+        assert response.status_code == 503 and "Retry-After" not in response.headers
+        assert response.json()["status"] == "failed"
+    finally:
+        lazy.shutdown()
@@ -0,0 +1,167 @@
+"""
+Tests for the knowledge base directory format (run with: python -m pytest test_kb_store.py)
+"""
+import os
+import json
+import pickle
+import shutil
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from kb_ingest import DELTA_LOG_NAME, read_delta_log
+from kb_store import (
+    CURRENT_NAME,
+    FORMAT_VERSION,
+    LOCK_NAME,
+    MANIFEST_NAME,
+    is_kb_dir,
+    kb_dir_for,
+    live_kb_dir,
+    load_category_matrix,
+    load_kb_dir,
+    migrate_pickle,
+    pickle_is_newer,
+    publish_kb_version,
+    save_kb_dir,
+    write_kb_version,
+)
+from retrieval import CategoryPartitions
+TICKETS = [
+    {"ticket_id": "T1", "category": "Network Problem", "description": "Wi-Fi drops every hour", "resolution": "Updated driver", "priority": "High", "status": "Resolved"},
+    {"ticket_id": "T2", "category": "Password Reset", "description": "Forgot password, locked out", "resolution": "Reset via portal", "priority": "Medium", "status": "Resolved"},
+    {"ticket_id": "T3", "category": "Email Issues", "description": "Outlook não sincroniza emails", "resolution": "Rebuilt profile", "priority": "Low", "status": "Closed"},
+]
+QUERIES = ["wifi keeps dropping", "locked out after password change", "emails sync outlook", "unknown words only"]
+def _fit(**params):
+    vectorizer = TfidfVectorizer(**params)
+    matrix = vectorizer.fit_transform([f"{t['category']} {t['description']}" for t in TICKETS])
+    return vectorizer, matrix
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"max_features": 5000, "ngram_range": (1, 2), "stop_words": "english"},
+        {"ngram_range": (1, 3), "max_df": 0.7, "sublinear_tf": True, "token_pattern": r"(?u)\b[a-zA-Z][a-zA-Z]+\b"},
+        {"ngram_range": (2, 3), "strip_accents": "unicode", "stop_words": ["after", "every"], "binary": True, "norm": "l1", "lowercase": False},
+    ],
+)
+def test_round_trip_matches_original(tmp_path, params):
+    vectorizer, matrix = _fit(**params)
+    path = str(tmp_path / "kb")
+    save_kb_dir(path, TICKETS, vectorizer, matrix)
+    tickets, loaded_vectorizer, loaded_matrix = load_kb_dir(path)
+    assert list(tickets) == TICKETS
+    assert (loaded_matrix != matrix).nnz == 0
+    assert loaded_vectorizer.vocabulary_ == vectorizer.vocabulary_
+    analyze, expected_analyze = loaded_vectorizer.build_analyzer(), vectorizer.build_analyzer()
+    assert [analyze(q) for q in QUERIES] == [expected_analyze(q) for q in QUERIES]
+    expected = vectorizer.transform(QUERIES)
+    actual = loaded_vectorizer.transform(QUERIES)
+    assert np.array_equal(actual.toarray(), expected.toarray())
+def test_matrix_is_memory_mapped(tmp_path):
+    vectorizer, matrix = _fit()
+    path = str(tmp_path / "kb")
+    version_dir = save_kb_dir(path, TICKETS, vectorizer, matrix)
+    _, _, loaded_matrix = load_kb_dir(path)
+    mapped = np.load(os.path.join(version_dir, "matrix_data.npy"), mmap_mode="r")
+    assert isinstance(mapped, np.memmap)
+    assert not loaded_matrix.data.flags.writeable
+    tickets, _, _ = load_kb_dir(path)
+    assert isinstance(tickets.text_columns["description"][0], np.memmap)
+def test_save_replaces_existing_directory(tmp_path):
+    vectorizer, matrix = _fit()
+    path = str(tmp_path / "kb")
+    save_kb_dir(path, TICKETS, vectorizer, matrix)
+    smaller = TfidfVectorizer()
+    smaller_matrix = smaller.fit_transform([t["description"] for t in TICKETS[:2]])
+    save_kb_dir(path, TICKETS[:2], smaller, smaller_matrix)
+    tickets, _, loaded_matrix = load_kb_dir(path)
+    assert len(tickets) == 2 and loaded_matrix.shape[0] == 2
+    assert sorted(os.listdir(tmp_path)) == ["kb"]
+def test_publish_swaps_current_and_prunes_old_versions(tmp_path):
+    vectorizer, matrix = _fit()
+    path = str(tmp_path / "kb")
+    first = save_kb_dir(path, TICKETS, vectorizer, matrix)
+    second = save_kb_dir(path, TICKETS, vectorizer, matrix)
+    # A version written but not published (e.g. a crash before the swap) is not live
+    pending = write_kb_version(path, TICKETS[:1], vectorizer, matrix[:1])
+    assert live_kb_dir(path) == second and len(load_kb_dir(path)[0]) == 3
+    publish_kb_version(path, pending)
+    assert live_kb_dir(path) == pending and len(load_kb_dir(path)[0]) == 1
+    # The version just replaced stays for readers that resolved CURRENT before the swap
+    assert sorted(os.listdir(path)) == sorted([CURRENT_NAME, LOCK_NAME, os.path.basename(second), os.path.basename(pending)])
+    assert not os.path.exists(first)
+def test_unversioned_layout_is_read_and_replaced_on_save(tmp_path):
+    vectorizer, matrix = _fit()
+    path = str(tmp_path / "kb")
+    version_dir = save_kb_dir(str(tmp_path / "staging"), TICKETS, vectorizer, matrix)
+    # Versions 1-5 kept their files directly in the knowledge base directory
+    shutil.copytree(version_dir, path)
+    _set_format_version(path, 5)
+    assert is_kb_dir(path) and list(load_kb_dir(path)[0]) == TICKETS
+    with open(os.path.join(path, DELTA_LOG_NAME), "w", encoding="utf-8") as f:
+        f.write(json.dumps(dict(TICKETS[0], ticket_id="NEW-1")) + "\n")
+    version_dir = save_kb_dir(path, TICKETS[:2], vectorizer, matrix[:2])
+    assert len(load_kb_dir(path)[0]) == 2
+    # Only the old layout's files go; its delta log is left and carried over
+    files = [name for name in os.listdir(path) if os.path.isfile(os.path.join(path, name))]
+    assert sorted(files) == sorted([CURRENT_NAME, LOCK_NAME, DELTA_LOG_NAME])
+    assert read_delta_log(version_dir) == read_delta_log(path) == [dict(TICKETS[0], ticket_id="NEW-1")]
+def test_migrate_pickle(tmp_path):
+    vectorizer, matrix = _fit()
+    pickle_path = str(tmp_path / "knowledge_base.pkl")
+    with open(pickle_path, "wb") as f:
+        pickle.dump({"tickets": TICKETS, "vectorizer": vectorizer, "tfidf_matrix": matrix}, f)
+    path = migrate_pickle(pickle_path)
+    assert path == kb_dir_for(pickle_path) == str(tmp_path / "knowledge_base")
+    assert is_kb_dir(path)
+    assert list(load_kb_dir(path)[0]) == TICKETS
+    assert not pickle_is_newer(pickle_path, path) and not pickle_is_newer(path, path)
+    # Rebuilt after the migration: the directory no longer reflects it
+    later = os.path.getmtime(os.path.join(live_kb_dir(path), MANIFEST_NAME)) + 60
+    os.utime(pickle_path, (later, later))
+    assert pickle_is_newer(pickle_path, path)
+def _set_format_version(path, version):
+    manifest_path = os.path.join(path, MANIFEST_NAME)
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    manifest["format_version"] = version
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+def test_older_format_builds_missing_indexes(tmp_path):
+    vectorizer, matrix = _fit()
+    path = str(tmp_path / "kb")
+    version_dir = save_kb_dir(path, TICKETS, vectorizer, matrix)
+    current, _, _ = load_kb_dir(path)
+    for name in ("keyword_ids.npy", "keyword_offsets.npy", "category_rows.npy", "category_offsets.npy"):
+        os.remove(os.path.join(version_dir, name))
+    with pytest.raises(FileNotFoundError):
+        load_kb_dir(path)
+    _set_format_version(version_dir, 2)
+    tickets, _, _ = load_kb_dir(path)
+    assert tickets.keywords is None and "category" not in tickets.partitions
+    assert np.array_equal(tickets.keyword_index().offsets, current.keyword_index().offsets)
+    assert all(np.array_equal(a, b) for a, b in zip(tickets.partition("category"), current.partition("category")))
+def test_category_partitions_are_slices_of_the_mapped_file(tmp_path):
+    vectorizer, matrix = _fit()
+    path = str(tmp_path / "kb")
+    version_dir = save_kb_dir(path, TICKETS, vectorizer, matrix)
+    tickets, _, loaded_matrix = load_kb_dir(path)
+    rows, offsets = tickets.partition("category")
+    partitions = CategoryPartitions(loaded_matrix, rows, offsets, load_category_matrix(path))
+    assert not partitions.category_matrix.data.flags.writeable
+    assert (partitions.category_matrix != loaded_matrix[rows]).nnz == 0
+    for code in range(len(offsets) - 1):
+        # A view on the memory-mapped file, not a copy per category
+        assert np.shares_memory(partitions.partition(code).data, partitions.category_matrix.data)
+        assert (partitions.partition(code) != loaded_matrix[rows[offsets[code] : offsets[code + 1]]]).nnz == 0
+    # Written before the category matrix was stored: built in memory once
+    _set_format_version(version_dir, 6)
+    assert load_category_matrix(path) is None
+    fallback = CategoryPartitions(loaded_matrix, rows, offsets)
+    assert (fallback.category_matrix != partitions.category_matrix).nnz == 0
+def test_unknown_format_version_is_rejected(tmp_path):
+    vectorizer, matrix = _fit()
+    path = str(tmp_path / "kb")
+    _set_format_version(save_kb_dir(path, TICKETS, vectorizer, matrix), FORMAT_VERSION + 1)
+    with pytest.raises(ValueError):
+        load_kb_dir(path)
@@ -0,0 +1,65 @@
+"""
+Tests for the LLM response cache (run with: python -m pytest test_llm_cache.py)
+"""
+from llm_cache import (
+    LLMResponseCache,
+    MemoryCacheBackend,
+    SQLiteCacheBackend,
+    make_cache_key,
+)
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    def __call__(self):
+        return self.now
+def test_cache_key_ignores_whitespace_only_differences():
+    a = make_cache_key("m", [{"role": "user", "content": "Reset  password\n now"}], max_tokens=10)
+    b = make_cache_key("m", [{"role": "user", "content": "Reset password now"}], max_tokens=10)
+    c = make_cache_key("m", [{"role": "user", "content": "Reset password now"}], max_tokens=20)
+    assert a == b
+    assert a != c
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryCacheBackend(max_entries=2, ttl_seconds=60)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    assert backend.get("a") == "1"  # "b" is now least recently used
+    backend.set("c", "3")
+    assert backend.get("b") is None
+    assert backend.get("a") == "1" and backend.get("c") == "3"
+def test_memory_backend_expires_entries():
+    clock = FakeClock()
+    backend = MemoryCacheBackend(max_entries=10, ttl_seconds=5, clock=clock)
+    backend.set("a", "1")
+    clock.now += 4
+    assert backend.get("a") == "1"
+    clock.now += 2
+    assert backend.get("a") is None
+    assert len(backend) == 0
+def test_sqlite_backend_survives_reopen_and_evicts(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    clock = FakeClock()
+    backend = SQLiteCacheBackend(path, max_entries=2, ttl_seconds=60, clock=clock)
+    backend.set("a", "1")
+    clock.now += 1
+    backend.set("b", "2")
+    clock.now += 1
+    assert backend.get("a") == "1"
+    clock.now += 1
+    backend.set("c", "3")
+    reopened = SQLiteCacheBackend(path, max_entries=2, ttl_seconds=60, clock=clock)
+    assert reopened.get("b") is None
+    assert reopened.get("a") == "1" and reopened.get("c") == "3"
+    clock.now += 120
+    assert reopened.get("a") is None
+def test_response_cache_counts_hits_and_misses():
+    cache = LLMResponseCache(MemoryCacheBackend(max_entries=10, ttl_seconds=60))
+    calls = []
+    def generate():
+        calls.append(1)
+        return "steps"
+    assert cache.get_or_generate("k", generate) == "steps"
+    assert cache.get_or_generate("k", generate) == "steps"
+    stats = cache.stats()
+    assert len(calls) == 1
+    assert stats["hits"] == 1 and stats["misses"] == 1
+    assert stats["hit_rate"] == 0.5 and stats["size"] == 1
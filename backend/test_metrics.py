@@ -0,0 +1,160 @@
+"""
+Tests for metrics tracking (run with: python -m pytest test_metrics.py)
+"""
+import random
+import threading
+import pytest
+from metrics import MAX_STAGE_CATEGORIES, NO_TRACE, MetricsTracker, StageTrace
+from quantile_sketch import QuantileSketch
+def _exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[int(q * (len(ordered) - 1))]
+def test_sketch_quantiles_within_relative_accuracy():
+    rng = random.Random(7)
+    values = [rng.lognormvariate(0, 1.5) for _ in range(20000)]
+    sketch = QuantileSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+    for q in (0.01, 0.5, 0.9, 0.99, 1.0):
+        exact = _exact_quantile(values, q)
+        assert abs(sketch.quantile(q) - exact) <= 0.01 * exact + 1e-12
+    assert sketch.count == len(values)
+    assert sketch.min == min(values) and sketch.max == max(values)
+    assert sketch.mean == pytest.approx(sum(values) / len(values))
+def test_sketch_merge_equals_single_sketch():
+    rng = random.Random(3)
+    values = [rng.expovariate(2) for _ in range(5000)] + [0.0] * 10
+    whole, left, right = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for i, value in enumerate(values):
+        whole.add(value)
+        (left if i % 2 else right).add(value)
+    left.merge(right)
+    assert left.buckets == whole.buckets and left.zero_count == whole.zero_count
+    assert left.quantiles([0.5, 0.9, 0.99]) == whole.quantiles([0.5, 0.9, 0.99])
+    with pytest.raises(ValueError):
+        left.merge(QuantileSketch(relative_accuracy=0.05))
+def test_sketch_memory_is_bounded():
+    sketch = QuantileSketch(max_buckets=32)
+    for exponent in range(-6, 6):
+        for step in range(1, 200):
+            sketch.add(step * 10.0 ** exponent)
+    assert len(sketch.buckets) <= 32
+    assert sketch.quantile(1.0) == sketch.max
+    assert QuantileSketch().quantile(0.5) is None
+def test_summary_reports_percentiles():
+    tracker = MetricsTracker()
+    for i in range(1, 101):
+        tracker.record_query("Network", i / 100, 0.5, success=i % 10 != 0)
+    summary = tracker.get_summary()
+    assert summary["total_queries"] == 100
+    assert summary["success_count"] == 90 and summary["error_count"] == 10
+    times = summary["response_times"]
+    assert times["min"] == 0.01 and times["max"] == 1.0
+    assert times["avg"] == pytest.approx(0.505)
+    assert times["p50"] == pytest.approx(0.5, rel=0.02)
+    assert times["p99"] == pytest.approx(0.99, rel=0.02)
+    assert times["median"] == times["p50"]
+    assert summary["category_distribution"] == {"Network": 100}
+def test_recent_queries_are_a_ring_buffer():
+    tracker = MetricsTracker(recent_queries=50)
+    for i in range(500):
+        tracker.record_query("Email", 1.0, 0.8)
+    assert len(tracker.queries) == 50
+    assert tracker.get_realtime_stats()["recent_queries"] == 50
+    assert tracker.get_summary()["total_queries"] == 500
+    tracker.reset()
+    assert tracker.get_summary()["total_queries"] == 0
+def test_concurrent_record_query_loses_nothing():
+    tracker = MetricsTracker(recent_queries=10)
+    def record(category):
+        for i in range(2000):
+            tracker.record_query(category, 0.1 + i % 7, 0.9)
+    threads = [threading.Thread(target=record, args=(f"c{n}",)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary = tracker.get_summary()
+    assert summary["total_queries"] == 16000
+    assert summary["category_distribution"] == {f"c{n}": 2000 for n in range(8)}
+    assert tracker.response_times.count == 16000
+def test_stage_trace_accumulates_spans():
+    trace = StageTrace()
+    with trace.span("scoring"):
+        pass
+    trace.add("scoring", 1_000_000)
+    with pytest.raises(RuntimeError):
+        with trace.span("llm_generation"):
+            raise RuntimeError("model down")
+    assert trace.stages["scoring"] >= 1_000_000
+    assert "llm_generation" in trace.stages
+    assert trace.elapsed_ns() > 0
+    with NO_TRACE.span("encoding"):
+        pass
+    assert NO_TRACE.stages == {}
+def test_stage_latencies_by_method_and_category():
+    tracker = MetricsTracker()
+    for i in range(10):
+        trace = StageTrace()
+        trace.add("encoding", 2_000_000)
+        trace.add("llm_generation", 500_000_000)
+        tracker.record_stages("Network", "ai-refined" if i % 2 else "template", trace)
+    stages = tracker.get_summary()["stage_latency_ms"]
+    assert list(stages) == ["encoding", "llm_generation", "total"]
+    assert stages["encoding"]["count"] == 10
+    assert stages["encoding"]["p50"] == pytest.approx(2.0, rel=0.02)
+    assert stages["llm_generation"]["by_method"]["ai-refined"]["count"] == 5
+    assert stages["llm_generation"]["by_category"]["Network"]["p99"] == pytest.approx(500, rel=0.02)
+def test_stage_categories_are_bounded():
+    tracker = MetricsTracker()
+    for n in range(MAX_STAGE_CATEGORIES + 5):
+        tracker.record_stages(f"category {n}", "template", StageTrace())
+    categories = tracker.get_summary()["stage_latency_ms"]["total"]["by_category"]
+    assert len(categories) == MAX_STAGE_CATEGORIES + 1
+    assert categories["other"]["count"] == 5
+def test_realtime_window_matches_recomputation():
+    tracker = MetricsTracker(recent_queries=200)
+    rng = random.Random(5)
+    recorded = []
+    for i in range(50):
+        query = (rng.choice(["Email", "Network", "VPN"]), rng.uniform(10, 500), rng.random())
+        recorded.append(query)
+        tracker.record_query(*query)
+    tracker.get_realtime_stats(20)  # built from the ring buffer, then kept current
+    for i in range(300):
+        query = (rng.choice(["Email", "Network", "VPN", f"rare {i}"]), rng.uniform(10, 500), rng.random())
+        recorded.append(query)
+        tracker.record_query(*query)
+    for limit in (20, 75):
+        stats = tracker.get_realtime_stats(limit)
+        recent = recorded[-limit:]
+        assert stats["window"] == limit and stats["recent_queries"] == limit
+        assert stats["avg_response_time"] == pytest.approx(sum(q[1] for q in recent) / limit)
+        assert stats["avg_confidence"] == pytest.approx(sum(q[2] for q in recent) / limit)
+        counts = {}
+        for category, _, _ in recent:
+            counts[category] = counts.get(category, 0) + 1
+        assert stats["recent_categories"] == counts
+        assert stats["category_stats"]["Email"]["count"] == counts["Email"]
+        exact_p90 = _exact_quantile([q[1] for q in recent], 0.9)
+        assert stats["response_times"]["p90"] == pytest.approx(exact_p90, rel=0.02)
+def test_realtime_window_is_capped_and_bounded():
+    tracker = MetricsTracker(recent_queries=10)
+    assert tracker.get_realtime_stats(5)["recent_queries"] == 0
+    for i in range(30):
+        tracker.record_query("Email", 1.0, 0.5)
+    assert tracker.get_realtime_stats(1000)["window"] == 10
+    for limit in range(1, 11):
+        tracker.get_realtime_stats(limit)
+    assert len(tracker._windows) <= 8
+def test_sketch_remove_undoes_add():
+    sketch = QuantileSketch()
+    for value in (0.0, 1.0, 2.0, 3.0):
+        sketch.add(value)
+    sketch.remove(3.0)
+    sketch.remove(0.0)
+    assert sketch.count == 2 and sketch.zero_count == 0
+    assert sketch.quantile(1.0) == pytest.approx(2.0, rel=0.01)
+    sketch.remove(1.0)
+    sketch.remove(2.0)
+    assert sketch.buckets == {} and sketch.quantile(0.5) is None
@@ -0,0 +1,129 @@
+"""
+Tests for the persistent metrics history (run with: python -m pytest test_metrics_history.py)
+"""
+import sqlite3
+import pytest
+from metrics import MetricsTracker
+from metrics_history import HOUR, MINUTE, MetricsHistory, create_metrics_history_from_env
+from quantile_sketch import QuantileSketch
+T0 = 1_700_000_000 // HOUR * HOUR
+class FakeClock:
+    def __init__(self, now=T0):
+        self.now = now
+    def __call__(self):
+        return self.now
+def _history(tmp_path, clock, **kwargs):
+    return MetricsHistory(str(tmp_path / "history.sqlite3"), clock=clock, **kwargs)
+def _count(history, sql):
+    return history._connect().execute(sql).fetchone()[0]
+def test_sketch_round_trips_through_dict():
+    sketch = QuantileSketch()
+    for value in (0.0, 1.5, 20, 300, 300):
+        sketch.add(value)
+    restored = QuantileSketch.from_dict(sketch.to_dict())
+    assert restored.quantiles([0, 0.5, 1]) == sketch.quantiles([0, 0.5, 1])
+    assert (restored.count, restored.sum, restored.min, restored.max) == (5, sketch.sum, 0.0, 300)
+    empty = QuantileSketch.from_dict(QuantileSketch().to_dict())
+    assert empty.count == 0 and empty.quantile(0.5) is None
+def test_history_points_from_minute_and_hour_rollups(tmp_path):
+    clock = FakeClock()
+    history = _history(tmp_path, clock)
+    for minute in range(3):
+        clock.now = T0 + minute * MINUTE + 5
+        for i in range(10):
+            history.record("Network", 100 * (i + 1), 0.8, success=i != 0)
+    clock.now = T0 + 10 * MINUTE
+    history.flush()
+    minutes = history.history(T0, T0 + 3 * MINUTE, MINUTE)
+    assert minutes["resolution"] == MINUTE
+    assert [p["start"] for p in minutes["points"]] == [T0, T0 + MINUTE, T0 + 2 * MINUTE]
+    point = minutes["points"][0]
+    assert (point["count"], point["errors"], point["categories"]) == (10, 1, {"Network": 10})
+    assert point["avg_response_time"] == pytest.approx(550)
+    assert point["max_response_time"] == 1000
+    assert point["p50_response_time"] == pytest.approx(500, rel=0.01)
+    assert point["p99_response_time"] == pytest.approx(900, rel=0.01)
+    assert point["avg_confidence"] == pytest.approx(0.8)
+    # Several minute rollups merge into one point per step
+    merged = history.history(T0, T0 + 5 * MINUTE, 5 * MINUTE)
+    assert [p["count"] for p in merged["points"]] == [30]
+    hours = history.history(T0, T0 + HOUR, HOUR)
+    assert hours["resolution"] == HOUR
+    assert hours["points"][0]["count"] == 30
+    assert hours["points"][0]["p90_response_time"] == merged["points"][0]["p90_response_time"]
+def test_events_flushed_late_still_reach_their_bucket(tmp_path):
+    clock = FakeClock()
+    first, second = _history(tmp_path, clock), _history(tmp_path, clock)
+    clock.now = T0 + 10
+    first.record("Network", 100, 0.9)
+    second.record("Hardware", 300, 0.5)
+    first.flush()
+    clock.now = T0 + 2 * HOUR
+    second.flush()
+    for step in (MINUTE, HOUR):
+        (point,) = first.history(T0, T0 + HOUR, step)["points"]
+        assert point["count"] == 2
+        assert point["categories"] == {"Network": 1, "Hardware": 1}
+    # Events are folded into the rollups exactly once
+    first.flush()
+    assert first.history(T0, T0 + HOUR, HOUR)["points"][0]["count"] == 2
+def test_history_persists_across_reopen(tmp_path):
+    clock = FakeClock(T0 + 30)
+    history = _history(tmp_path, clock)
+    history.record("Network", 250, 0.7)
+    history.close()
+    reopened = _history(tmp_path, clock)
+    assert reopened.history(T0, T0 + HOUR, MINUTE)["points"][0]["count"] == 1
+    conn = sqlite3.connect(str(tmp_path / "history.sqlite3"))
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+def test_retention_prunes_events_and_minutes_but_keeps_hours(tmp_path):
+    clock = FakeClock(T0 + 30)
+    history = _history(tmp_path, clock, raw_retention_seconds=HOUR, minute_retention_seconds=2 * HOUR)
+    history.record("Network", 100, 0.9)
+    history.flush()
+    assert _count(history, "SELECT COUNT(*) FROM metric_events") == 1
+    clock.now = T0 + 3 * HOUR
+    history.flush()
+    assert _count(history, "SELECT COUNT(*) FROM metric_events") == 0
+    # The minute rollups are pruned; an empty series would look like no traffic
+    with pytest.raises(ValueError, match="Minute rollups are kept for"):
+        history.history(T0, T0 + HOUR, MINUTE)
+    assert history.history(T0, T0 + HOUR, HOUR)["points"][0]["count"] == 1
+    assert history.history(clock.now - HOUR, clock.now, MINUTE)["points"] == []
+def test_failed_write_keeps_events_for_next_flush(tmp_path):
+    clock = FakeClock(T0 + 30)
+    blocker = tmp_path / "blocker"
+    blocker.write_text("")
+    history = MetricsHistory(str(blocker / "history.sqlite3"), clock=clock)
+    history.record("Network", 100, 0.9)
+    with pytest.raises(OSError):
+        history.flush()
+    history.record("Network", 200, 0.8)
+    history.path = str(tmp_path / "history.sqlite3")
+    history.flush()
+    assert history.history(T0, T0 + MINUTE, MINUTE)["points"][0]["count"] == 2
+def test_history_is_off_unless_configured(tmp_path, monkeypatch):
+    monkeypatch.delenv("METRICS_HISTORY_PATH", raising=False)
+    assert create_metrics_history_from_env() is None
+    monkeypatch.setenv("METRICS_HISTORY_PATH", "none")
+    assert create_metrics_history_from_env() is None
+    monkeypatch.setenv("METRICS_HISTORY_PATH", str(tmp_path / "history.sqlite3"))
+    assert create_metrics_history_from_env().path == str(tmp_path / "history.sqlite3")
+def test_history_rejects_bad_ranges(tmp_path):
+    history = _history(tmp_path, FakeClock())
+    with pytest.raises(ValueError):
+        history.history(T0, T0 + HOUR, 90)
+    with pytest.raises(ValueError):
+        history.history(T0 + HOUR, T0, HOUR)
+    with pytest.raises(ValueError):
+        history.history(T0, T0 + 365 * 86400, MINUTE)
+def test_tracker_logs_queries_to_attached_history(tmp_path):
+    clock = FakeClock(T0 + 30)
+    tracker = MetricsTracker()
+    tracker.history = _history(tmp_path, clock)
+    tracker.record_query("Network", 120, 0.6)
+    tracker.reset()
+    tracker.record_query("Network", 80, 0.4, success=False)
+    tracker.history.flush()
+    point = tracker.history.history(T0, T0 + MINUTE, MINUTE)["points"][0]
+    assert (point["count"], point["errors"]) == (2, 1)
@@ -0,0 +1,118 @@
+"""
+Tests for the OpenMetrics exposition (run with: python -m pytest test_openmetrics.py)
+"""
+import json
+import os
+from metrics import MAX_STAGE_CATEGORIES, MetricsTracker, StageTrace
+from openmetrics import FileRegistry, Histogram, MetricSet
+def _sample_lines(text, prefix):
+    return [line for line in text.splitlines() if line.startswith(prefix)]
+def test_histogram_buckets_are_upper_inclusive():
+    histogram = Histogram((1, 2, 5))
+    for value in (0.5, 1, 1.5, 5, 7):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1, 1]
+    assert histogram.count == 5 and histogram.sum == 15
+def test_render_openmetrics_text():
+    metric_set = MetricSet()
+    metric_set.counter("rag_queries", "Requests", 3, {"outcome": "success"})
+    metric_set.gauge("rag_llm_in_flight", "Calls", 2)
+    histogram = Histogram((0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    metric_set.histogram("rag_response_time_seconds", "Latency", histogram, {"method": 'ai "refined"'})
+    text = metric_set.render()
+    assert "# TYPE rag_queries counter" in text
+    assert 'rag_queries_total{outcome="success"} 3' in text
+    assert "rag_llm_in_flight 2" in text
+    assert _sample_lines(text, "rag_response_time_seconds_bucket") == [
+        'rag_response_time_seconds_bucket{method="ai \\"refined\\"",le="0.1"} 1',
+        'rag_response_time_seconds_bucket{method="ai \\"refined\\"",le="1"} 2',
+        'rag_response_time_seconds_bucket{method="ai \\"refined\\"",le="+Inf"} 2',
+    ]
+    assert 'rag_response_time_seconds_count{method="ai \\"refined\\""} 2' in text
+    assert text.endswith("# EOF\n")
+def test_tracker_exports_pre_aggregated_state():
+    tracker = MetricsTracker()
+    for i in range(1000):
+        tracker.record_query("Network" if i % 2 else "Email", 120.0, 0.85, success=i % 100 != 0)
+    trace = StageTrace()
+    trace.add("scoring", 3_000_000)
+    tracker.record_stages("Network", "template", trace)
+    text = tracker.to_metric_set().render()
+    assert 'rag_queries_total{outcome="success"} 990' in text
+    assert 'rag_queries_total{outcome="error"} 10' in text
+    assert 'rag_category_queries_total{category="Email"} 500' in text
+    assert 'rag_response_time_seconds_bucket{le="0.1"} 0' in text
+    assert 'rag_response_time_seconds_bucket{le="0.25"} 1000' in text
+    assert 'rag_confidence_bucket{le="0.9"} 1000' in text
+    assert 'rag_stage_duration_seconds_bucket{method="template",stage="scoring",le="0.005"} 1' in text
+    # One line per bucket and series, however many queries were recorded
+    assert len(text.splitlines()) < 150
+def test_exported_categories_are_bounded():
+    tracker = MetricsTracker()
+    for n in range(MAX_STAGE_CATEGORIES + 5):
+        tracker.record_query(f"category {n}", 100.0, 0.5)
+    lines = _sample_lines(tracker.to_metric_set().render(), "rag_category_queries_total")
+    assert len(lines) == MAX_STAGE_CATEGORIES + 1
+    assert 'rag_category_queries_total{category="other"} 5' in lines
+def test_file_registry_merges_workers(tmp_path):
+    registry = FileRegistry(str(tmp_path))
+    ours = MetricSet()
+    ours.counter("rag_queries", "Requests", 5, {"outcome": "success"})
+    ours.gauge("rag_llm_in_flight", "Calls", 2)
+    ours.gauge("rag_knowledge_base_tickets", "Tickets", 100, merge="max")
+    histogram = Histogram((1,))
+    histogram.observe(0.5)
+    ours.histogram("rag_response_time_seconds", "Latency", histogram)
+    registry.publish(ours)
+    # Another running worker (the parent process stands in for it)
+    with open(os.path.join(str(tmp_path), f"worker_{os.getppid()}_0.json"), "w") as f:
+        json.dump({"pid": os.getppid(), "instance": "0", **ours.to_dict()}, f)
+    text = registry.collect().render()
+    assert 'rag_queries_total{outcome="success"} 10' in text
+    assert "rag_llm_in_flight 4" in text
+    assert "rag_knowledge_base_tickets 100" in text
+    assert 'rag_response_time_seconds_bucket{le="1"} 2' in text
+    assert "rag_response_time_seconds_sum 1" in text
+    # A worker that stops takes its file, and its series, with it
+    registry.stop()
+    assert not os.path.exists(registry.path)
+    assert 'rag_queries_total{outcome="success"} 5' in registry.collect().render()
+def test_file_registry_removes_exited_workers(tmp_path):
+    exited = MetricSet()
+    exited.counter("rag_queries", "Requests", 7)
+    exited_path = os.path.join(str(tmp_path), "worker_999999999_0.json")
+    with open(exited_path, "w") as f:
+        json.dump({"pid": 999999999, "instance": "0", **exited.to_dict()}, f)
+    ours = MetricSet()
+    ours.counter("rag_queries", "Requests", 1)
+    registry = FileRegistry(str(tmp_path))
+    registry.publish(ours)
+    assert "rag_queries_total 1" in registry.collect().render()
+    assert sorted(os.listdir(str(tmp_path))) == [os.path.basename(registry.path)]
+def test_file_registry_survives_pid_reuse(tmp_path):
+    exited = MetricSet()
+    exited.counter("rag_queries", "Requests", 7)
+    exited.gauge("rag_llm_in_flight", "Calls", 3)
+    # An exited process that had this process's pid
+    with open(os.path.join(str(tmp_path), f"worker_{os.getpid()}_exited.json"), "w") as f:
+        json.dump({"pid": os.getpid(), "instance": "exited", **exited.to_dict()}, f)
+    ours = MetricSet()
+    ours.counter("rag_queries", "Requests", 1)
+    ours.gauge("rag_llm_in_flight", "Calls", 1)
+    registry = FileRegistry(str(tmp_path))
+    registry.publish(ours)
+    text = registry.collect().render()
+    assert "rag_queries_total 1" in text
+    assert "rag_llm_in_flight 1" in text
+def test_gauges_merge_by_sum_or_max():
+    merged = MetricSet()
+    for in_flight, tickets in ((2, 100), (3, 120)):
+        worker = MetricSet()
+        worker.gauge("rag_llm_in_flight", "Calls", in_flight)
+        worker.gauge("rag_knowledge_base_tickets", "Tickets", tickets, merge="max")
+        merged.merge(worker)
+    text = merged.render()
+    assert "rag_llm_in_flight 5" in text
+    assert "rag_knowledge_base_tickets 120" in text
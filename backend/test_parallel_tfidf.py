@@ -0,0 +1,42 @@
+"""
+Tests for the parallel TF-IDF fit (run with: python -m pytest test_parallel_tfidf.py)
+"""
+import os
+import pickle
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from kb_ingest import document_text
+from parallel_tfidf import ParallelTfidf
+BUNDLED_KB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "knowledge_base.pkl")
+@pytest.fixture(scope="module")
+def texts():
+    if not os.path.exists(BUNDLED_KB):
+        pytest.skip("Knowledge base not available")
+    with open(BUNDLED_KB, "rb") as f:
+        tickets = pickle.load(f)["tickets"][:1200]
+    return [document_text(t) for t in tickets]
+def _assert_equivalent(params, texts, **kwargs):
+    expected_vectorizer = TfidfVectorizer(**params).fit(texts)
+    expected = expected_vectorizer.transform(texts)
+    fitter = ParallelTfidf(TfidfVectorizer(**params), workers=2, shard_rows=250, **kwargs)
+    vectorizer, matrix = fitter.fit_transform(iter(texts))
+    assert vectorizer.vocabulary_ == expected_vectorizer.vocabulary_
+    np.testing.assert_allclose(vectorizer.idf_, expected_vectorizer.idf_)
+    assert matrix.shape == expected.shape
+    assert abs(matrix - expected).max() < 1e-12
+    np.testing.assert_allclose(vectorizer.transform(texts[:5]).toarray(), expected[:5].toarray())
+    return fitter.stats
+def test_matches_builder_vectorizer(texts):
+    stats = _assert_equivalent(dict(max_features=5000, ngram_range=(1, 2), stop_words="english"), texts)
+    assert stats["documents"] == len(texts)
+    assert stats["shards"] == 5 and stats["workers"] == 2
+def test_matches_pruned_trigram_vectorizer(texts, tmp_path):
+    params = dict(max_features=3000, ngram_range=(1, 3), stop_words="english", max_df=0.7, min_df=2, sublinear_tf=True)
+    _assert_equivalent(params, texts, tmp_dir=str(tmp_path))
+    assert list(tmp_path.iterdir()) == []
+def test_rejects_fixed_vocabulary_and_empty_input():
+    with pytest.raises(ValueError, match="fixed"):
+        ParallelTfidf(TfidfVectorizer(vocabulary=["vpn"]))
+    with pytest.raises(ValueError, match="empty vocabulary"):
+        ParallelTfidf(TfidfVectorizer(), workers=1).fit_transform(iter([]))
@@ -0,0 +1,83 @@
+"""
+Tests for the semantic query cache (run with: python -m pytest test_query_cache.py)
+"""
+from types import SimpleNamespace
+import pytest
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from query_cache import SemanticQueryCache
+from rag_engine_tfidf import RAGEngine
+CORPUS = [
+    "teams login fails",
+    "cannot log in to teams",
+    "vpn connection drops",
+    "printer out of toner",
+]
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+    def __call__(self):
+        return self.now
+def _vectorizer():
+    return TfidfVectorizer().fit(CORPUS)
+def test_near_duplicate_hits_and_unrelated_misses():
+    vectorizer = _vectorizer()
+    cache = SemanticQueryCache(max_entries=8, threshold=0.8)
+    cache.store(vectorizer.transform(["teams login fails"]), "login", {"id": 1}, cache.generation)
+    hit = cache.lookup(vectorizer.transform(["Teams login fails!"]), "login")
+    assert hit is not None and hit[0] == {"id": 1} and hit[1] > 0.99
+    assert cache.lookup(vectorizer.transform(["vpn connection drops"]), "login") is None
+    assert cache.lookup(vectorizer.transform(["teams login fails"]), "network") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 2
+def test_lru_and_ttl_eviction():
+    vectorizer = _vectorizer()
+    clock = FakeClock()
+    cache = SemanticQueryCache(max_entries=2, threshold=0.99, ttl_seconds=10, clock=clock)
+    for i, text in enumerate(CORPUS[1:]):
+        cache.store(vectorizer.transform([text]), "s", {"id": i}, cache.generation)
+    assert cache.stats()["size"] == 2
+    assert cache.lookup(vectorizer.transform([CORPUS[1]]), "s") is None
+    assert cache.lookup(vectorizer.transform([CORPUS[3]]), "s")[0] == {"id": 2}
+    clock.now += 11
+    assert cache.lookup(vectorizer.transform([CORPUS[3]]), "s") is None
+    assert cache.stats()["size"] == 1
+def test_invalidate_rejects_stale_results():
+    vectorizer = _vectorizer()
+    cache = SemanticQueryCache(max_entries=8, threshold=0.8)
+    query = vectorizer.transform([CORPUS[0]])
+    generation = cache.generation
+    cache.store(query, "s", {"id": 1}, generation)
+    cache.invalidate()
+    assert cache.lookup(query, "s") is None
+    cache.store(query, "s", {"id": 2}, generation)
+    assert cache.lookup(query, "s") is None
+    cache.store(sp.csr_matrix(query), "s", {"id": 3}, cache.generation)
+    assert cache.lookup(query, "s")[0] == {"id": 3}
+class PriorityEchoClient:
+    """Chat client whose reply names the priority found in the prompt."""
+    def __init__(self):
+        self.calls = 0
+    def chat_completion(self, messages, max_tokens, temperature):
+        self.calls += 1
+        prompt = " ".join(message["content"] for message in messages)
+        priority = next(p for p in ("Critical", "Low") if p in prompt)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=f"Steps for a {priority} ticket"))])
+def test_engine_cache_is_scoped_by_priority(monkeypatch, bundled_kb):
+    engine = RAGEngine(bundled_kb)
+    try:
+        if not engine.is_ready():
+            pytest.skip("Knowledge base not available")
+        client = PriorityEchoClient()
+        monkeypatch.setattr(engine, "hf_client", client)
+        monkeypatch.setattr(engine, "llm_cache", None)
+        monkeypatch.setattr(engine, "query_cache", SemanticQueryCache(max_entries=8, threshold=0.9))
+        ticket = {"category": "Password Reset", "description": "I forgot my password and cannot login"}
+        low = engine.suggest_resolution(priority="Low", **ticket)
+        assert low["method"] == "ai-refined"
+        critical = engine.suggest_resolution(priority="Critical", **ticket)
+        assert "Critical" in critical["suggested_resolution"]
+        assert not critical["metadata"].get("query_cache_hit")
+        again = engine.suggest_resolution(priority="Low", **ticket)
+        assert again["metadata"].get("query_cache_hit") and client.calls == 2
+    finally:
+        engine.shutdown()
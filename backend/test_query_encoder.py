@@ -0,0 +1,70 @@
+"""
+Tests for the compiled query encoder (run with: python -m pytest test_query_encoder.py)
+"""
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+from query_encoder import QueryEncoder, compile_trie
+from kb_store import VECTORIZER_PARAMS
+from tfidf_model import TfidfModel
+DOCUMENTS = [
+    "Network Problem Wi-Fi drops every hour after the VPN tunnel connects",
+    "Password Reset Forgot password, locked out after password change",
+    "Email Issues Outlook não sincroniza emails, Outlook profile corrupted",
+    "Network Problem VPN tunnel drops, Wi-Fi drops again",
+    "Hardware Failure Laptop screen flickers every hour",
+]
+QUERIES = [
+    "wifi keeps dropping every hour",
+    "VPN tunnel drops drops drops",
+    "locked out after password change password",
+    "outlook nao sincroniza",
+    "unknown words only",
+    "",
+]
+PARAMS = [
+    {},
+    {"max_features": 5000, "ngram_range": (1, 2), "stop_words": "english"},
+    {"ngram_range": (1, 3), "max_df": 0.7, "sublinear_tf": True, "token_pattern": r"(?u)\b[a-zA-Z][a-zA-Z]+\b"},
+    {"ngram_range": (2, 3), "strip_accents": "unicode", "stop_words": ["after", "every"], "binary": True, "norm": "l1", "lowercase": False},
+    {"ngram_range": (1, 2), "use_idf": False, "norm": None, "max_features": 12},
+]
+def _assert_identical(actual, expected):
+    assert actual.shape == expected.shape
+    assert np.array_equal(actual.indptr, expected.indptr)
+    assert np.array_equal(actual.indices, expected.indices)
+    assert np.array_equal(actual.data, expected.data)
+@pytest.mark.parametrize("params", PARAMS)
+def test_encode_matches_vectorizer(params):
+    vectorizer = TfidfVectorizer(**params).fit(DOCUMENTS)
+    encoder = QueryEncoder.from_vectorizer(vectorizer)
+    expected = vectorizer.transform(QUERIES)
+    expected.sort_indices()
+    _assert_identical(encoder.encode(QUERIES), expected)
+    _assert_identical(encoder.encode(DOCUMENTS), vectorizer.transform(DOCUMENTS).sorted_indices())
+@pytest.mark.parametrize("params", PARAMS)
+def test_model_transform_uses_encoder(params):
+    vectorizer = TfidfVectorizer(**params).fit(DOCUMENTS)
+    terms = sorted(vectorizer.vocabulary_, key=vectorizer.vocabulary_.get)
+    model_params = {name: getattr(vectorizer, name) for name in VECTORIZER_PARAMS}
+    model_params["dtype"] = "float64"
+    model = TfidfModel(model_params, terms, getattr(vectorizer, "idf_", None), vectorizer.get_stop_words())
+    assert model._encoder is not None
+    _assert_identical(model.transform(QUERIES), vectorizer.transform(QUERIES).sorted_indices())
+def test_unsupported_params_fall_back():
+    tokenize_with_spaces = lambda doc: [doc]
+    params = {"norm": "l2", "dtype": np.float64}
+    assert QueryEncoder.supports(params, str.split)
+    assert not QueryEncoder.supports(params, tokenize_with_spaces)
+    assert not QueryEncoder.supports({"norm": "max", "dtype": np.float64}, str.split)
+    assert not QueryEncoder.supports({"norm": "l2", "dtype": np.float32}, str.split)
+def test_compile_trie_keeps_prefix_terms():
+    trie = compile_trie({"vpn tunnel": 0, "vpn": 1, "tunnel drops": 2})
+    assert trie["vpn"][0] == 1
+    assert trie["vpn"][1]["tunnel"] == [0, None]
+    assert trie["tunnel"][0] == -1
+    assert trie["tunnel"][1]["drops"] == [2, None]
+def test_rejects_single_string():
+    vectorizer = TfidfVectorizer().fit(DOCUMENTS)
+    with pytest.raises(ValueError):
+        QueryEncoder.from_vectorizer(vectorizer).encode("a single query")
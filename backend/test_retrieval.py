@@ -0,0 +1,105 @@
+"""
+Tests for the retrieval kernels (run with: python -m pytest test_retrieval.py)
+"""
+import numpy as np
+import scipy.sparse as sp
+from sklearn.preprocessing import normalize
+from retrieval import CategoryPartitions, InvertedIndex, rerank, top_k_similar
+def _random_corpus(n_docs=2000, n_features=300, density=0.02, seed=0):
+    """Random L2-normalised TF-IDF-like corpus plus a handful of queries."""
+    rng = np.random.default_rng(seed)
+    matrix = normalize(
+        sp.random(n_docs, n_features, density=density, format="csr", random_state=rng)
+    )
+    queries = normalize(
+        sp.random(20, n_features, density=0.03, format="csr", random_state=rng)
+    )
+    return matrix, queries
+def _reference_top_k(matrix, query_vec, n):
+    """Dense cosine + full sort, as find_similar_tickets used to do."""
+    scores = (matrix @ query_vec.T).toarray().ravel()
+    order = np.lexsort((np.arange(len(scores)), -scores))
+    order = order[scores[order] > 0][:n]
+    return order, scores[order]
+def test_top_k_matches_dense_reference():
+    matrix, queries = _random_corpus()
+    for i in range(queries.shape[0]):
+        rows, scores = top_k_similar(matrix, queries[i], 15)
+        ref_rows, ref_scores = _reference_top_k(matrix, queries[i], 15)
+        np.testing.assert_allclose(scores, ref_scores)
+        np.testing.assert_array_equal(rows, ref_rows)
+def test_top_k_handles_query_without_shared_terms():
+    matrix, _ = _random_corpus()
+    empty_query = sp.csr_matrix((1, matrix.shape[1]))
+    rows, scores = top_k_similar(matrix, empty_query, 10)
+    assert rows.size == 0 and scores.size == 0
+def test_top_k_returns_all_candidates_when_n_exceeds_matches():
+    matrix, queries = _random_corpus(n_docs=50)
+    rows, scores = top_k_similar(matrix, queries[0], 1000)
+    ref_rows, _ = _reference_top_k(matrix, queries[0], 1000)
+    np.testing.assert_array_equal(rows, ref_rows)
+    assert np.all(np.diff(scores) <= 0)
+def test_inverted_index_matches_matrix_kernel():
+    matrix, queries = _random_corpus()
+    index = InvertedIndex(matrix)
+    for early_termination in (False, True):
+        for i in range(queries.shape[0]):
+            rows, scores = index.top_k(
+                queries[i], 15, early_termination=early_termination
+            )
+            ref_rows, ref_scores = top_k_similar(matrix, queries[i], 15)
+            np.testing.assert_allclose(scores, ref_scores)
+            np.testing.assert_array_equal(rows, ref_rows)
+def test_inverted_index_min_score_keeps_all_qualifying_docs():
+    matrix, queries = _random_corpus()
+    index = InvertedIndex(matrix)
+    for i in range(queries.shape[0]):
+        ref_rows, ref_scores = top_k_similar(matrix, queries[i], 15)
+        min_score = float(np.median(ref_scores)) if ref_scores.size else 0.0
+        rows, scores = index.top_k(queries[i], 15, min_score=min_score)
+        expected = ref_rows[ref_scores >= min_score]
+        np.testing.assert_array_equal(rows[scores >= min_score], expected)
+if __name__ == "__main__":
+    test_top_k_matches_dense_reference()
+    test_top_k_handles_query_without_shared_terms()
+    test_top_k_returns_all_candidates_when_n_exceeds_matches()
+    test_inverted_index_matches_matrix_kernel()
+    test_inverted_index_min_score_keeps_all_qualifying_docs()
+    print("✅ Retrieval kernel tests passed")
+def test_rerank_applies_threshold_after_boosts():
+    rows = np.array([10, 11, 12, 13])
+    scores = np.array([0.5, 0.22, 0.22, 0.9])
+    category_match = np.array([False, True, False, True])
+    overlap = np.array([0, 0, 0, 2])
+    out_rows, out_scores = rerank(rows, scores, category_match, overlap, k=10, min_similarity=0.25)
+    # Row 11 passes only because of its category boost; row 13 is capped at 1.0
+    np.testing.assert_array_equal(out_rows, [13, 10, 11])
+    np.testing.assert_allclose(out_scores, [1.0, 0.5, 0.22 * 1.3])
+def test_rerank_keeps_retrieval_order_for_ties_and_truncates():
+    rows = np.array([5, 3, 9, 1])
+    scores = np.array([0.4, 0.4, 0.3, 0.4])
+    none = np.zeros(4, dtype=bool)
+    out_rows, _ = rerank(rows, scores, none, np.zeros(4), k=2, min_similarity=0.0)
+    np.testing.assert_array_equal(out_rows, [5, 3])
+    out_rows, _ = rerank(rows[:0], scores[:0], none[:0], np.zeros(0), k=2, min_similarity=0.0)
+    assert out_rows.size == 0
+def test_rerank_breaks_ties_at_the_cap_by_cosine():
+    rows = np.array([7, 8, 9])
+    scores = np.array([0.8, 0.95, 0.9])
+    category_match = np.ones(3, dtype=bool)
+    out_rows, out_scores = rerank(rows, scores, category_match, np.zeros(3), k=3, min_similarity=0.0)
+    np.testing.assert_array_equal(out_rows, [8, 9, 7])
+    np.testing.assert_allclose(out_scores, [1.0, 1.0, 1.0])
+def test_category_partition_matches_masked_corpus():
+    matrix, queries = _random_corpus()
+    codes = np.random.default_rng(1).integers(0, 7, matrix.shape[0])
+    rows = np.argsort(codes, kind="stable")
+    offsets = np.searchsorted(codes[rows], np.arange(8))
+    partitions = CategoryPartitions(matrix, rows, offsets)
+    for i in range(queries.shape[0]):
+        for selected in ([3], [0, 5]):
+            masked = matrix.multiply(np.isin(codes, selected)[:, None]).tocsr()
+            ref_rows, ref_scores = _reference_top_k(masked, queries[i], 15)
+            part_rows, part_scores = partitions.top_k(queries[i], selected, 15)
+            np.testing.assert_array_equal(part_rows, ref_rows)
+            np.testing.assert_allclose(part_scores, ref_scores)
@@ -0,0 +1,75 @@
+"""
+Tests for streaming resolution (run with: python -m pytest test_streaming.py)
+Uses the bundled knowledge base with a fake chat client so no network is needed.
+"""
+from types import SimpleNamespace
+import pytest
+from fastapi.testclient import TestClient
+from metrics import metrics_tracker
+from rag_engine_tfidf import RAGEngine
+TICKET = {"category": "Password Reset", "priority": "Medium", "description": "I forgot my password and cannot login"}
+class FakeChatClient:
+    """Replies with a fixed text, streamed in small chunks when stream=True."""
+    reply = "1. Open the reset portal\n2. Verify identity\n3. Set a new password"
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+    def chat_completion(self, messages, max_tokens, temperature, stream=False):
+        if not stream:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.reply))])
+        return self._chunks()
+    def _chunks(self):
+        for i in range(0, len(self.reply), 7):
+            if self.fail_after is not None and i >= self.fail_after:
+                raise RuntimeError("stream dropped")
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=self.reply[i:i + 7]))])
+@pytest.fixture(scope="module")
+def engine(bundled_kb):
+    rag_engine = RAGEngine(bundled_kb)
+    if not rag_engine.is_ready():
+        pytest.skip("Knowledge base not available")
+    rag_engine.llm_cache = None
+    rag_engine.query_cache = None
+    yield rag_engine
+    rag_engine.shutdown()
+def _collect(events):
+    text = "".join(data["text"] for event, data in events if event == "token")
+    return text, [event for event, _ in events]
+def test_stream_matches_suggest_resolution(engine, monkeypatch):
+    monkeypatch.setattr(engine, "hf_client", FakeChatClient())
+    events = list(engine.stream_resolution(**TICKET))
+    text, names = _collect(events)
+    single = engine.suggest_resolution(**TICKET)
+    assert names[0] == "similar_tickets" and names[-1] == "done"
+    assert names.count("token") > 2
+    assert text == single["suggested_resolution"]
+    assert events[0][1]["similar_tickets"] == single["similar_tickets"]
+    assert events[-1][1]["method"] == single["method"]
+    assert events[-1][1]["metadata"]["model"] == single["metadata"]["model"]
+def test_stream_failure_before_first_token_uses_template(engine, monkeypatch):
+    monkeypatch.setattr(engine, "hf_client", FakeChatClient(fail_after=0))
+    events = list(engine.stream_resolution(**TICKET))
+    text, names = _collect(events)
+    assert "error" not in names
+    assert events[-1][1]["metadata"]["model"] == "template-fallback"
+    monkeypatch.setattr(engine, "hf_client", None)
+    assert text == engine.suggest_resolution(**TICKET)["suggested_resolution"]
+def test_stream_failure_mid_reply_ends_with_error(engine, monkeypatch):
+    monkeypatch.setattr(engine, "hf_client", FakeChatClient(fail_after=14))
+    before = metrics_tracker.get_summary()
+    text, names = _collect(list(engine.stream_resolution(**TICKET)))
+    assert names[-1] == "error" and "done" not in names
+    assert text.endswith(FakeChatClient.reply[:14])
+    after = metrics_tracker.get_summary()
+    assert after.get("error_count", 0) == before.get("error_count", 0) + 1
+    assert after.get("success_count", 0) == before.get("success_count", 0)
+def test_stream_endpoint_sends_sse(engine, monkeypatch):
+    import app as app_module
+    monkeypatch.setattr(engine, "hf_client", FakeChatClient())
+    monkeypatch.setattr(app_module, "rag_engine", engine)
+    # No context manager: skip startup/shutdown so the fixture engine is used
+    response = TestClient(app_module.app).post("/api/suggest-resolution/stream", json=TICKET)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    body = response.text
+    assert body.startswith("event: similar_tickets\ndata: ")
+    assert body.rstrip().split("\n\n")[-1].startswith("event: done\n")
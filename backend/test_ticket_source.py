@@ -0,0 +1,64 @@
+"""
+Tests for streaming ticket readers (run with: python -m pytest test_ticket_source.py)
+"""
+import pytest
+from ticket_source import TICKET_FIELDS, detect_columns, read_ticket_chunks
+from ticket_store import TicketStore
+HEADERS = ["Incident ID", "Issue Type", "Problem", "Fix", "Severity"]
+ROWS = [
+    ["INC-1", "Password Reset", "forgot password", "reset via portal", "High"],
+    ["", "Network Problem", "wifi drops", "renewed DHCP lease", None],
+    ["INC-3", "Email Issues", "outlook not syncing", "rebuilt profile", "Low"],
+]
+def _write_csv(path):
+    lines = [",".join(HEADERS)] + [",".join(v or "" for v in row) for row in ROWS]
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    return str(path)
+def _collect(chunks):
+    columns = {field: [] for field in TICKET_FIELDS}
+    sizes = []
+    for chunk in chunks:
+        sizes.append(len(chunk["category"]))
+        for field in TICKET_FIELDS:
+            columns[field].extend(chunk[field])
+    return columns, sizes
+def test_detect_columns_maps_aliases():
+    mapping = detect_columns(HEADERS)
+    assert mapping == {"ticket_id": 0, "category": 1, "description": 2, "resolution": 3, "priority": 4}
+    with pytest.raises(ValueError, match="resolution"):
+        detect_columns(["category", "description"])
+def test_csv_chunks_fill_defaults(tmp_path):
+    columns, sizes = _collect(read_ticket_chunks(_write_csv(tmp_path / "t.csv"), chunk_rows=2))
+    assert sizes == [2, 1]
+    assert columns["ticket_id"] == ["INC-1", "T-2", "INC-3"]
+    assert columns["priority"] == ["High", "Medium", "Low"]
+    assert columns["status"] == ["Resolved"] * 3
+    assert columns["resolution"][1] == "renewed DHCP lease"
+def test_xlsx_matches_csv(tmp_path):
+    openpyxl = pytest.importorskip("openpyxl")
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    for row in [HEADERS] + ROWS:
+        sheet.append([v or None for v in row])
+    workbook.save(tmp_path / "t.xlsx")
+    expected = _collect(read_ticket_chunks(_write_csv(tmp_path / "t.csv")))[0]
+    assert _collect(read_ticket_chunks(str(tmp_path / "t.xlsx"), chunk_rows=2))[0] == expected
+def test_parquet_matches_csv(tmp_path):
+    pa = pytest.importorskip("pyarrow")
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pa.table({header: [row[i] for row in ROWS] for i, header in enumerate(HEADERS)})
+    pq.write_table(table, tmp_path / "t.parquet")
+    expected = _collect(read_ticket_chunks(_write_csv(tmp_path / "t.csv")))[0]
+    assert _collect(read_ticket_chunks(str(tmp_path / "t.parquet"), chunk_rows=2))[0] == expected
+def test_missing_file_and_unsupported_type(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        read_ticket_chunks(str(tmp_path / "missing.csv"))
+    (tmp_path / "t.json").write_text("[]")
+    with pytest.raises(ValueError, match="Unsupported"):
+        read_ticket_chunks(str(tmp_path / "t.json"))
+def test_chunk_stores_concatenate(tmp_path):
+    chunks = list(read_ticket_chunks(_write_csv(tmp_path / "t.csv"), chunk_rows=2))
+    store = TicketStore.concat([TicketStore.from_columns(chunk) for chunk in chunks])
+    assert len(store) == 3
+    assert store[2]["category"] == "Email Issues"
+    assert store.value_counts("priority") == {"High": 1, "Medium": 1, "Low": 1}
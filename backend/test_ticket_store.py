@@ -0,0 +1,64 @@
+"""
+Tests for the columnar ticket store (run with: python -m pytest test_ticket_store.py)
+"""
+import random
+import numpy as np
+import pytest
+from ticket_store import KeywordIndex, TicketStore, hash_tokens
+TICKETS = [
+    {"ticket_id": "T1", "category": "Network Problem", "description": "Wi-Fi drops", "resolution": "Updated driver", "priority": "High", "status": "Resolved"},
+    {"ticket_id": "T2", "category": "Password Reset", "description": "Locked out", "resolution": "", "priority": "Medium", "status": "Resolved"},
+    {"ticket_id": "T3", "category": "Network Problem", "description": "Café Wi-Fi portal ✓", "resolution": "Accepted terms", "priority": "High", "status": "Closed"},
+]
+def test_round_trips_dicts():
+    store = TicketStore.from_dicts(TICKETS)
+    assert len(store) == 3
+    assert list(store) == TICKETS
+    assert store[-1] == TICKETS[2]
+    assert list(store[0]) == list(TICKETS[0])  # field order preserved
+    with pytest.raises(IndexError):
+        store[3]
+def test_items_are_independent_dicts():
+    store = TicketStore.from_dicts(TICKETS)
+    ticket = store[0]
+    ticket["similarity_score"] = 0.9
+    assert "similarity_score" not in store[0]
+def test_columns_are_encoded():
+    store = TicketStore.from_dicts(TICKETS)
+    codes, labels = store.codes("category")
+    assert labels == ["Network Problem", "Password Reset"]
+    assert codes.tolist() == [0, 1, 0] and codes.dtype == np.int32
+    assert "description" in store.text_columns and "category" not in store.text_columns
+    assert store.get(np.int64(2), "description") == "Café Wi-Fi portal ✓"
+    assert store.get(0, "missing", "") == ""
+def test_value_counts_and_derived_codes():
+    store = TicketStore.from_dicts(TICKETS, categorical_fields=())
+    assert store.value_counts("category") == {"Network Problem": 2, "Password Reset": 1}
+    codes, labels = store.codes("status")
+    assert [labels[c] for c in codes] == ["Resolved", "Resolved", "Closed"]
+def test_empty_store():
+    store = TicketStore.from_dicts([])
+    assert len(store) == 0 and list(store) == []
+    assert not store
+def test_keyword_overlap_matches_set_intersection():
+    rng = random.Random(0)
+    words = ["Login", "login", "TEAMS", "password", "reset", "wi-fi", "vpn", "Café", "error,", "error"]
+    texts = [" ".join(rng.choices(words, k=rng.randint(0, 8))) for _ in range(200)]
+    index = KeywordIndex.from_texts(texts)
+    rows = np.array(rng.choices(range(200), k=500))
+    for _ in range(20):
+        query = " ".join(rng.choices(words + ["unseen"], k=rng.randint(0, 6)))
+        expected = [len(set(query.lower().split()) & set(texts[r].lower().split())) for r in rows]
+        actual = index.overlap_counts(rows, hash_tokens(query.lower().split()))
+        assert actual.tolist() == expected
+    assert index.overlap_counts(np.array([], dtype=np.int64), hash_tokens(["login"])).tolist() == []
+def test_store_builds_keyword_index_from_description_and_resolution():
+    store = TicketStore.from_dicts(TICKETS)
+    counts = store.keyword_index().overlap_counts(np.arange(3), hash_tokens(["updated", "driver", "wi-fi"]))
+    assert counts.tolist() == [3, 0, 1]
+def test_matches_compares_case_insensitively():
+    tickets = TICKETS + [dict(TICKETS[0], category="network problem")]
+    for store in (TicketStore.from_dicts(tickets), TicketStore.from_dicts(tickets, categorical_fields=())):
+        mask = store.matches(np.array([3, 1, 0, 2]), "category", "NETWORK Problem")
+        assert mask.tolist() == [True, False, True, True]
+        assert store.matches(np.array([0]), "team", "x").tolist() == [False]
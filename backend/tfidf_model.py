@@ -0,0 +1,195 @@
+"""
+TF-IDF Model
+The fitted half of a TfidfVectorizer, rebuilt from a knowledge base directory
+without importing scikit-learn: the word analyzer (preprocessing, token regex,
+stop words, n-grams), the vocabulary and the IDF weights. transform() gives
+the same matrix as the TfidfVectorizer that was saved, so the query path needs
+only NumPy and SciPy; scikit-learn is imported only to fit (see kb_build.py).
+Word-level vocabularies are encoded with a compiled QueryEncoder.
+"""
+import re
+import math
+import unicodedata
+from typing import Callable, Dict, Iterable, List, Optional
+import numpy as np
+import scipy.sparse as sp
+from query_encoder import QueryEncoder
+def strip_accents_unicode(s: str) -> str:
+    """As sklearn's strip_accents_unicode: decompose, then drop combining marks."""
+    try:
+        s.encode("ASCII", errors="strict")
+        return s
+    except UnicodeEncodeError:
+        normalized = unicodedata.normalize("NFKD", s)
+        return "".join([c for c in normalized if not unicodedata.combining(c)])
+def strip_accents_ascii(s: str) -> str:
+    """As sklearn's strip_accents_ascii: decompose and drop non-ASCII characters."""
+    nkfd_form = unicodedata.normalize("NFKD", s)
+    return nkfd_form.encode("ASCII", "ignore").decode("ASCII")
+ACCENT_FUNCTIONS = {None: None, "unicode": strip_accents_unicode, "ascii": strip_accents_ascii}
+def resolve_stop_words(stop_words) -> Optional[frozenset]:
+    """Stop word set for a stop_words parameter; "english" is scikit-learn's list."""
+    if stop_words is None:
+        return None
+    if stop_words == "english":
+        # Only directories saved before the resolved list was stored need this
+        from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+        return ENGLISH_STOP_WORDS
+    return frozenset(stop_words)
+def build_preprocessor(params: Dict) -> Callable[[str], str]:
+    """Lowercasing and accent stripping, as TfidfVectorizer.build_preprocessor()."""
+    strip_accents = ACCENT_FUNCTIONS[params["strip_accents"]]
+    lowercase = params["lowercase"]
+    def preprocess(doc: str) -> str:
+        if lowercase:
+            doc = doc.lower()
+        if strip_accents is not None:
+            doc = strip_accents(doc)
+        return doc
+    return preprocess
+def build_tokenizer(params: Dict) -> Callable[[str], List[str]]:
+    token_pattern = re.compile(params["token_pattern"])
+    if token_pattern.groups > 1:
+        raise ValueError("More than 1 capturing group in token pattern")
+    return token_pattern.findall
+def build_analyzer(params: Dict, stop_words: Optional[frozenset]) -> Callable[[str], List[str]]:
+    """
+    TfidfVectorizer(analyzer="word").build_analyzer() for these parameters:
+    preprocess, find tokens, drop stop words, add n-grams.
+    """
+    preprocess = build_preprocessor(params)
+    find_tokens = build_tokenizer(params)
+    min_n, max_n = params["ngram_range"]
+    space_join = " ".join
+    def analyze(doc: str) -> List[str]:
+        tokens = find_tokens(preprocess(doc))
+        if stop_words is not None:
+            tokens = [w for w in tokens if w not in stop_words]
+        if max_n == 1:
+            return tokens
+        original_tokens = tokens
+        n_original_tokens = len(original_tokens)
+        start_n = min_n
+        if min_n == 1:
+            tokens = list(original_tokens)
+            start_n = 2
+        else:
+            tokens = []
+        for n in range(start_n, min(max_n + 1, n_original_tokens + 1)):
+            for i in range(n_original_tokens - n + 1):
+                tokens.append(space_join(original_tokens[i : i + n]))
+        return tokens
+    return analyze
+def normalize_rows(matrix: sp.csr_matrix, norm: Optional[str]):
+    """
+    In-place row normalisation matching sklearn.preprocessing.normalize on CSR
+    input, which sums each row left to right (NumPy's pairwise sum would round
+    differently).
+    """
+    if norm is None:
+        return
+    if norm not in ("l1", "l2"):
+        raise ValueError(f"Unsupported norm {norm!r}")
+    data = matrix.data
+    indptr = matrix.indptr.tolist()
+    for row in range(len(indptr) - 1):
+        start, end = indptr[row], indptr[row + 1]
+        total = 0.0
+        if norm == "l2":
+            for value in data[start:end].tolist():
+                total += value * value
+            total = math.sqrt(total)
+        else:
+            for value in data[start:end].tolist():
+                total += abs(value)
+        if total != 0.0:
+            data[start:end] /= total
+class TfidfModel:
+    """
+    Fitted TF-IDF transform with the TfidfVectorizer attributes the engine
+    uses: vocabulary_, idf_, build_analyzer(), transform() and get_params().
+    params are the stored vectorizer parameters (kb_store.VECTORIZER_PARAMS);
+    stop_words is the resolved stop word list, if any.
+    """
+    analyzer = "word"
+    tokenizer = None
+    preprocessor = None
+    def __init__(self, params: Dict, terms: List[str], idf: Optional[np.ndarray], stop_words: Iterable[str] = None):
+        self.params = dict(params)
+        self.params["ngram_range"] = tuple(self.params["ngram_range"])
+        self.vocabulary_ = {term: i for i, term in enumerate(terms)}
+        self.idf_ = np.asarray(idf, dtype=np.float64) if params["use_idf"] else None
+        self.dtype = np.dtype(self.params["dtype"])
+        if stop_words is not None:
+            self.stop_words_ = frozenset(stop_words)
+        else:
+            self.stop_words_ = resolve_stop_words(self.params["stop_words"])
+        self._analyze = build_analyzer(self.params, self.stop_words_)
+        self._encoder = None
+        tokenize = build_tokenizer(self.params)
+        if QueryEncoder.supports(self.params, tokenize):
+            self._encoder = QueryEncoder(
+                self.vocabulary_,
+                self.idf_,
+                self.params,
+                self.stop_words_,
+                build_preprocessor(self.params),
+                tokenize,
+            )
+    def __getattr__(self, name):
+        # Vectorizer parameters read as attributes, as on TfidfVectorizer
+        params = self.__dict__.get("params")
+        if params is not None and name in params:
+            return params[name]
+        raise AttributeError(name)
+    def get_params(self) -> Dict:
+        """Keyword arguments for an unfitted TfidfVectorizer with these parameters."""
+        params = dict(self.params)
+        params["dtype"] = self.dtype.type
+        return params
+    def get_stop_words(self) -> Optional[frozenset]:
+        return self.stop_words_
+    def build_preprocessor(self) -> Callable[[str], str]:
+        return build_preprocessor(self.params)
+    def build_tokenizer(self) -> Callable[[str], List[str]]:
+        return build_tokenizer(self.params)
+    def build_analyzer(self) -> Callable[[str], List[str]]:
+        return self._analyze
+    def transform(self, texts: Iterable[str]) -> sp.csr_matrix:
+        """TF-IDF rows for texts, equal to the saved vectorizer's transform()."""
+        if isinstance(texts, str):
+            raise ValueError("Iterable over raw text documents expected, string object received.")
+        if self._encoder is not None:
+            return self._encoder.encode(texts)
+        vocabulary = self.vocabulary_
+        indices = []
+        values = []
+        indptr = [0]
+        for text in texts:
+            counts = {}
+            for term in self._analyze(text):
+                column = vocabulary.get(term)
+                if column is not None:
+                    counts[column] = counts.get(column, 0) + 1
+            for column in sorted(counts):
+                indices.append(column)
+                values.append(counts[column])
+            indptr.append(len(indices))
+        dtype = self.dtype if self.dtype in (np.float32, np.float64) else np.float64
+        matrix = sp.csr_matrix(
+            (
+                np.asarray(values, dtype=dtype),
+                np.asarray(indices, dtype=np.int32),
+                np.asarray(indptr, dtype=np.int32),
+            ),
+            shape=(len(indptr) - 1, len(vocabulary)),
+        )
+        if self.params["binary"]:
+            matrix.data.fill(1)
+        if self.params["sublinear_tf"]:
+            np.log(matrix.data, matrix.data)
+            matrix.data += 1
+        if self.idf_ is not None:
+            matrix.data *= self.idf_[matrix.indices]
+        normalize_rows(matrix, self.params["norm"])
+        return matrix
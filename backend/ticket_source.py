@@ -0,0 +1,161 @@
+"""
+Ticket Sources
+Streaming readers for the ticket exports the knowledge base is built from.
+.xlsx (openpyxl read-only mode), .csv (pandas chunks) and .parquet (pyarrow
+record batches) are read chunk_rows rows at a time and yielded as columns of
+the canonical ticket fields, so a multi-million-row history never has to sit
+in memory as one DataFrame and no per-row Series is ever built.
+"""
+import os
+import itertools
+from typing import Callable, Dict, Iterator, List, Tuple
+CHUNK_ROWS = 50_000
+TICKET_FIELDS = ("ticket_id", "category", "description", "resolution", "priority", "status")
+REQUIRED_FIELDS = ("category", "description", "resolution")
+FIELD_DEFAULTS = {"priority": "Medium", "status": "Resolved"}
+# Accepted headers per field, after normalize_header()
+COLUMN_CANDIDATES = {
+    "category": ["category", "categories", "type", "issue_type", "ticket_category"],
+    "description": [
+        "description",
+        "ticket_description",
+        "issue",
+        "issue_description",
+        "problem",
+        "summary",
+        "details",
+        "text",
+    ],
+    "resolution": [
+        "resolution",
+        "solution",
+        "fix",
+        "steps",
+        "resolution_notes",
+        "answer",
+        "workaround",
+    ],
+    "ticket_id": ["ticket_id", "id", "ticketid", "case_id", "incident_id"],
+    "priority": ["priority", "severity", "prio"],
+    "status": ["status", "state"],
+}
+SUPPORTED_EXTENSIONS = (".xlsx", ".xlsm", ".csv", ".parquet")
+# A source is (headers, read) where read(indices) yields chunks as one list of
+# raw values per requested header index
+Source = Tuple[List[str], Callable[[List[int]], Iterator[List[list]]]]
+def normalize_header(name) -> str:
+    return str(name if name is not None else "").strip().lower().replace(" ", "_")
+def detect_columns(headers: List[str]) -> Dict[str, int]:
+    """
+    Map ticket fields to header positions from a variety of common headers.
+    Raises ValueError if any required column is missing.
+    """
+    positions = {}
+    for i, header in enumerate(headers):
+        positions.setdefault(normalize_header(header), i)
+    mapping = {}
+    missing = []
+    for field in TICKET_FIELDS:
+        found = next((c for c in COLUMN_CANDIDATES[field] if c in positions), None)
+        if found is not None:
+            mapping[field] = positions[found]
+        elif field in REQUIRED_FIELDS:
+            missing.append(field)
+    if missing:
+        raise ValueError(
+            f"Missing required columns: {', '.join(missing)}. "
+            f"Available columns: {[normalize_header(h) for h in headers]}"
+        )
+    return mapping
+def _xlsx_source(path: str, chunk_rows: int) -> Source:
+    import openpyxl
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    headers = list(next(rows, ()))
+    def read(indices):
+        try:
+            while True:
+                batch = list(itertools.islice(rows, chunk_rows))
+                if not batch:
+                    return
+                # Read-only sheets can report formatted but empty trailing rows
+                batch = [row for row in batch if any(v is not None for v in row)]
+                if batch:
+                    yield [[row[i] if i < len(row) else None for row in batch] for i in indices]
+        finally:
+            workbook.close()
+    return headers, read
+def _csv_source(path: str, chunk_rows: int) -> Source:
+    import pandas as pd
+    headers = list(pd.read_csv(path, nrows=0).columns)
+    def read(indices):
+        chunks = pd.read_csv(
+            path,
+            usecols=indices,
+            dtype=str,
+            keep_default_na=False,
+            chunksize=chunk_rows,
+        )
+        for df in chunks:
+            yield [df[headers[i]].tolist() for i in indices]
+    return headers, read
+def _parquet_source(path: str, chunk_rows: int) -> Source:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError("Reading Parquet tickets needs pyarrow: pip install pyarrow")
+    parquet_file = pq.ParquetFile(path)
+    headers = list(parquet_file.schema_arrow.names)
+    def read(indices):
+        columns = [headers[i] for i in indices]
+        for batch in parquet_file.iter_batches(batch_size=chunk_rows, columns=columns):
+            yield [batch.column(k).to_pylist() for k in range(len(columns))]
+    return headers, read
+def _open_source(path: str, chunk_rows: int) -> Source:
+    ext = os.path.splitext(path)[1].lower()
+    if ext in (".xlsx", ".xlsm"):
+        return _xlsx_source(path, chunk_rows)
+    if ext == ".csv":
+        return _csv_source(path, chunk_rows)
+    if ext == ".parquet":
+        return _parquet_source(path, chunk_rows)
+    raise ValueError(
+        f"Unsupported ticket file type '{ext}' (expected one of {', '.join(SUPPORTED_EXTENSIONS)})"
+    )
+def _to_text(values: list, default: str) -> List[str]:
+    """str() of each value; missing and blank cells become default."""
+    return [
+        default if value is None or (isinstance(value, str) and not value.strip()) else str(value)
+        for value in values
+    ]
+def read_ticket_chunks(path: str, chunk_rows: int = CHUNK_ROWS) -> Iterator[Dict[str, List[str]]]:
+    """
+    Stream tickets from an .xlsx, .csv or .parquet file.
+    Columns are detected up front, so a missing file or required column raises
+    here rather than part-way through a build. The returned iterator yields
+    {field: values} for every field in TICKET_FIELDS, at most chunk_rows values
+    each; tickets without an ID are numbered T-1, T-2, ... by row.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Tickets file not found: {path}")
+    headers, read = _open_source(path, chunk_rows)
+    mapping = detect_columns(headers)
+    return _ticket_chunks(read, mapping)
+def _ticket_chunks(read, mapping: Dict[str, int]) -> Iterator[Dict[str, List[str]]]:
+    fields = list(mapping)
+    first_row = 1
+    for columns in read([mapping[field] for field in fields]):
+        raw = dict(zip(fields, columns))
+        n = len(columns[0])
+        chunk = {}
+        for field in TICKET_FIELDS:
+            default = FIELD_DEFAULTS.get(field, "")
+            chunk[field] = _to_text(raw[field], default) if field in raw else [default] * n
+        if "ticket_id" in raw:
+            chunk["ticket_id"] = [
+                ticket_id or f"T-{first_row + i}" for i, ticket_id in enumerate(chunk["ticket_id"])
+            ]
+        else:
+            chunk["ticket_id"] = [f"T-{i}" for i in range(first_row, first_row + n)]
+        first_row += n
+        yield chunk
@@ -0,0 +1,259 @@
+"""
+Ticket Store
+Columnar storage for knowledge base tickets. Low-cardinality fields
+(category, priority, status) are int32 codes into a label table; free text
+(ticket IDs, descriptions, resolutions) lives in one UTF-8 buffer per field
+indexed by an offsets array. Per-ticket dicts are only built on access.
+"""
+import hashlib
+import functools
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import numpy as np
+CATEGORICAL_FIELDS = ("category", "priority", "status")
+def encode_text(values: Iterable[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """Concatenate UTF-8 strings into a uint8 buffer with int64 offsets (n + 1 entries)."""
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+def encode_categorical(values: Iterable[str]) -> Tuple[np.ndarray, List[str]]:
+    """int32 codes plus labels in order of first appearance."""
+    lookup = {}
+    codes = np.fromiter(
+        (lookup.setdefault(value, len(lookup)) for value in values), dtype=np.int32
+    )
+    return codes, list(lookup)
+@functools.lru_cache(maxsize=65536)
+def _token_id(token: str) -> int:
+    digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+def hash_tokens(tokens: Iterable[str]) -> np.ndarray:
+    """Sorted, de-duplicated 64-bit blake2b IDs of tokens (stable across processes)."""
+    return np.array(sorted({_token_id(token) for token in tokens}), dtype=np.uint64)
+class KeywordIndex:
+    """
+    Per-ticket keyword sets for the keyword boost, as hashed token IDs.
+    A ticket's set is the unique tokens of f"{description} {resolution}".lower().split(),
+    stored as a sorted run in token_ids delimited by offsets.
+    """
+    def __init__(self, token_ids: np.ndarray, offsets: np.ndarray):
+        # Plain ndarray views: indexing np.memmap subclasses is much slower
+        self.token_ids = np.asarray(token_ids)
+        self.offsets = np.asarray(offsets)
+    @classmethod
+    def from_texts(cls, texts: Iterable[str]) -> "KeywordIndex":
+        runs = []
+        memo = {}
+        for text in texts:
+            ids = set()
+            for token in text.lower().split():
+                token_id = memo.get(token)
+                if token_id is None:
+                    token_id = memo[token] = _token_id(token)
+                ids.add(token_id)
+            runs.append(np.array(sorted(ids), dtype=np.uint64))
+        offsets = np.zeros(len(runs) + 1, dtype=np.int64)
+        np.cumsum([len(run) for run in runs], out=offsets[1:])
+        token_ids = np.concatenate(runs) if runs else np.empty(0, dtype=np.uint64)
+        return cls(token_ids, offsets)
+    @classmethod
+    def concat(cls, indexes: List["KeywordIndex"]) -> "KeywordIndex":
+        offsets = [np.zeros(1, dtype=np.int64)]
+        base = 0
+        for index in indexes:
+            offsets.append(index.offsets[1:] + base)
+            base += int(index.offsets[-1])
+        return cls(
+            np.concatenate([index.token_ids for index in indexes]), np.concatenate(offsets)
+        )
+    def overlap_counts(self, rows: np.ndarray, query_ids: np.ndarray) -> np.ndarray:
+        """Number of query tokens in each row's keyword set, for all rows at once."""
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        if len(rows) == 0 or len(query_ids) == 0:
+            return np.zeros(len(rows), dtype=np.int64)
+        # Gather every candidate's run into one flat array
+        run_starts = np.cumsum(lengths) - lengths
+        positions = np.arange(lengths.sum()) + np.repeat(starts - run_starts, lengths)
+        # query_ids is sorted, so membership is a binary search
+        tokens = self.token_ids[positions]
+        found = np.searchsorted(query_ids, tokens)
+        hits = query_ids[np.minimum(found, len(query_ids) - 1)] == tokens
+        cumulative = np.concatenate(([0], np.cumsum(hits)))
+        return cumulative[run_starts + lengths] - cumulative[run_starts]
+class TicketStore:
+    """
+    Read-only, columnar ticket table.
+    Indexing returns a fresh dict, so callers may annotate it (e.g. with a
+    similarity score) without copying. Use get() to read one field of a
+    ticket without materialising the dict.
+    """
+    def __init__(
+        self,
+        fields: List[str],
+        size: int,
+        text_columns: Dict[str, Tuple[np.ndarray, np.ndarray]],
+        categorical_columns: Dict[str, Tuple[np.ndarray, List[str]]],
+    ):
+        self.fields = list(fields)
+        self.size = size
+        self.text_columns = text_columns
+        self.categorical_columns = categorical_columns
+        self.keywords = None
+        self.partitions = {}  # field -> (rows ordered by code, offsets per code)
+        self._derived_codes = {}
+        # Per-item reads go through plain views (still sharing the mapped
+        # pages): indexing np.memmap subclasses is several times slower
+        self._text = {
+            field: (memoryview(np.asarray(buffer)), np.asarray(offsets))
+            for field, (buffer, offsets) in text_columns.items()
+        }
+        self._categorical = {
+            field: (np.asarray(codes), labels)
+            for field, (codes, labels) in categorical_columns.items()
+        }
+    @classmethod
+    def from_dicts(
+        cls, tickets: List[Dict], categorical_fields: Tuple[str, ...] = CATEGORICAL_FIELDS
+    ) -> "TicketStore":
+        """Build a store from ticket dicts; every value is stored as str."""
+        if isinstance(tickets, TicketStore):
+            return tickets
+        fields = list(tickets[0].keys()) if tickets else []
+        return cls.from_columns(
+            {field: [str(t.get(field, "")) for t in tickets] for field in fields},
+            categorical_fields,
+        )
+    @classmethod
+    def from_columns(
+        cls,
+        columns: Dict[str, List[str]],
+        categorical_fields: Tuple[str, ...] = CATEGORICAL_FIELDS,
+    ) -> "TicketStore":
+        """Build a store from equal-length lists of str values per field."""
+        fields = list(columns)
+        text_columns = {}
+        categorical_columns = {}
+        for field, values in columns.items():
+            if field in categorical_fields:
+                categorical_columns[field] = encode_categorical(values)
+            else:
+                text_columns[field] = encode_text(values)
+        size = len(columns[fields[0]]) if fields else 0
+        return cls(fields, size, text_columns, categorical_columns)
+    @classmethod
+    def concat(cls, stores: List["TicketStore"]) -> "TicketStore":
+        """Stack stores with the same fields; category labels are merged, not re-encoded."""
+        fields = stores[0].fields
+        text_columns = {}
+        categorical_columns = {}
+        for field in fields:
+            if field in stores[0].categorical_columns:
+                lookup = {}
+                parts = []
+                for store in stores:
+                    codes, labels = store.codes(field)
+                    remap = np.array(
+                        [lookup.setdefault(label, len(lookup)) for label in labels],
+                        dtype=np.int32,
+                    )
+                    parts.append(remap[codes])
+                categorical_columns[field] = (np.concatenate(parts), list(lookup))
+            else:
+                buffers = []
+                offsets = [np.zeros(1, dtype=np.int64)]
+                base = 0
+                for store in stores:
+                    if field in store.text_columns:
+                        buffer, store_offsets = store.text_columns[field]
+                    else:
+                        buffer, store_offsets = encode_text(
+                            store.get(i, field, "") for i in range(len(store))
+                        )
+                    buffers.append(np.asarray(buffer))
+                    offsets.append(np.asarray(store_offsets[1:]) + base)
+                    base += int(store_offsets[-1])
+                text_columns[field] = (np.concatenate(buffers), np.concatenate(offsets))
+        store = cls(fields, sum(len(s) for s in stores), text_columns, categorical_columns)
+        if all(s.keywords is not None for s in stores):
+            store.keywords = KeywordIndex.concat([s.keywords for s in stores])
+        return store
+    def __len__(self) -> int:
+        return self.size
+    def __getitem__(self, idx: int) -> Dict:
+        idx = int(idx)
+        if idx < 0:
+            idx += self.size
+        if not 0 <= idx < self.size:
+            raise IndexError(f"ticket index {idx} out of range")
+        return {field: self._value(field, idx) for field in self.fields}
+    def __iter__(self) -> Iterator[Dict]:
+        for idx in range(self.size):
+            yield self[idx]
+    def get(self, idx: int, field: str, default: Optional[str] = None) -> Optional[str]:
+        """Single field of one ticket."""
+        if field not in self.text_columns and field not in self.categorical_columns:
+            return default
+        return self._value(field, int(idx))
+    def _value(self, field: str, idx: int) -> str:
+        column = self._categorical.get(field)
+        if column is not None:
+            codes, labels = column
+            return labels[codes[idx]]
+        buffer, offsets = self._text[field]
+        start, end = offsets[idx : idx + 2].tolist()
+        return str(buffer[start:end], "utf-8")
+    def codes(self, field: str) -> Tuple[np.ndarray, List[str]]:
+        """(codes, labels) for a field; text fields are encoded on first use."""
+        column = self._categorical.get(field)
+        if column is not None:
+            return column
+        if field not in self._derived_codes:
+            self._derived_codes[field] = encode_categorical(
+                self._value(field, idx) for idx in range(self.size)
+            )
+        return self._derived_codes[field]
+    def matching_codes(self, field: str, value: str) -> List[int]:
+        """Codes of the labels of a field equal to value, ignoring case."""
+        if field not in self.fields:
+            return []
+        value = value.lower()
+        return [code for code, label in enumerate(self.codes(field)[1]) if label.lower() == value]
+    def matches(self, rows: np.ndarray, field: str, value: str) -> np.ndarray:
+        """Boolean mask of rows whose field equals value, ignoring case."""
+        matching = self.matching_codes(field, value)
+        if not matching:
+            return np.zeros(len(rows), dtype=bool)
+        codes = self.codes(field)[0]
+        if len(matching) == 1:
+            return codes[rows] == matching[0]
+        return np.isin(codes[rows], matching)
+    def partition(self, field: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        (rows, offsets): row indices grouped by code, ascending within a code;
+        code c owns rows[offsets[c]:offsets[c + 1]].
+        """
+        if field not in self.partitions:
+            codes, labels = self.codes(field)
+            rows = np.argsort(codes, kind="stable").astype(np.int64)
+            offsets = np.searchsorted(codes[rows], np.arange(len(labels) + 1)).astype(np.int64)
+            self.partitions[field] = (rows, offsets)
+        return self.partitions[field]
+    def keyword_index(self) -> KeywordIndex:
+        """Keyword sets for the keyword boost, built on first use unless loaded."""
+        if self.keywords is None:
+            self.keywords = KeywordIndex.from_texts(
+                f"{self.get(idx, 'description', '')} {self.get(idx, 'resolution', '')}"
+                for idx in range(self.size)
+            )
+        return self.keywords
+    def value_counts(self, field: str) -> Dict[str, int]:
+        """Ticket count per value of a field, in order of first appearance."""
+        codes, labels = self.codes(field)
+        counts = np.bincount(codes, minlength=len(labels))
+        return {label: int(count) for label, count in zip(labels, counts)}
+    def nbytes(self) -> int:
+        """Bytes held by the column arrays (labels excluded)."""
+        total = sum(b.nbytes + o.nbytes for b, o in self.text_columns.values())
+        return total + sum(c.nbytes for c, _ in self.categorical_columns.values())
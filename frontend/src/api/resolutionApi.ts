@@ -120,9 +120,10 @@ export async function getRAGStats(): Promise<{
  * Reload the knowledge base (admin function)
  */
 export async function reloadKnowledgeBase(): Promise<{
+  job_id: string;
   status: string;
   message: string;
-  total_tickets: number;
+  status_url: string;
 }> {
   try {
     const endpoint = `${API_CONFIG.RAG_SERVICE_URL}${API_CONFIG.ENDPOINTS.RAG_RELOAD}`;